@@ -1,12 +1,30 @@
 from django import forms
-from django.core.exceptions import ValidationError
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.core.validators import RegexValidator
 from django.contrib import admin, messages
-from django.urls import path
-from django.http import JsonResponse
+from django.urls import NoReverseMatch, path, reverse
+from django.contrib.admin.views.main import SEARCH_VAR
+from django.http import JsonResponse, FileResponse, Http404, HttpResponse, HttpResponseNotAllowed, StreamingHttpResponse
 from django.forms.models import BaseInlineFormSet
-from django.db.models import Sum
+from django.db.models import Prefetch, Q, Sum
+import csv
+import os
 from datetime import date
-from .models import Proveedores, SolicitudesDePago, ConceptoNormal, ConceptoSalario, OperacionesEmitidas, Ingreso, ServicioBancario, AjusteInversiones
+from urllib.parse import urlencode
+from .models import Proveedores, SolicitudesDePago, ConceptoNormal, ConceptoSalario, OperacionesEmitidas, Ingreso, ServicioBancario, AjusteInversiones, Tarea, TokenAPI
+from .models import EjercicioCerrado, RegistroAuditoria, SolicitudArchivada, OperacionArchivada, IngresoArchivado, ServicioBancarioArchivado, AjusteInversionesArchivado
+from .tareas import encolar
+from .servicios import ErroresLote, emitir_solicitudes, sincronizar_datos_proveedores
+from .banco import FORMATOS, ErrorLote, exportables, lineas_lote, reservar_lote
+from . import busqueda
+from .analisis import TOP_POR_DEFECTO, analisis, invalidar_meses
+from .archivo import archivo_disponible, ejercicio_cerrado
+from .auditoria import HistorialAuditoriaMixin
+from .cache_etiquetas import cacheado, etiqueta, invalidar
+from .conceptos import calcular_importe, validar_conceptos_normales, validar_conceptos_salario, validar_tablas_conceptos
+from .listados import ListadoOptimizadoMixin, años_cacheados, formato_importe
+from .respuestas import respuesta_condicional
+from django.utils import timezone
 from django.utils.html import format_html
 from django.shortcuts import render, redirect, get_object_or_404
 
@@ -18,13 +36,13 @@ class SolicitudesDePagoForm(forms.ModelForm):
             "fecha_del_modelo": "La fecha no puede ser futura. Solo se permiten fechas de hoy o anteriores."
         }
         widgets = {
+            # "max" y "value" se ponen en __init__: aquí date.today() quedaría
+            # fijado al día en que arrancó el proceso.
             "fecha_del_modelo": forms.DateInput(
                 format="%Y-%m-%d",
                 attrs={
                     "type": "date",
                     "class": "vDateField",
-                    "max": date.today().strftime("%Y-%m-%d"),
-                    "value": date.today().strftime("%Y-%m-%d"),
                 }
             ),
             "descripcion": forms.Textarea(
@@ -38,6 +56,9 @@ class SolicitudesDePagoForm(forms.ModelForm):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        if 'fecha_del_modelo' in self.fields:
+            hoy = date.today().strftime("%Y-%m-%d")
+            self.fields['fecha_del_modelo'].widget.attrs.update({"max": hoy, "value": hoy})
         instance = kwargs.get('instance')
         if not instance or not instance.pk:
             self.fields['estado'].choices = [("Activo", "Activo")]
@@ -56,8 +77,8 @@ class AñoFilter(admin.SimpleListFilter):
     parameter_name = 'año'
 
     def lookups(self, request, model_admin):
-        años = SolicitudesDePago.objects.dates('fecha_del_modelo', 'year')
-        return [(a.year, a.year) for a in años]
+        años = años_cacheados(model_admin.model.objects.all(), 'fecha_del_modelo')
+        return [(a, a) for a in años]
 
     def queryset(self, request, queryset):
         if self.value():
@@ -90,8 +111,8 @@ class AñoFilterOE(admin.SimpleListFilter):
     parameter_name = 'año'
 
     def lookups(self, request, model_admin):
-        años = OperacionesEmitidas.objects.dates('fecha_inicial', 'year')
-        return [(a.year, a.year) for a in años]
+        años = años_cacheados(model_admin.model.objects.all(), 'fecha_inicial')
+        return [(a, a) for a in años]
 
     def queryset(self, request, queryset):
         if self.value():
@@ -140,8 +161,109 @@ class TipoOperacionFilter(admin.SimpleListFilter):
         return queryset
 
 
+class LoteBancoFilter(admin.SimpleListFilter):
+    title = 'Lote Bancario'
+    parameter_name = 'lote_banco'
+
+    def lookups(self, request, model_admin):
+        return [
+            ("Pendientes", "Transferencias por exportar"),
+            ("Exportadas", "Exportadas"),
+        ]
+
+    def queryset(self, request, queryset):
+        if self.value() == "Pendientes":
+            return queryset.filter(pk__in=exportables().values("pk"))
+        if self.value() == "Exportadas":
+            return queryset.filter(lote_banco__isnull=False)
+        return queryset
+
+
+class FilaExistenteField(forms.ModelChoiceField):
+    """Id de una fila del formset, resuelto con las filas que el formset ya cargó.
+
+    ``ModelChoiceField`` haría una consulta por fila para validar el id.
+    """
+
+    def __init__(self, formset, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.formset = formset
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            obj = self.formset._existing_object(self.formset.model._meta.pk.to_python(value))
+        except ValidationError:
+            obj = None
+        if obj is None:
+            raise ValidationError(self.error_messages["invalid_choice"], code="invalid_choice")
+        return obj
+
+
+class ConceptosEnLoteFormset(BaseInlineFormSet):
+    """Guarda las filas del inline con consultas por conjuntos.
+
+    Las nuevas se insertan con ``bulk_create``, las modificadas con
+    ``bulk_update`` y las marcadas para borrar con un solo ``DELETE ... IN``.
+    Los conceptos no tienen ``save()`` propio ni se auditan, así que no se
+    pierde nada al no guardarlos uno a uno; la caché se invalida a mano.
+    """
+
+    guardar_en_lote = True
+
+    def add_fields(self, form, index):
+        super().add_fields(form, index)
+        campo = form.fields[self._pk_field.name]
+        form.fields[self._pk_field.name] = FilaExistenteField(
+            self, campo.queryset, initial=campo.initial, required=False, widget=campo.widget,
+        )
+
+    def conceptos(self):
+        """Pares ``(concepto, importe)`` de las filas que quedan tras guardar."""
+        return [
+            (form.cleaned_data["concepto"], form.cleaned_data["importe"])
+            for form in self.forms
+            if form.cleaned_data and not form.cleaned_data.get("DELETE", False)
+        ]
+
+    def save(self, commit=True):
+        if not commit or not self.guardar_en_lote:
+            return super().save(commit=commit)
+
+        self.new_objects, self.changed_objects, self.deleted_objects = [], [], []
+        for form in self.initial_forms:
+            obj = form.instance
+            if obj.pk is None:
+                continue
+            if self.can_delete and self._should_delete_form(form):
+                self.deleted_objects.append(obj)
+            elif form.has_changed():
+                self.changed_objects.append((obj, form.changed_data))
+        for form in self.extra_forms:
+            if not form.has_changed() or (self.can_delete and self._should_delete_form(form)):
+                continue
+            setattr(form.instance, self.fk.name, self.instance)
+            self.new_objects.append(form.instance)
+
+        if self.deleted_objects:
+            self.model._base_manager.filter(pk__in=[obj.pk for obj in self.deleted_objects]).delete()
+        if self.changed_objects:
+            campos = {campo for _, cambiados in self.changed_objects for campo in cambiados}
+            self.model._base_manager.bulk_update(
+                [obj for obj, _ in self.changed_objects],
+                [f.name for f in self.model._meta.concrete_fields if f.name in campos],
+            )
+        if self.new_objects:
+            self.model._base_manager.bulk_create(self.new_objects)
+        if self.deleted_objects or self.changed_objects or self.new_objects:
+            invalidar(self.model)
+            invalidar_meses([self.instance.fecha_del_modelo])
+        return self.new_objects + [obj for obj, _ in self.changed_objects]
+
+
 # Inlines para Conceptos Normales
-class ConceptoNormalInlineFormset(BaseInlineFormSet):
+class ConceptoNormalInlineFormset(ConceptosEnLoteFormset):
     def clean(self):
         super().clean()
         self.has_normales = False
@@ -151,9 +273,7 @@ class ConceptoNormalInlineFormset(BaseInlineFormSet):
         ]
         if valid_forms:
             self.has_normales = True
-            conceptos = [form.cleaned_data.get("concepto") for form in valid_forms]
-            if len(set(conceptos)) > 1:
-                raise ValidationError("En conceptos normales, todos deben ser iguales.")
+            validar_conceptos_normales([form.cleaned_data.get("concepto") for form in valid_forms])
 
 
 class ConceptoNormalInline(admin.TabularInline):
@@ -164,7 +284,7 @@ class ConceptoNormalInline(admin.TabularInline):
 
 
 # Inlines para Conceptos Salario
-class ConceptoSalarioInlineFormset(BaseInlineFormSet):
+class ConceptoSalarioInlineFormset(ConceptosEnLoteFormset):
     def clean(self):
         super().clean()
         self.has_salarios = False
@@ -174,11 +294,10 @@ class ConceptoSalarioInlineFormset(BaseInlineFormSet):
         ]
         if valid_forms:
             self.has_salarios = True
-            for form in valid_forms:
-                if form.cleaned_data.get("numero"):
-                    raise ValidationError("En conceptos de salario, el campo Número debe quedar vacío.")
-            if self.instance.forma_de_pago != "Cheque":
-                raise ValidationError("Cuando se registran conceptos de salario, la forma de pago debe ser Cheque.")
+            validar_conceptos_salario(
+                [form.cleaned_data.get("numero") for form in valid_forms],
+                self.instance.forma_de_pago,
+            )
 
 
 class ConceptoSalarioInline(admin.TabularInline):
@@ -189,7 +308,7 @@ class ConceptoSalarioInline(admin.TabularInline):
 
 
 @admin.register(Proveedores)
-class ProveedoresAdmin(admin.ModelAdmin):
+class ProveedoresAdmin(HistorialAuditoriaMixin, ListadoOptimizadoMixin, admin.ModelAdmin):
     list_display = (
         'codigo',
         'mostrar_beneficiario',
@@ -199,6 +318,14 @@ class ProveedoresAdmin(admin.ModelAdmin):
     )
     search_fields = ('codigo', 'ident_del_prov', 'tit_de_la_cuenta', 'cuenta_banc')
     list_display_links = list(list_display).copy()
+    keyset_ordering = ("-pk",)
+    list_only = ('codigo', 'ident_del_prov', 'tit_de_la_cuenta', 'cuenta_banc', 'direccion')
+    actions = ["sincronizar_solicitudes"]
+
+    @admin.action(description="Actualizar sus datos en las solicitudes activas")
+    def sincronizar_solicitudes(self, request, queryset):
+        actualizadas = sincronizar_datos_proveedores(queryset.values_list("pk", flat=True))
+        messages.success(request, f"Se actualizaron los datos del proveedor en {actualizadas} solicitudes activas.")
 
     def mostrar_beneficiario(self, obj):
         return obj.ident_del_prov
@@ -206,14 +333,127 @@ class ProveedoresAdmin(admin.ModelAdmin):
     mostrar_beneficiario.short_description = "Beneficiario:"
     mostrar_beneficiario.admin_order_field = "ident_del_prov"
 
-    def change_view(self, request, object_id, form_url='', extra_context=None):
-        extra_context = extra_context or {}
-        extra_context['show_history'] = False
-        return super().change_view(request, object_id, form_url, extra_context=extra_context)
+    def get_urls(self):
+        urls = super().get_urls()
+        custom_urls = [
+            path("analisis/", self.admin_site.admin_view(self.analisis_gasto), name="proveedores_analisis"),
+        ]
+        return custom_urls + urls
+
+    def analisis_gasto(self, request):
+        if not request.user.has_perm("apps.view_solicitudesdepago"):
+            raise PermissionDenied
+        form = AnalisisForm({"año": date.today().year, "top": TOP_POR_DEFECTO, **request.GET.dict()})
+        if not form.is_valid():
+            form = AnalisisForm({"año": date.today().year, "top": TOP_POR_DEFECTO})
+            form.is_valid()
+        filtros = form.cleaned_data
+        año, cuenta, proveedor = filtros["año"], filtros["cuenta"] or None, filtros["proveedor"]
+        exportar = request.GET.get("exportar")
+        resumen = analisis(año, cuenta, proveedor, top=None if exportar else filtros["top"])
+        if exportar in ("proveedores", "meses", "conceptos"):
+            return _csv_analisis(resumen, exportar)
+
+        # Las solicitudes de un ejercicio cerrado se pasaron al archivo
+        if ejercicio_cerrado(año) and archivo_disponible():
+            listado = reverse("admin:apps_solicitudarchivada_changelist")
+        else:
+            listado = reverse("admin:apps_solicitudesdepago_changelist")
+        base = {"año": año, "estado__in": "Activo,Emitido"}
+        if cuenta:
+            base["cuenta_de_empresa__exact"] = cuenta
+        if proveedor:
+            base["identificador_del_proveedor"] = proveedor
+        for fila in resumen["proveedores"]:
+            enlace = {"identificador_del_proveedor": fila["id"]} if fila["id"] else {"identificador_del_proveedor__isnull": "True"}
+            fila["url_listado"] = f"{listado}?{urlencode({**base, **enlace})}"
+            fila["url_analisis"] = f"?{urlencode({**request.GET.dict(), 'proveedor': fila['id']})}" if fila["id"] else ""
+            fila["columnas"] = [fila["por_cuenta"].get(c, 0) for c in resumen["cuentas"]]
+        for fila in resumen["meses"]:
+            fila["nombre"] = MESES[fila["mes"] - 1]
+            fila["url_listado"] = f"{listado}?{urlencode({**base, 'mes': fila['mes']})}"
+            fila["columnas"] = [fila["por_cuenta"].get(c, 0) for c in resumen["cuentas"]]
+
+        consulta = request.GET.dict()
+        return render(request, "admin/apps/proveedores/analisis.html", {
+            **self.admin_site.each_context(request),
+            "title": "Análisis de gasto por proveedor",
+            "opts": self.model._meta,
+            "form": form,
+            "resumen": resumen,
+            "proveedor": Proveedores.objects.filter(pk=proveedor).first() if proveedor else None,
+            "sin_proveedor": f"?{urlencode({k: v for k, v in consulta.items() if k != 'proveedor'})}",
+            "exportar": {
+                nombre: f"?{urlencode({**consulta, 'exportar': nombre})}" for nombre in ("proveedores", "meses", "conceptos")
+            },
+        })
+
+
+MESES = (
+    "Enero", "Febrero", "Marzo", "Abril", "Mayo", "Junio",
+    "Julio", "Agosto", "Septiembre", "Octubre", "Noviembre", "Diciembre",
+)
+
+
+class AnalisisForm(forms.Form):
+    año = forms.IntegerField(min_value=2000, max_value=2100)
+    cuenta = forms.ChoiceField(
+        required=False,
+        choices=[("", "Todas")] + list(SolicitudesDePago._meta.get_field("cuenta_de_empresa").choices),
+    )
+    proveedor = forms.IntegerField(required=False, widget=forms.HiddenInput)
+    top = forms.IntegerField(label="Proveedores", min_value=1, max_value=100)
+
+
+def _csv_analisis(resumen, tabla):
+    respuesta = HttpResponse(content_type="text/csv; charset=utf-8")
+    respuesta["Content-Disposition"] = f'attachment; filename="analisis_{tabla}_{resumen["año"]}.csv"'
+    # Con BOM y punto y coma, Excel en español lo abre directamente
+    respuesta.write("\ufeff")
+    escritor = csv.writer(respuesta, delimiter=";")
+    cuentas = resumen["cuentas"]
+    if tabla == "proveedores":
+        escritor.writerow(["Proveedor", *cuentas, "Total", "Solicitudes"])
+        for fila in resumen["proveedores"]:
+            escritor.writerow([fila["nombre"], *(fila["por_cuenta"].get(c, 0) for c in cuentas), fila["total"], fila["cantidad"]])
+    elif tabla == "meses":
+        escritor.writerow(["Mes", *cuentas, "Total"])
+        for fila in resumen["meses"]:
+            escritor.writerow([MESES[fila["mes"] - 1], *(fila["por_cuenta"].get(c, 0) for c in cuentas), fila["total"]])
+    else:
+        escritor.writerow(["Tipo", "Concepto", "Importe", "Porcentaje"])
+        for fila in resumen["conceptos"]:
+            escritor.writerow([fila["tipo"], fila["concepto"], fila["total"], f"{fila['porcentaje']:.2f}"])
+    return respuesta
+
+
+class EmisionLoteForm(forms.Form):
+    numero_serie = forms.CharField(
+        label="Número de serie inicial",
+        min_length=7, max_length=7,
+        validators=[RegexValidator(r"^\d{7}$", "Debe contener exactamente 7 dígitos numéricos.")],
+        help_text="Cada solicitud recibe el siguiente número, en orden de forma de pago, cuenta y H90.",
+    )
+    fecha_inicial = forms.DateField(widget=forms.DateInput(attrs={"type": "date"}, format="%Y-%m-%d"))
+
+    def clean_fecha_inicial(self):
+        fecha = self.cleaned_data["fecha_inicial"]
+        if fecha > date.today():
+            raise ValidationError("La fecha inicial no puede ser futura.")
+        return fecha
+
+
+def _mensaje_errores_emision(error, solicitudes):
+    h90 = {s.pk: s.numero_de_H90 for s in solicitudes}
+    partes = []
+    for pk, campos in error.errores.items():
+        mensajes = "; ".join(m for lista in campos.values() for m in lista)
+        partes.append(f"H90 N° {h90[pk]}: {mensajes}" if pk in h90 else mensajes)
+    return "No se emitió ninguna solicitud. " + " ".join(partes[:10])
 
 
 @admin.register(SolicitudesDePago)
-class SolicitudesDePagoAdmin(admin.ModelAdmin):
+class SolicitudesDePagoAdmin(HistorialAuditoriaMixin, ListadoOptimizadoMixin, admin.ModelAdmin):
     form = SolicitudesDePagoForm
     inlines = [ConceptoNormalInline, ConceptoSalarioInline]
 
@@ -235,6 +475,32 @@ class SolicitudesDePagoAdmin(admin.ModelAdmin):
     )
 
     list_display_links = list(list_display).copy()
+    # Con el índice de apps.busqueda solo se usan en las bases de archivo
+    search_fields = (
+        'numero_de_H90',
+        'identificador_del_proveedor__ident_del_prov',
+        'nombre_del_proveedor',
+        'codigo_del_proveedor',
+        'cuenta_bancaria',
+        'conceptos_normales__numero',
+        'descripcion',
+    )
+    search_help_text = "H90, proveedor, número de concepto o descripción."
+    keyset_ordering = ("-pk",)
+    list_select_related = ('identificador_del_proveedor',)
+    list_only = (
+        'numero_de_H90',
+        'fecha_del_modelo',
+        'importe_total',
+        'descripcion',
+        'estado',
+        'identificador_del_proveedor',
+        'identificador_del_proveedor__ident_del_prov',
+    )
+    list_prefetch_related = (
+        Prefetch('conceptos_normales', queryset=ConceptoNormal.objects.only('solicitud', 'concepto', 'numero')),
+        Prefetch('conceptos_salarios', queryset=ConceptoSalario.objects.only('solicitud', 'concepto')),
+    )
 
     fields = (
         'numero_de_H90',
@@ -264,6 +530,58 @@ class SolicitudesDePagoAdmin(admin.ModelAdmin):
         "importe_inversiones",
     )
 
+    actions = ["recalcular_importes", "emitir_seleccionadas"]
+
+    def get_search_results(self, request, queryset, search_term):
+        if search_term and busqueda.disponible(queryset.db):
+            return busqueda.filtrar(queryset, search_term), False
+        return super().get_search_results(request, queryset, search_term)
+
+    @admin.action(description="Emitir solicitudes seleccionadas")
+    def emitir_seleccionadas(self, request, queryset):
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+        solicitudes = list(queryset.order_by("forma_de_pago", "cuenta_de_empresa", "numero_de_H90", "pk"))
+        aplicar = "aplicar" in request.POST
+        # Al confirmar, las ya emitidas (formulario enviado dos veces) las omite el servicio
+        no_activas = [s for s in solicitudes if s.estado != "Activo" and not (aplicar and s.estado == "Emitido")]
+        if no_activas:
+            messages.error(request, "Solo se pueden emitir solicitudes activas: "
+                           + ", ".join(f"H90 N° {s.numero_de_H90} ({s.estado})" for s in no_activas[:10]))
+            return None
+
+        form = EmisionLoteForm(request.POST if aplicar else None)
+        if form.is_valid():
+            try:
+                operaciones = emitir_solicitudes(
+                    [s.pk for s in solicitudes], form.cleaned_data["numero_serie"], form.cleaned_data["fecha_inicial"]
+                )
+            except ErroresLote as e:
+                messages.error(request, _mensaje_errores_emision(e, solicitudes))
+                return None
+            if operaciones:
+                messages.success(request, f"Se emitieron {len(operaciones)} solicitudes (series "
+                                          f"{operaciones[0].numero_serie} a {operaciones[-1].numero_serie}).")
+            else:
+                messages.warning(request, "Las solicitudes seleccionadas ya estaban emitidas.")
+            return None
+
+        return render(request, "admin/apps/solicitudesdepago/emitir_lote.html", {
+            **self.admin_site.each_context(request),
+            "title": "Emitir solicitudes",
+            "opts": self.model._meta,
+            "form": form,
+            "solicitudes": solicitudes,
+            "total": sum(s.importe_total for s in solicitudes),
+            "action_checkbox_name": admin.helpers.ACTION_CHECKBOX_NAME,
+        })
+
+    @admin.action(description="Recalcular importes (en segundo plano)")
+    def recalcular_importes(self, request, queryset):
+        ids = list(queryset.values_list("pk", flat=True))
+        tarea = encolar("recalcular_importes", usuario=request.user, ids=ids)
+        messages.info(request, f"Se encoló la tarea #{tarea.pk} para recalcular {len(ids)} solicitudes.")
+
     def mostrar_estado(self, obj):
         if obj.estado == "Cancelado":
             return format_html('<span style="display:none;">Cancelado</span>Cancelado')
@@ -334,20 +652,20 @@ class SolicitudesDePagoAdmin(admin.ModelAdmin):
         extra_context = extra_context or {}
         response = super().changelist_view(request, extra_context=extra_context)
         try:
-            queryset = response.context_data['cl'].queryset
+            cl = response.context_data['cl']
         except (AttributeError, KeyError):
             return response
-        cantidad_pagos = queryset.count()
-        importe_total = queryset.aggregate(total=Sum('importe_total'))['total'] or 0
-        importe_inversiones = queryset.aggregate(total=Sum('importe_inversiones'))['total'] or 0
-        def formato(valor):
-            if valor is not None:
-                s = f"{float(valor):,.2f}"
-                return s.replace(",", " ").replace(".", ",")
-            return "0,00"
-        extra_context['cantidad_pagos'] = cantidad_pagos
-        extra_context['importe_total_display'] = formato(importe_total)
-        extra_context['importe_inversiones_display'] = formato(importe_inversiones)
+        totales = cl.totales(
+            importe_total=Sum('importe_total'),
+            importe_inversiones=Sum('importe_inversiones'),
+        )
+        extra_context['cantidad_pagos'] = totales['cantidad']
+        extra_context['importe_total_display'] = formato_importe(totales['importe_total'] or 0)
+        extra_context['importe_inversiones_display'] = formato_importe(totales['importe_inversiones'] or 0)
+        año = request.GET.get('año', '')
+        año = int(año) if año.isdecimal() else date.today().year
+        extra_context['registro_h90_año'] = año
+        extra_context['registro_h90_url'] = f"{reverse('admin:solicitudesdepago_registro_h90')}?{urlencode({'año': año})}"
         response.context_data.update(extra_context)
         return response
 
@@ -370,15 +688,15 @@ class SolicitudesDePagoAdmin(admin.ModelAdmin):
     def save_related(self, request, form, formsets, change):
         normales = any(getattr(fs, "has_normales", False) for fs in formsets)
         salarios = any(getattr(fs, "has_salarios", False) for fs in formsets)
-        if normales and salarios:
-            raise ValidationError("No puede dejar llenas ni vacías ambas tablas. Solo una puede contener datos.")
-        if not normales and not salarios:
-            raise ValidationError("No puede dejar llenas ni vacías ambas tablas. Solo una puede contener datos.")
+        validar_tablas_conceptos(normales, salarios)
         super().save_related(request, form, formsets, change)
         obj = form.instance
-        total, mensaje = obj.calcular_importe_total()
-        obj.importe_total = total
-        obj.save(update_fields=["importe_total", "importe_inversiones"])
+        # El total sale de los datos ya validados de los inlines, sin releer los conceptos
+        conceptos = {fs.model: fs.conceptos() for fs in formsets if isinstance(fs, ConceptosEnLoteFormset)}
+        total, mensaje = calcular_importe(conceptos.get(ConceptoNormal, []), conceptos.get(ConceptoSalario, []))
+        if total != obj.importe_total:
+            obj.importe_total = total
+            obj.save(update_fields=["importe_total", "importe_inversiones"])
         if mensaje:
             messages.warning(request, mensaje)
 
@@ -393,9 +711,23 @@ class SolicitudesDePagoAdmin(admin.ModelAdmin):
             path("get-next-h90/", self.admin_site.admin_view(self.get_next_h90), name="solicitudesdepago_get_next_h90"),
             path("get-proveedor/<int:pk>/", self.admin_site.admin_view(self.get_proveedor), name="solicitudesdepago_get_proveedor"),
             path("emitir-h90/<int:pk>/", self.admin_site.admin_view(self.emitir_h90), name="solicitudesdepago_emitir"),
+            path("registro-h90/", self.admin_site.admin_view(self.registro_h90), name="solicitudesdepago_registro_h90"),
         ]
         return custom_urls + urls
 
+    def registro_h90(self, request):
+        if request.method != "POST":
+            return HttpResponseNotAllowed(["POST"])
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        try:
+            año = int(request.GET.get("año") or date.today().year)
+        except ValueError:
+            raise Http404
+        tarea = encolar("registro_h90", usuario=request.user, año=año)
+        messages.info(request, f"Se encoló la tarea #{tarea.pk}: el registro de H90 de {año} se podrá descargar al terminar.")
+        return redirect("admin:apps_tarea_change", tarea.pk)
+
     def emitir_h90(self, request, pk):
         solicitud = get_object_or_404(SolicitudesDePago, pk=pk)
 
@@ -407,21 +739,16 @@ class SolicitudesDePagoAdmin(admin.ModelAdmin):
                 messages.error(request, "Debe completar Número de Serie y Fecha Inicial.")
                 return redirect('admin:apps_solicitudesdepago_change', pk)
 
-            solicitud.estado = "Emitido"
-            solicitud._operacion_creada = True
-            solicitud.save()
-
-            OperacionesEmitidas.objects.create(
-                solicitud=solicitud,
-                fecha_emision=date.today(),
-                numero_operacion=f"H90-{solicitud.numero_de_H90}-{solicitud.forma_de_pago}-{solicitud.cuenta_de_empresa}-{solicitud.fecha_del_modelo.year}",
-                estado="Tránsito",
-                importe_emitido=solicitud.importe_total,
-                numero_serie=numero_serie,
-                fecha_inicial=fecha_inicial,
-            )
+            try:
+                operaciones = emitir_solicitudes([solicitud.pk], numero_serie, fecha_inicial)
+            except ErroresLote as e:
+                messages.error(request, _mensaje_errores_emision(e, [solicitud]))
+                return redirect('admin:solicitudesdepago_emitir', pk=pk)
 
-            messages.success(request, f"H90 N° {solicitud.numero_de_H90} emitido correctamente.")
+            if operaciones:
+                messages.success(request, f"H90 N° {solicitud.numero_de_H90} emitido correctamente.")
+            else:
+                messages.warning(request, f"El H90 N° {solicitud.numero_de_H90} ya estaba emitido.")
             return redirect('admin:apps_solicitudesdepago_changelist')
 
         return render(request, 'admin/apps/solicitudesdepago/emitir_modal.html', {
@@ -437,23 +764,27 @@ class SolicitudesDePagoAdmin(admin.ModelAdmin):
             return JsonResponse({"numero": ""})
         from datetime import datetime
         año = datetime.strptime(fecha, "%Y-%m-%d").year
-        ultimo = SolicitudesDePago.objects.filter(
-            forma_de_pago=forma,
-            cuenta_de_empresa=cuenta,
-            fecha_del_modelo__year=año
-        ).order_by('-numero_de_H90').first()
-        nuevo = ultimo.numero_de_H90 + 1 if ultimo else 1
-        return JsonResponse({"numero": nuevo})
+
+        def numero():
+            return JsonResponse({"numero": SolicitudesDePago.siguiente_numero_h90(forma, cuenta, año)})
+
+        # Incluye los ejercicios archivados (ver siguiente_numero_h90)
+        return respuesta_condicional(request, {etiqueta(SolicitudesDePago), etiqueta(EjercicioCerrado)}, numero)
 
     def get_proveedor(self, request, pk):
-        proveedor = Proveedores.objects.get(pk=pk)
-        data = {
-            "titular": proveedor.tit_de_la_cuenta,
-            "codigo": proveedor.codigo,
-            "cuenta_bancaria": proveedor.cuenta_banc,
-            "direccion": proveedor.direccion,
-        }
-        return JsonResponse(data)
+        def datos():
+            proveedor = Proveedores.objects.get(pk=pk)
+            return {
+                "titular": proveedor.tit_de_la_cuenta,
+                "codigo": proveedor.codigo,
+                "cuenta_bancaria": proveedor.cuenta_banc,
+                "direccion": proveedor.direccion,
+            }
+
+        etiquetas = {etiqueta(Proveedores)}
+        return respuesta_condicional(
+            request, etiquetas, lambda: JsonResponse(cacheado(f"proveedor:{pk}", etiquetas, datos))
+        )
 
     def has_delete_permission(self, request, obj=None):
         return False
@@ -461,7 +792,6 @@ class SolicitudesDePagoAdmin(admin.ModelAdmin):
     def change_view(self, request, object_id, form_url='', extra_context=None):
         extra_context = extra_context or {}
         obj = self.get_object(request, object_id)
-        extra_context['show_history'] = False
         if obj and obj.estado in ("Cancelado", "Emitido"):
             extra_context['show_save'] = False
             extra_context['show_save_and_continue'] = False
@@ -472,7 +802,7 @@ class SolicitudesDePagoAdmin(admin.ModelAdmin):
 
 
 @admin.register(OperacionesEmitidas)
-class OperacionesEmitidasAdmin(admin.ModelAdmin):
+class OperacionesEmitidasAdmin(HistorialAuditoriaMixin, ListadoOptimizadoMixin, admin.ModelAdmin):
     list_display = (
         'mostrar_h90',
         'mostrar_no_cheque',
@@ -491,8 +821,34 @@ class OperacionesEmitidasAdmin(admin.ModelAdmin):
         MesFilterOE,
         AñoFilterOE,
         'estado',
+        LoteBancoFilter,
+    )
+    # La búsqueda la hace get_search_results; basta con que haya campos
+    search_fields = (
+        'numero_serie',
+        'numero_operacion',
+        'solicitud__numero_de_H90',
+        'solicitud__identificador_del_proveedor__ident_del_prov',
+    )
+    search_help_text = "No. de cheque, número de operación, H90 o proveedor."
+    keyset_ordering = ("-fecha_emision", "-pk")
+    list_select_related = ('solicitud', 'solicitud__identificador_del_proveedor')
+    list_only = (
+        'numero_serie',
+        'fecha_inicial',
+        'importe_emitido',
+        'estado',
+        'fecha_final',
+        'solicitud',
+        'solicitud__numero_de_H90',
+        'solicitud__descripcion',
+        'solicitud__identificador_del_proveedor',
+        'solicitud__identificador_del_proveedor__ident_del_prov',
+    )
+    list_prefetch_related = (
+        Prefetch('solicitud__conceptos_normales', queryset=ConceptoNormal.objects.only('solicitud', 'concepto', 'numero')),
+        Prefetch('solicitud__conceptos_salarios', queryset=ConceptoSalario.objects.only('solicitud', 'concepto')),
     )
-    search_fields = ()
 
     fields = (
         'mostrar_h90_display',
@@ -503,6 +859,7 @@ class OperacionesEmitidasAdmin(admin.ModelAdmin):
         'importe_emitido',
         'mostrar_concepto_display',
         'mostrar_suministrador_display',
+        'mostrar_lote_banco',
     )
 
     readonly_fields = (
@@ -512,8 +869,11 @@ class OperacionesEmitidasAdmin(admin.ModelAdmin):
         'importe_emitido',
         'mostrar_concepto_display',
         'mostrar_suministrador_display',
+        'mostrar_lote_banco',
     )
 
+    actions = ["exportar_lote_banco", "exportar_lote_banco_csv"]
+
     class Media:
         js = ('js/operaciones_fecha_final.js',)
 
@@ -548,6 +908,60 @@ class OperacionesEmitidasAdmin(admin.ModelAdmin):
         return obj.solicitud.identificador_del_proveedor
     mostrar_suministrador_display.short_description = "Suministrador"
 
+    def mostrar_lote_banco(self, obj):
+        if not obj.lote_banco:
+            return "—"
+        return format_html(
+            '{} &nbsp; <a href="{}"><i class="fas fa-download"></i> TXT</a> &nbsp; <a href="{}">CSV</a>',
+            obj.lote_banco,
+            reverse('admin:operacionesemitidas_lote_banco', args=[obj.lote_banco, "ancho_fijo"]),
+            reverse('admin:operacionesemitidas_lote_banco', args=[obj.lote_banco, "csv"]),
+        )
+    mostrar_lote_banco.short_description = "Lote Bancario"
+
+    def _exportar(self, request, queryset, formato):
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+        try:
+            lote, _ = reservar_lote(list(queryset.values_list("pk", flat=True)))
+        except ErrorLote as e:
+            messages.error(request, str(e))
+            return None
+        return self._respuesta_lote(lote, formato)
+
+    @admin.action(description="Generar lote bancario de las transferencias (texto de ancho fijo)")
+    def exportar_lote_banco(self, request, queryset):
+        return self._exportar(request, queryset, "ancho_fijo")
+
+    @admin.action(description="Generar lote bancario de las transferencias (CSV)")
+    def exportar_lote_banco_csv(self, request, queryset):
+        return self._exportar(request, queryset, "csv")
+
+    def _respuesta_lote(self, lote, formato):
+        codificacion = "utf-8" if formato == "csv" else "ascii"
+        response = StreamingHttpResponse(
+            (linea.encode(codificacion) for linea in lineas_lote(lote, formato)),
+            content_type=f"text/{'csv' if formato == 'csv' else 'plain'}; charset={codificacion}",
+        )
+        response["Content-Disposition"] = f'attachment; filename="lote_{lote}.{FORMATOS[formato]}"'
+        return response
+
+    def get_urls(self):
+        urls = super().get_urls()
+        custom_urls = [
+            path("lote-banco/<str:lote>/<str:formato>/", self.admin_site.admin_view(self.descargar_lote_banco),
+                 name="operacionesemitidas_lote_banco"),
+        ]
+        return custom_urls + urls
+
+    def descargar_lote_banco(self, request, lote, formato):
+        """Vuelve a generar el fichero de un lote ya exportado, sin marcar nada."""
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        if formato not in FORMATOS or not OperacionesEmitidas.objects.filter(lote_banco=lote).exists():
+            raise Http404
+        return self._respuesta_lote(lote, formato)
+
     def mostrar_h90(self, obj):
         return obj.solicitud.numero_de_H90
     mostrar_h90.short_description = "H90"
@@ -622,28 +1036,53 @@ class OperacionesEmitidasAdmin(admin.ModelAdmin):
         extra_context = extra_context or {}
         extra_context['show_save_and_add_another'] = False
         extra_context['show_save_and_continue'] = False
-        extra_context['show_history'] = False
         return super().change_view(request, object_id, form_url, extra_context=extra_context)
 
+    def _por_prefijo(self, campo, termino):
+        # Rango en lugar de LIKE para que use el índice del campo
+        return Q(**{f"{campo}__gte": termino, f"{campo}__lt": termino[:-1] + chr(ord(termino[-1]) + 1)})
+
+    def get_search_results(self, request, queryset, search_term):
+        termino = search_term.strip()
+        if not termino:
+            return queryset, False
+        condicion = self._por_prefijo("numero_serie", termino) | self._por_prefijo("numero_operacion", termino)
+        if busqueda.disponible(queryset.db):
+            consulta = busqueda.h90_o_proveedor(termino)
+            if consulta:
+                condicion |= Q(solicitud__in=busqueda.coincidentes(consulta))
+        else:
+            if termino.isdecimal():
+                condicion |= Q(solicitud__numero_de_H90=int(termino))
+            condicion |= Q(solicitud__identificador_del_proveedor__ident_del_prov__icontains=termino)
+        return queryset.filter(condicion), False
+
     def changelist_view(self, request, extra_context=None):
+        termino = request.GET.get(SEARCH_VAR, "").strip()
+        if termino and request.method == "GET":
+            # Antes de buscar: la redirección ya revela si el número existe
+            if not self.has_view_or_change_permission(request):
+                raise PermissionDenied
+            # Un No. de cheque o de operación exacto de una sola operación abre su ficha
+            pks = list(
+                self.get_queryset(request)
+                .filter(Q(numero_serie=termino) | Q(numero_operacion=termino))
+                .values_list("pk", flat=True)[:2]
+            )
+            if len(pks) == 1:
+                opts = self.model._meta
+                return redirect(f"admin:{opts.app_label}_{opts.model_name}_change", pks[0])
+
         extra_context = extra_context or {}
         response = super().changelist_view(request, extra_context=extra_context)
         try:
-            queryset = response.context_data['cl'].queryset
+            cl = response.context_data['cl']
         except (AttributeError, KeyError):
             return response
 
-        cantidad_operaciones = queryset.count()
-        importe_total = queryset.aggregate(total=Sum('importe_emitido'))['total'] or 0
-
-        def formato(valor):
-            if valor is not None:
-                s = f"{float(valor):,.2f}"
-                return s.replace(",", " ").replace(".", ",")
-            return "0,00"
-
-        extra_context['cantidad_operaciones'] = cantidad_operaciones
-        extra_context['importe_total_operaciones'] = formato(importe_total)
+        totales = cl.totales(importe_total=Sum('importe_emitido'))
+        extra_context['cantidad_operaciones'] = totales['cantidad']
+        extra_context['importe_total_operaciones'] = formato_importe(totales['importe_total'] or 0)
         response.context_data.update(extra_context)
         return response
 
@@ -654,8 +1093,8 @@ class AñoFilterIngreso(admin.SimpleListFilter):
     parameter_name = 'año'
 
     def lookups(self, request, model_admin):
-        años = Ingreso.objects.dates('fecha', 'year')
-        return [(a.year, a.year) for a in años]
+        años = años_cacheados(model_admin.model.objects.all(), 'fecha')
+        return [(a, a) for a in años]
 
     def queryset(self, request, queryset):
         if self.value():
@@ -683,7 +1122,7 @@ class MesFilterIngreso(admin.SimpleListFilter):
 
 
 @admin.register(Ingreso)
-class IngresoAdmin(admin.ModelAdmin):
+class IngresoAdmin(HistorialAuditoriaMixin, ListadoOptimizadoMixin, admin.ModelAdmin):
     list_display = (
         'tipo_ingreso',
         'fecha_formateada',
@@ -699,6 +1138,8 @@ class IngresoAdmin(admin.ModelAdmin):
         AñoFilterIngreso,
     )
     search_fields = ()
+    keyset_ordering = ("-pk",)
+    list_only = ('tipo_ingreso', 'fecha', 'importe', 'fecha_debito', 'concepto')
 
     fields = (
         'cuenta_de_empresa',
@@ -729,21 +1170,13 @@ class IngresoAdmin(admin.ModelAdmin):
         extra_context = extra_context or {}
         response = super().changelist_view(request, extra_context=extra_context)
         try:
-            queryset = response.context_data['cl'].queryset
+            cl = response.context_data['cl']
         except (AttributeError, KeyError):
             return response
 
-        cantidad_ingresos = queryset.count()
-        importe_total = queryset.aggregate(total=Sum('importe'))['total'] or 0
-
-        def formato(valor):
-            if valor is not None:
-                s = f"{float(valor):,.2f}"
-                return s.replace(",", " ").replace(".", ",")
-            return "0,00"
-
-        extra_context['cantidad_ingresos'] = cantidad_ingresos
-        extra_context['importe_total_ingresos'] = formato(importe_total)
+        totales = cl.totales(importe_total=Sum('importe'))
+        extra_context['cantidad_ingresos'] = totales['cantidad']
+        extra_context['importe_total_ingresos'] = formato_importe(totales['importe_total'] or 0)
         response.context_data.update(extra_context)
         return response
 
@@ -757,8 +1190,8 @@ class AñoFilterSB(admin.SimpleListFilter):
     parameter_name = 'año'
 
     def lookups(self, request, model_admin):
-        años = ServicioBancario.objects.dates('fecha', 'year')
-        return [(a.year, a.year) for a in años]
+        años = años_cacheados(model_admin.model.objects.all(), 'fecha')
+        return [(a, a) for a in años]
 
     def queryset(self, request, queryset):
         if self.value():
@@ -786,7 +1219,7 @@ class MesFilterSB(admin.SimpleListFilter):
 
 
 @admin.register(ServicioBancario)
-class ServicioBancarioAdmin(admin.ModelAdmin):
+class ServicioBancarioAdmin(HistorialAuditoriaMixin, ListadoOptimizadoMixin, admin.ModelAdmin):
     list_display = (
         'fecha_formateada',
         'importe',
@@ -801,6 +1234,8 @@ class ServicioBancarioAdmin(admin.ModelAdmin):
         AñoFilterSB,
     )
     search_fields = ()
+    keyset_ordering = ("-pk",)
+    list_only = ('fecha', 'importe', 'clave', 'descripcion')
 
     fields = (
         'cuenta_de_empresa',
@@ -819,21 +1254,13 @@ class ServicioBancarioAdmin(admin.ModelAdmin):
         extra_context = extra_context or {}
         response = super().changelist_view(request, extra_context=extra_context)
         try:
-            queryset = response.context_data['cl'].queryset
+            cl = response.context_data['cl']
         except (AttributeError, KeyError):
             return response
 
-        cantidad_servicios = queryset.count()
-        importe_total = queryset.aggregate(total=Sum('importe'))['total'] or 0
-
-        def formato(valor):
-            if valor is not None:
-                s = f"{float(valor):,.2f}"
-                return s.replace(",", " ").replace(".", ",")
-            return "0,00"
-
-        extra_context['cantidad_servicios'] = cantidad_servicios
-        extra_context['importe_total_servicios'] = formato(importe_total)
+        totales = cl.totales(importe_total=Sum('importe'))
+        extra_context['cantidad_servicios'] = totales['cantidad']
+        extra_context['importe_total_servicios'] = formato_importe(totales['importe_total'] or 0)
         response.context_data.update(extra_context)
         return response
 
@@ -844,8 +1271,8 @@ class AñoFilterAI(admin.SimpleListFilter):
     parameter_name = 'año'
 
     def lookups(self, request, model_admin):
-        años = AjusteInversiones.objects.dates('fecha', 'year')
-        return [(a.year, a.year) for a in años]
+        años = años_cacheados(model_admin.model.objects.all(), 'fecha')
+        return [(a, a) for a in años]
 
     def queryset(self, request, queryset):
         if self.value():
@@ -873,7 +1300,7 @@ class MesFilterAI(admin.SimpleListFilter):
 
 
 @admin.register(AjusteInversiones)
-class AjusteInversionesAdmin(admin.ModelAdmin):
+class AjusteInversionesAdmin(HistorialAuditoriaMixin, ListadoOptimizadoMixin, admin.ModelAdmin):
     list_display = (
         'fecha_formateada',
         'importe',
@@ -888,6 +1315,8 @@ class AjusteInversionesAdmin(admin.ModelAdmin):
         AñoFilterAI,
     )
     search_fields = ()
+    keyset_ordering = ("-pk",)
+    list_only = ('fecha', 'importe', 'clave', 'descripcion')
 
     fields = (
         'cuenta_de_empresa',
@@ -906,20 +1335,219 @@ class AjusteInversionesAdmin(admin.ModelAdmin):
         extra_context = extra_context or {}
         response = super().changelist_view(request, extra_context=extra_context)
         try:
-            queryset = response.context_data['cl'].queryset
+            cl = response.context_data['cl']
         except (AttributeError, KeyError):
             return response
 
-        cantidad_ajustes = queryset.count()
-        importe_total = queryset.aggregate(total=Sum('importe'))['total'] or 0
+        totales = cl.totales(importe_total=Sum('importe'))
+        extra_context['cantidad_ajustes'] = totales['cantidad']
+        extra_context['importe_total_ajustes'] = formato_importe(totales['importe_total'] or 0)
+        response.context_data.update(extra_context)
+        return response
+
 
-        def formato(valor):
-            if valor is not None:
-                s = f"{float(valor):,.2f}"
-                return s.replace(",", " ").replace(".", ",")
-            return "0,00"
+@admin.register(Tarea)
+class TareaAdmin(admin.ModelAdmin):
+    list_display = (
+        'id',
+        'tipo',
+        'estado',
+        'mostrar_progreso',
+        'intentos',
+        'fecha_creacion',
+        'fecha_fin',
+        'creado_por',
+        'mostrar_resultado',
+    )
+    list_display_links = ('id', 'tipo')
+    list_filter = ('estado', 'tipo')
+    list_select_related = ('creado_por',)
+
+    fields = (
+        'tipo',
+        'parametros',
+        'estado',
+        'mostrar_progreso',
+        'mensaje',
+        'intentos',
+        'max_intentos',
+        'trabajador',
+        'disponible_desde',
+        'fecha_creacion',
+        'fecha_inicio',
+        'fecha_fin',
+        'creado_por',
+        'mostrar_resultado',
+        'error',
+    )
+    readonly_fields = fields
+
+    actions = ["reintentar"]
+
+    def mostrar_progreso(self, obj):
+        if obj.total:
+            return f"{obj.progreso}/{obj.total} ({obj.progreso * 100 // obj.total}%)"
+        return "—"
+    mostrar_progreso.short_description = "Progreso"
+
+    def mostrar_resultado(self, obj):
+        if obj.estado == "Completada" and obj.resultado:
+            return format_html(
+                '<a href="{}"><i class="fas fa-download"></i> Descargar</a>',
+                reverse('admin:tarea_descargar', args=[obj.pk]),
+            )
+        return "—"
+    mostrar_resultado.short_description = "Resultado"
+
+    @admin.action(description="Reintentar tareas fallidas")
+    def reintentar(self, request, queryset):
+        cantidad = queryset.filter(estado="Fallida").update(
+            estado="Pendiente",
+            intentos=0,
+            disponible_desde=timezone.now(),
+            fecha_fin=None,
+            error=None,
+        )
+        messages.success(request, f"{cantidad} tareas vuelven a la cola.")
+
+    def get_urls(self):
+        urls = super().get_urls()
+        custom_urls = [
+            path("descargar/<int:pk>/", self.admin_site.admin_view(self.descargar), name="tarea_descargar"),
+        ]
+        return custom_urls + urls
+
+    def descargar(self, request, pk):
+        tarea = get_object_or_404(Tarea, pk=pk)
+        if not self.has_view_permission(request, tarea) or not tarea.resultado:
+            raise Http404
+        return FileResponse(tarea.resultado.open("rb"), as_attachment=True, filename=os.path.basename(tarea.resultado.name))
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def change_view(self, request, object_id, form_url='', extra_context=None):
+        extra_context = extra_context or {}
+        extra_context['show_history'] = False
+        return super().change_view(request, object_id, form_url, extra_context=extra_context)
+
+
+@admin.register(TokenAPI)
+class TokenAPIAdmin(admin.ModelAdmin):
+    list_display = ('nombre', 'usuario', 'activo', 'fecha_creacion', 'ultimo_uso')
+    list_filter = ('activo',)
+    list_select_related = ('usuario',)
+    fields = ('nombre', 'usuario', 'activo', 'clave', 'fecha_creacion', 'ultimo_uso')
+    readonly_fields = ('clave', 'fecha_creacion', 'ultimo_uso')
+
+    def change_view(self, request, object_id, form_url='', extra_context=None):
+        extra_context = extra_context or {}
+        extra_context['show_history'] = False
+        return super().change_view(request, object_id, form_url, extra_context=extra_context)
+
+
+@admin.register(EjercicioCerrado)
+class EjercicioCerradoAdmin(admin.ModelAdmin):
+    list_display = ('año', 'fecha_cierre', 'mostrar_resumen')
+    fields = ('año', 'fecha_cierre', 'resumen')
+    readonly_fields = fields
+
+    def mostrar_resumen(self, obj):
+        return ", ".join(f"{modelo}: {cantidad}" for modelo, cantidad in obj.resumen.items())
+    mostrar_resumen.short_description = "Registros archivados"
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(RegistroAuditoria)
+class RegistroAuditoriaAdmin(ListadoOptimizadoMixin, admin.ModelAdmin):
+    list_display = ('fecha', 'modelo', 'mostrar_objeto', 'accion', 'usuario', 'mostrar_cambios')
+    list_filter = ('accion', 'modelo')
+    list_select_related = ('usuario',)
+    keyset_ordering = ("-pk",)
+    fields = ('fecha', 'modelo', 'objeto_id', 'accion', 'usuario', 'cambios')
+    readonly_fields = fields
+
+    def mostrar_objeto(self, obj):
+        try:
+            url = reverse(f"admin:apps_{obj.modelo}_history", args=[obj.objeto_id])
+        except NoReverseMatch:
+            return obj.objeto_id
+        return format_html('<a href="{}">{}</a>', url, obj.objeto_id)
+    mostrar_objeto.short_description = "Objeto"
+
+    def mostrar_cambios(self, obj):
+        return ", ".join(obj.cambios)
+    mostrar_cambios.short_description = "Campos"
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+# Admins de solo lectura sobre la base de datos de archivo
+class ArchivoSoloLecturaMixin:
+    actions = None
+    inlines = []
+
+    def get_urls(self):
+        # Sin las vistas propias del admin original (emitir, JSON...)
+        return admin.ModelAdmin.get_urls(self)
+
+    # Sin ejercicios archivados (o con el archivo sin migrar) no hay tablas que mostrar
+    def has_module_permission(self, request):
+        return archivo_disponible() and super().has_module_permission(request)
+
+    def has_view_permission(self, request, obj=None):
+        return archivo_disponible() and super().has_view_permission(request, obj)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(SolicitudArchivada)
+class SolicitudArchivadaAdmin(ArchivoSoloLecturaMixin, SolicitudesDePagoAdmin):
+    change_list_template = "admin/apps/solicitudesdepago/change_list.html"
+    fields = SolicitudesDePagoAdmin.fields + ('mostrar_conceptos_pago',)
+
+
+@admin.register(OperacionArchivada)
+class OperacionArchivadaAdmin(ArchivoSoloLecturaMixin, OperacionesEmitidasAdmin):
+    change_list_template = "admin/apps/operacionesemitidas/change_list.html"
+
+
+@admin.register(IngresoArchivado)
+class IngresoArchivadoAdmin(ArchivoSoloLecturaMixin, IngresoAdmin):
+    change_list_template = "admin/apps/ingreso/change_list.html"
+
+
+@admin.register(ServicioBancarioArchivado)
+class ServicioBancarioArchivadoAdmin(ArchivoSoloLecturaMixin, ServicioBancarioAdmin):
+    change_list_template = "admin/apps/serviciobancario/change_list.html"
+
+
+@admin.register(AjusteInversionesArchivado)
+class AjusteInversionesArchivadoAdmin(ArchivoSoloLecturaMixin, AjusteInversionesAdmin):
+    change_list_template = "admin/apps/ajusteinversiones/change_list.html"
 
-        extra_context['cantidad_ajustes'] = cantidad_ajustes
-        extra_context['importe_total_ajustes'] = formato(importe_total)
-        response.context_data.update(extra_context)
-        return response
\ No newline at end of file
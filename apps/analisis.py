@@ -0,0 +1,182 @@
+"""
+Análisis del gasto por proveedor.
+
+El gasto de un año es el importe de sus solicitudes no canceladas,
+opcionalmente de una sola cuenta de empresa o de un solo proveedor. Se
+obtienen los proveedores con más gasto (con su desglose por cuenta), el
+gasto por mes y cuenta y el reparto por concepto, a partir de tres
+consultas agrupadas por mes en cada base con datos del año: solicitudes por
+proveedor y cuenta, conceptos normales y conceptos de salario.
+
+Los agregados se cachean por mes. Los meses ya terminados dependen solo de
+su propia etiqueta (``etiqueta_mes``), que cambia al guardar o borrar una
+solicitud del mes, al guardar sus conceptos desde el admin o al crear
+solicitudes en lote; así, lo que se registra en el mes en curso no obliga a
+recalcular el resto del año. El mes en curso depende de las tablas enteras.
+"""
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import Count, Sum
+from django.db.models.functions import ExtractMonth
+from django.db.models.signals import post_delete, post_save
+
+from .archivo import bases_para_año
+from .cache_etiquetas import clave_versionada, etiqueta, invalidar_etiquetas
+from .models import Proveedores, SolicitudesDePago, ConceptoNormal, ConceptoSalario
+
+# Los meses terminados casi nunca cambian; el plazo solo acota lo que ocupan
+DURACION_MES_CERRADO = 7 * 24 * 60 * 60
+DURACION_MES_ABIERTO = 60 * 60
+TOP_POR_DEFECTO = 10
+TIPOS_CONCEPTO = (("Normal", ConceptoNormal), ("Salario", ConceptoSalario))
+
+
+def etiqueta_mes(año, mes):
+    return f"{etiqueta(SolicitudesDePago)}:{año}-{mes:02d}"
+
+
+def invalidar_meses(fechas, using=None):
+    """Invalida el análisis de los meses de las fechas dadas."""
+    invalidar_etiquetas({etiqueta_mes(f.year, f.month) for f in fechas if f}, using=using)
+
+
+def _mes_cerrado(año, mes):
+    hoy = date.today()
+    return (año, mes) < (hoy.year, hoy.month)
+
+
+def _solicitudes(alias, año, meses, cuenta, proveedor):
+    consulta = SolicitudesDePago.objects.using(alias).filter(
+        fecha_del_modelo__year=año, fecha_del_modelo__month__in=meses
+    ).exclude(estado="Cancelado")
+    if cuenta:
+        consulta = consulta.filter(cuenta_de_empresa=cuenta)
+    if proveedor:
+        consulta = consulta.filter(identificador_del_proveedor=proveedor)
+    return consulta
+
+
+def _calcular(año, meses, cuenta, proveedor):
+    """``{mes: {"proveedores": {(id, cuenta): [total, cantidad]}, "conceptos": {(tipo, concepto): total}}}``"""
+    datos = {mes: {"proveedores": {}, "conceptos": defaultdict(Decimal)} for mes in meses}
+    for alias in bases_para_año(año):
+        solicitudes = _solicitudes(alias, año, meses, cuenta, proveedor)
+        filas = (
+            solicitudes.order_by()
+            .values("identificador_del_proveedor", "cuenta_de_empresa", mes=ExtractMonth("fecha_del_modelo"))
+            .annotate(total=Sum("importe_total"), cantidad=Count("pk"))
+        )
+        for fila in filas:
+            acumulado = datos[fila["mes"]]["proveedores"].setdefault(
+                (fila["identificador_del_proveedor"], fila["cuenta_de_empresa"]), [Decimal(0), 0]
+            )
+            acumulado[0] += fila["total"] or 0
+            acumulado[1] += fila["cantidad"]
+        for tipo, modelo in TIPOS_CONCEPTO:
+            filas = (
+                modelo.objects.using(alias).filter(solicitud__in=solicitudes.values("pk"))
+                .order_by()
+                .values("concepto", mes=ExtractMonth("solicitud__fecha_del_modelo"))
+                .annotate(total=Sum("importe"))
+            )
+            for fila in filas:
+                datos[fila["mes"]]["conceptos"][(tipo, fila["concepto"])] += fila["total"] or 0
+    for mes in datos.values():
+        mes["conceptos"] = dict(mes["conceptos"])
+    return datos
+
+
+def agregados_por_mes(año, cuenta=None, proveedor=None):
+    """Agregados de cada mes del año, de la caché o calculados a la vez los que falten."""
+    variante = f"{año}:{cuenta or ''}:{proveedor or ''}"
+    cerrados = [mes for mes in range(1, 13) if _mes_cerrado(año, mes)]
+    abiertos = [mes for mes in range(1, 13) if not _mes_cerrado(año, mes)]
+
+    claves = {mes: clave_versionada(f"analisis:{variante}:{mes}", {etiqueta_mes(año, mes)}) for mes in cerrados}
+    guardados = cache.get_many(claves.values())
+    datos = {mes: guardados[clave] for mes, clave in claves.items() if clave in guardados}
+    faltan = [mes for mes in cerrados if mes not in datos]
+    if faltan:
+        calculados = _calcular(año, faltan, cuenta, proveedor)
+        cache.set_many({claves[mes]: calculados[mes] for mes in faltan}, DURACION_MES_CERRADO)
+        datos.update(calculados)
+
+    if abiertos:
+        etiquetas = {etiqueta(m) for m in (SolicitudesDePago, ConceptoNormal, ConceptoSalario)}
+        clave = clave_versionada(f"analisis:{variante}:abiertos", etiquetas)
+        calculados = cache.get(clave)
+        if calculados is None:
+            calculados = _calcular(año, abiertos, cuenta, proveedor)
+            cache.set(clave, calculados, DURACION_MES_ABIERTO)
+        datos.update(calculados)
+    return datos
+
+
+def analisis(año, cuenta=None, proveedor=None, top=TOP_POR_DEFECTO):
+    """Resumen del año para la vista y la exportación; ``top=None`` incluye todos los proveedores."""
+    datos = agregados_por_mes(año, cuenta, proveedor)
+    por_proveedor = defaultdict(lambda: {"total": Decimal(0), "cantidad": 0, "por_cuenta": defaultdict(Decimal)})
+    meses = []
+    conceptos = defaultdict(Decimal)
+    cuentas = set()
+    for mes in range(1, 13):
+        por_cuenta = defaultdict(Decimal)
+        for (id_proveedor, cuenta_empresa), (total, cantidad) in datos[mes]["proveedores"].items():
+            fila = por_proveedor[id_proveedor]
+            fila["total"] += total
+            fila["cantidad"] += cantidad
+            fila["por_cuenta"][cuenta_empresa] += total
+            por_cuenta[cuenta_empresa] += total
+            cuentas.add(cuenta_empresa)
+        for clave, total in datos[mes]["conceptos"].items():
+            conceptos[clave] += total
+        meses.append({"mes": mes, "total": sum(por_cuenta.values(), Decimal(0)), "por_cuenta": por_cuenta})
+
+    total = sum((m["total"] for m in meses), Decimal(0))
+    ordenados = sorted(por_proveedor.items(), key=lambda p: (-p[1]["total"], p[0] or 0))
+    if top:
+        ordenados = ordenados[:top]
+    nombres = dict(
+        Proveedores.objects.filter(pk__in=[pk for pk, _ in ordenados if pk]).values_list("pk", "ident_del_prov")
+    )
+    total_conceptos = sum(conceptos.values(), Decimal(0))
+    return {
+        "año": año,
+        "total": total,
+        "cantidad": sum(p["cantidad"] for p in por_proveedor.values()),
+        "cuentas": sorted(cuentas),
+        "proveedores": [
+            {"id": pk, "nombre": nombres.get(pk, "Sin proveedor" if pk is None else f"Proveedor {pk}"), **fila}
+            for pk, fila in ordenados
+        ],
+        "meses": meses,
+        "conceptos": [
+            {
+                "tipo": tipo,
+                "concepto": concepto,
+                "total": importe,
+                "porcentaje": importe * 100 / total_conceptos if total_conceptos else 0,
+            }
+            for (tipo, concepto), importe in sorted(conceptos.items(), key=lambda c: -c[1])
+        ],
+    }
+
+
+def _al_guardar(sender, instance, raw=False, using=None, **kwargs):
+    if raw:
+        return
+    # Si cambió la fecha, también el mes anterior (auditoria lo leyó en pre_save)
+    anterior = (getattr(instance, "_auditoria_anterior", None) or {}).get("fecha_del_modelo")
+    invalidar_meses([instance.fecha_del_modelo, anterior], using=using)
+
+
+def _al_borrar(sender, instance, using=None, **kwargs):
+    invalidar_meses([instance.fecha_del_modelo], using=using)
+
+
+def conectar():
+    post_save.connect(_al_guardar, sender=SolicitudesDePago, dispatch_uid="analisis_guardar")
+    post_delete.connect(_al_borrar, sender=SolicitudesDePago, dispatch_uid="analisis_borrar")
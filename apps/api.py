@@ -0,0 +1,209 @@
+"""
+API JSON de solicitudes de pago para los sistemas de nómina y compras.
+
+Autenticación: cabecera ``Authorization: Token <clave>`` con un token creado
+en el admin (Tokens de API). Los permisos son los del usuario del token, que
+debe trabajar en la empresa (ver ``apps.empresas``).
+
+``GET  /api/solicitudes/``  listado por cursor.
+    ``?campos=numero_de_H90,importe_total,conceptos_normales`` limita los campos,
+    ``?limite=`` (máx. 1000), ``?cursor=`` el valor ``siguiente`` de la respuesta
+    anterior, y filtros ``estado``, ``forma_de_pago``, ``cuenta_de_empresa``, ``año``.
+    Admite ``If-None-Match``: sin cambios, responde 304.
+``POST /api/solicitudes/``  crea en lote ``{"solicitudes": [...]}``; todas o ninguna.
+"""
+import base64
+import binascii
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.contrib.auth import get_user_model
+from django.http import JsonResponse
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+
+from .cache_etiquetas import etiqueta
+from .empresas import empresa_actual, puede_usar_empresa
+from .models import SolicitudesDePago, ConceptoNormal, ConceptoSalario, TokenAPI
+from .respuestas import respuesta_condicional
+from .servicios import ErroresLote, crear_solicitudes_en_lote
+
+LIMITE_POR_DEFECTO = 100
+LIMITE_MAXIMO = 1000
+MAXIMO_LOTE = 1000
+
+CAMPOS = (
+    "id",
+    "numero_de_H90",
+    "fecha_del_modelo",
+    "forma_de_pago",
+    "cuenta_de_empresa",
+    "identificador_del_proveedor",
+    "nombre_del_proveedor",
+    "codigo_del_proveedor",
+    "cuenta_bancaria",
+    "direccion_proveedor",
+    "importe_total",
+    "inversiones",
+    "importe_inversiones",
+    "descripcion",
+    "estado",
+)
+RELACIONES = {
+    "conceptos_normales": (ConceptoNormal, ("concepto", "numero", "importe")),
+    "conceptos_salarios": (ConceptoSalario, ("concepto", "importe")),
+}
+FILTROS = {
+    "estado": "estado",
+    "forma_de_pago": "forma_de_pago",
+    "cuenta_de_empresa": "cuenta_de_empresa",
+    "año": "fecha_del_modelo__year",
+}
+
+
+def error(mensaje, status):
+    return JsonResponse({"error": mensaje}, status=status)
+
+
+def token_requerido(vista):
+    @wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        tipo, _, clave = request.META.get("HTTP_AUTHORIZATION", "").partition(" ")
+        if tipo.lower() != "token" or not clave.strip():
+            return error("Falta la cabecera Authorization: Token <clave>.", 401)
+        # Sin unir con usuarios: el token está en la base de la empresa y los usuarios en default
+        token = TokenAPI.objects.filter(clave=clave.strip(), activo=True).first()
+        usuario = token and get_user_model().objects.filter(pk=token.usuario_id, is_active=True).first()
+        if usuario is None:
+            return error("Token inválido o inactivo.", 401)
+        if not puede_usar_empresa(usuario, empresa_actual()):
+            return error("El usuario del token no trabaja en esta empresa.", 403)
+        ahora = timezone.now()
+        # Evita una escritura por petición: basta con saber el uso aproximado
+        if token.ultimo_uso is None or ahora - token.ultimo_uso > timedelta(minutes=5):
+            TokenAPI.objects.filter(pk=token.pk).update(ultimo_uso=ahora)
+        request.user = usuario
+        return vista(request, *args, **kwargs)
+    return csrf_exempt(envoltura)
+
+
+def _codificar_cursor(pk):
+    return base64.urlsafe_b64encode(str(pk).encode()).decode()
+
+
+def _decodificar_cursor(cursor):
+    try:
+        return int(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+def _conceptos(relacion, ids):
+    modelo, campos = RELACIONES[relacion]
+    agrupados = {}
+    for fila in modelo.objects.filter(solicitud_id__in=ids).values("solicitud_id", *campos):
+        agrupados.setdefault(fila.pop("solicitud_id"), []).append(fila)
+    return agrupados
+
+
+def preparar_listado(request):
+    """``(error, consulta)``: los errores se deciden antes de la respuesta condicional."""
+    if not request.user.has_perm("apps.view_solicitudesdepago"):
+        return error("No tiene permiso para ver solicitudes.", 403), None
+
+    pedidos = [c for c in request.GET.get("campos", "").split(",") if c]
+    campos = [c for c in pedidos if c in CAMPOS] if pedidos else list(CAMPOS)
+    relaciones = [c for c in pedidos if c in RELACIONES] if pedidos else list(RELACIONES)
+    desconocidos = set(pedidos) - set(CAMPOS) - set(RELACIONES)
+    if desconocidos:
+        return error(f"Campos desconocidos: {', '.join(sorted(desconocidos))}.", 400), None
+
+    try:
+        limite = min(int(request.GET.get("limite", LIMITE_POR_DEFECTO)), LIMITE_MAXIMO)
+    except ValueError:
+        return error("El parámetro limite debe ser un número.", 400), None
+    if limite < 1:
+        return error("El parámetro limite debe ser mayor que cero.", 400), None
+
+    solicitudes = SolicitudesDePago.objects.order_by("pk")
+    for parametro, lookup in FILTROS.items():
+        valor = request.GET.get(parametro)
+        if not valor:
+            continue
+        if parametro == "año":
+            if not valor.isdecimal():
+                return error("El parámetro año debe ser un número.", 400), None
+            valor = int(valor)
+        elif valor not in dict(SolicitudesDePago._meta.get_field(lookup).flatchoices):
+            return error(f"Valor no válido para {parametro}: {valor}.", 400), None
+        solicitudes = solicitudes.filter(**{lookup: valor})
+    if request.GET.get("cursor"):
+        desde = _decodificar_cursor(request.GET["cursor"])
+        if desde is None:
+            return error("Cursor inválido.", 400), None
+        solicitudes = solicitudes.filter(pk__gt=desde)
+    return None, (solicitudes, campos, relaciones, limite)
+
+
+def listar(solicitudes, campos, relaciones, limite):
+    # Se piden limite + 1 filas para saber si hay otra página sin contar
+    filas = list(solicitudes.values("id", *[c for c in campos if c != "id"])[:limite + 1])
+    hay_mas = len(filas) > limite
+    filas = filas[:limite]
+
+    ids = [fila["id"] for fila in filas]
+    for relacion in relaciones:
+        agrupados = _conceptos(relacion, ids)
+        for fila in filas:
+            fila[relacion] = agrupados.get(fila["id"], [])
+    siguiente = _codificar_cursor(filas[-1]["id"]) if hay_mas else None
+    if "id" not in campos:
+        for fila in filas:
+            del fila["id"]
+
+    return JsonResponse({"resultados": filas, "siguiente": siguiente})
+
+
+def crear(request):
+    if not request.user.has_perm("apps.add_solicitudesdepago"):
+        return error("No tiene permiso para crear solicitudes.", 403)
+    try:
+        cuerpo = json.loads(request.body or b"{}")
+    except (ValueError, UnicodeDecodeError):
+        return error("El cuerpo debe ser JSON válido.", 400)
+
+    filas = cuerpo.get("solicitudes") if isinstance(cuerpo, dict) else None
+    if not isinstance(filas, list) or not filas or not all(isinstance(f, dict) for f in filas):
+        return error('Envíe {"solicitudes": [...]} con al menos una solicitud.', 400)
+    if len(filas) > MAXIMO_LOTE:
+        return error(f"Un lote admite como máximo {MAXIMO_LOTE} solicitudes.", 400)
+
+    try:
+        creadas = crear_solicitudes_en_lote(filas)
+    except ErroresLote as e:
+        return JsonResponse({"errores": {str(i): errores for i, errores in e.errores.items()}}, status=400)
+
+    resultados = []
+    for solicitud, normales, salarios in creadas:
+        datos = {campo: getattr(solicitud, campo) for campo in CAMPOS if campo != "identificador_del_proveedor"}
+        datos["identificador_del_proveedor"] = solicitud.identificador_del_proveedor_id
+        datos["conceptos_normales"] = [
+            {"concepto": c.concepto, "numero": c.numero, "importe": c.importe} for c in normales
+        ]
+        datos["conceptos_salarios"] = [{"concepto": c.concepto, "importe": c.importe} for c in salarios]
+        resultados.append(datos)
+    return JsonResponse({"resultados": resultados}, status=201)
+
+
+@token_requerido
+@require_http_methods(["GET", "POST"])
+def solicitudes(request):
+    if request.method == "POST":
+        return crear(request)
+    respuesta, consulta = preparar_listado(request)
+    if respuesta is not None:
+        return respuesta
+    etiquetas = {etiqueta(modelo) for modelo in (SolicitudesDePago, ConceptoNormal, ConceptoSalario)}
+    return respuesta_condicional(request, etiquetas, lambda: listar(*consulta))
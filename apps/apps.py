@@ -1,6 +1,32 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+
+
+def configurar_sqlite(sender, connection, **kwargs):
+    # WAL permite que los lectores (el admin) no se bloqueen mientras el
+    # trabajador de tareas escribe.
+    if connection.vendor == "sqlite":
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode=WAL;")
+            cursor.execute("PRAGMA synchronous=NORMAL;")
 
 
 class AppsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps'
+
+    def ready(self):
+        connection_created.connect(configurar_sqlite)
+        from . import tareas  # noqa: F401  registra los tipos de tarea
+        from .auditoria import conectar
+        conectar()
+        from . import cache_etiquetas
+        cache_etiquetas.conectar()
+        from . import sesiones
+        sesiones.conectar()
+        from . import analisis
+        analisis.conectar()
+        from . import busqueda
+        busqueda.conectar(self)
+        from . import empresas
+        empresas.conectar(self)
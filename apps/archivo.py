@@ -0,0 +1,184 @@
+"""
+Cierre de ejercicios: traslado de los años cerrados a la base de datos de archivo.
+
+Un año se puede cerrar cuando ninguna de sus solicitudes está Activa y todas
+sus operaciones están Debitadas o Canceladas. Al cerrarlo, las solicitudes
+(con sus conceptos y operaciones), los ingresos, los servicios bancarios y
+los ajustes de ese año se copian a la base de archivo y se borran de la
+principal; los proveedores referenciados se copian pero se conservan. Cada
+empresa tiene su propio archivo (ver ``apps.empresas``).
+
+Los datos archivados se consultan en el admin mediante los modelos proxy
+``*Archivado`` y, para informes, con ``bases_para_año``.
+"""
+from datetime import date
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from .cache_etiquetas import invalidar
+from .empresas import alias_archivo, alias_principal
+
+# Tablas que existen en la base de datos de archivo
+MODELOS_ARCHIVO = {
+    "proveedores",
+    "solicitudesdepago",
+    "conceptonormal",
+    "conceptosalario",
+    "operacionesemitidas",
+    "ingreso",
+    "serviciobancario",
+    "ajusteinversiones",
+}
+
+TAMAÑO_LOTE = 1000
+
+_migrados = set()
+
+
+def archivo_configurado():
+    return alias_archivo() in settings.DATABASES
+
+
+def archivo_disponible():
+    """Si hay ejercicios archivados y la base de archivo de la empresa activa ya tiene sus tablas."""
+    alias = alias_archivo()
+    if not archivo_configurado() or not años_cerrados():
+        return False
+    if alias in _migrados:
+        return True
+    # Sin comprobar antes el fichero, conectarse lo crearía vacío
+    if not Path(settings.DATABASES[alias]["NAME"]).exists():
+        return False
+    if "apps_solicitudesdepago" not in connections[alias].introspection.table_names():
+        return False
+    _migrados.add(alias)
+    return True
+
+
+def años_cerrados():
+    from .cache_etiquetas import cacheado, etiqueta
+    from .models import EjercicioCerrado
+
+    return cacheado(
+        "ejercicios_cerrados",
+        {etiqueta(EjercicioCerrado)},
+        lambda: frozenset(EjercicioCerrado.objects.values_list("año", flat=True)),
+    )
+
+
+def ejercicio_cerrado(año):
+    return año in años_cerrados()
+
+
+def bases_para_año(año):
+    """Bases de datos que pueden contener registros del año indicado."""
+    if archivo_configurado() and ejercicio_cerrado(año):
+        return [alias_principal(), alias_archivo()]
+    return [alias_principal()]
+
+
+def bases_de_datos():
+    """Todas las bases con datos de negocio, para informes que abarcan varios años."""
+    if archivo_configurado() and años_cerrados():
+        return [alias_principal(), alias_archivo()]
+    return [alias_principal()]
+
+
+def _querysets_del_año(año):
+    from .models import (
+        SolicitudesDePago, ConceptoNormal, ConceptoSalario, OperacionesEmitidas,
+        Ingreso, ServicioBancario, AjusteInversiones,
+    )
+
+    solicitudes = SolicitudesDePago.objects.filter(fecha_del_modelo__year=año)
+    return {
+        "solicitudesdepago": solicitudes,
+        "conceptonormal": ConceptoNormal.objects.filter(solicitud__in=solicitudes),
+        "conceptosalario": ConceptoSalario.objects.filter(solicitud__in=solicitudes),
+        "operacionesemitidas": OperacionesEmitidas.objects.filter(solicitud__in=solicitudes),
+        "ingreso": Ingreso.objects.filter(fecha__year=año),
+        "serviciobancario": ServicioBancario.objects.filter(fecha__year=año),
+        "ajusteinversiones": AjusteInversiones.objects.filter(fecha__year=año),
+    }
+
+
+def problemas_de_cierre(año):
+    """Motivos por los que el año todavía no se puede cerrar (lista vacía si se puede)."""
+    from .models import SolicitudesDePago, OperacionesEmitidas, EjercicioCerrado
+
+    problemas = []
+    if año >= date.today().year:
+        problemas.append(f"El ejercicio {año} aún no ha terminado.")
+    if EjercicioCerrado.objects.filter(año=año).exists():
+        problemas.append(f"El ejercicio {año} ya está cerrado.")
+    activas = SolicitudesDePago.objects.filter(fecha_del_modelo__year=año, estado="Activo").count()
+    if activas:
+        problemas.append(f"Hay {activas} solicitudes de {año} en estado Activo.")
+    abiertas = OperacionesEmitidas.objects.filter(
+        solicitud__fecha_del_modelo__year=año
+    ).exclude(estado__in=("Debitado", "Cancelado")).count()
+    if abiertas:
+        problemas.append(f"Hay {abiertas} operaciones de {año} que no están Debitadas ni Canceladas.")
+    return problemas
+
+
+def _copiar(queryset, destino):
+    modelo = queryset.model
+    copiados = 0
+    lote = []
+    for obj in queryset.order_by("pk").iterator(chunk_size=TAMAÑO_LOTE):
+        lote.append(obj)
+        if len(lote) >= TAMAÑO_LOTE:
+            modelo.objects.using(destino).bulk_create(lote, ignore_conflicts=True)
+            copiados += len(lote)
+            lote = []
+    if lote:
+        modelo.objects.using(destino).bulk_create(lote, ignore_conflicts=True)
+        copiados += len(lote)
+    invalidar(modelo, using=destino)
+    return copiados
+
+
+def cerrar_ejercicio(año):
+    """Traslada el año al archivo y devuelve el resumen por modelo."""
+    from .auditoria import sin_auditoria
+    from .models import Proveedores, EjercicioCerrado
+
+    problemas = problemas_de_cierre(año)
+    if problemas:
+        raise ValueError(" ".join(problemas))
+
+    consultas = _querysets_del_año(año)
+    proveedores = Proveedores.objects.filter(
+        pk__in=consultas["solicitudesdepago"].values("identificador_del_proveedor")
+    )
+    resumen = {}
+
+    archivo = alias_archivo()
+    with transaction.atomic(using=alias_principal()):
+        # El archivo se confirma antes de borrar nada del principal: si el
+        # borrado fallara, los datos quedarían duplicados (nunca perdidos) y
+        # el cierre se puede repetir, porque la copia ignora los pk existentes.
+        with transaction.atomic(using=archivo):
+            _copiar(proveedores, archivo)
+            for nombre, queryset in consultas.items():
+                resumen[nombre] = _copiar(queryset, archivo)
+
+        # Los conceptos y las operaciones se borran en cascada con las
+        # solicitudes. Es un traslado, no una baja: no se audita.
+        with sin_auditoria():
+            for nombre in ("solicitudesdepago", "ingreso", "serviciobancario", "ajusteinversiones"):
+                _borrar(consultas[nombre])
+
+        # post_save invalida la lista de ejercicios cerrados al confirmar
+        EjercicioCerrado.objects.create(año=año, resumen=resumen)
+
+    return resumen
+
+
+def _borrar(queryset):
+    ids = list(queryset.values_list("pk", flat=True))
+    for inicio in range(0, len(ids), TAMAÑO_LOTE):
+        queryset.model.objects.filter(pk__in=ids[inicio:inicio + TAMAÑO_LOTE]).delete()
@@ -0,0 +1,68 @@
+"""
+Preparación de cada proceso del servidor antes de su primera petición.
+
+Django resuelve las URLs y compila cada plantilla la primera vez que las
+usa, de modo que la primera petición de cada proceso pagaba ese coste.
+``calentar()`` lo adelanta al arranque: se llama desde ``wsgi.py`` una vez
+por proceso, tras cargar la aplicación. Las plantillas compiladas quedan en
+el cargador con caché.
+"""
+import logging
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.template import TemplateDoesNotExist, TemplateSyntaxError
+from django.template.loader import get_template
+from django.urls import NoReverseMatch, get_resolver, reverse
+
+logger = logging.getLogger(__name__)
+
+# Páginas del admin que se abren en casi todas las sesiones
+PLANTILLAS_ADMIN = (
+    "admin/login.html",
+    "admin/base_site.html",
+    "admin/index.html",
+    "admin/change_list.html",
+    "admin/change_list_results.html",
+    "admin/change_form.html",
+    "admin/edit_inline/tabular.html",
+    "admin/filter.html",
+    "admin/search_form.html",
+    "admin/actions.html",
+    "admin/pagination.html",
+    "admin/submit_line.html",
+    "admin/includes/fieldset.html",
+    "admin/delete_confirmation.html",
+)
+
+
+def _plantillas_del_proyecto():
+    for directorio in settings.TEMPLATES[0].get("DIRS", []):
+        directorio = Path(directorio)
+        for ruta in sorted(directorio.rglob("*.html")):
+            yield ruta.relative_to(directorio).as_posix()
+
+
+def calentar():
+    """Resuelve las URLs y compila las plantillas; devuelve los segundos empleados."""
+    inicio = time.perf_counter()
+    # Carga los urlpatterns de todo el proyecto (y las vistas que importan)
+    get_resolver().url_patterns
+    try:
+        reverse("admin:index")
+    except NoReverseMatch:
+        pass
+
+    compiladas = 0
+    for nombre in (*PLANTILLAS_ADMIN, *_plantillas_del_proyecto()):
+        try:
+            get_template(nombre)
+            compiladas += 1
+        except TemplateDoesNotExist:
+            pass
+        except TemplateSyntaxError:
+            logger.exception("No se pudo compilar la plantilla %s", nombre)
+    duracion = time.perf_counter() - inicio
+    logger.info("Proceso preparado en %.0f ms (%d plantillas)", duracion * 1000, compiladas)
+    return duracion
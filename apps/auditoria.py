@@ -0,0 +1,317 @@
+"""
+Auditoría de cambios de los modelos de negocio.
+
+Cada alta, modificación o baja de proveedores, solicitudes, operaciones,
+ingresos, servicios bancarios y ajustes guarda en ``RegistroAuditoria``
+solo los campos que cambiaron. Los registros se acumulan en memoria durante
+la transacción y se escriben juntos al confirmarla con un único INSERT; si
+son muchos (operaciones en lote) se entregan al trabajador de tareas. Si la
+transacción se revierte no se escribe nada.
+
+El usuario se toma de la petición en curso (``MiddlewareAuditoria``) o, en
+el trabajador, del usuario que encoló la tarea.
+"""
+import contextvars
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime
+
+from django.apps import apps as registro_apps
+from django.contrib.admin.utils import unquote
+from django.core.exceptions import PermissionDenied
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.template.response import TemplateResponse
+from django.utils import timezone
+
+from .cache_etiquetas import invalidar
+from .empresas import alias_principal
+
+MODELOS_AUDITADOS = (
+    "Proveedores",
+    "SolicitudesDePago",
+    "OperacionesEmitidas",
+    "Ingreso",
+    "ServicioBancario",
+    "AjusteInversiones",
+)
+
+# Por encima de esta cantidad de registros en una transacción, la escritura
+# se delega en el trabajador para no alargar la petición.
+MAXIMO_DIRECTO = 500
+TAMAÑO_LOTE = 500
+ENTRADAS_POR_PAGINA = 50
+
+_origen = contextvars.ContextVar("origen_auditoria", default=None)
+_desactivada = contextvars.ContextVar("auditoria_desactivada", default=False)
+_estado = threading.local()
+
+
+class MiddlewareAuditoria:
+    """Recuerda la petición en curso para atribuir los cambios a su usuario."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _origen.set(request)
+        try:
+            return self.get_response(request)
+        finally:
+            _origen.reset(token)
+
+
+@contextmanager
+def como_usuario(usuario):
+    token = _origen.set(usuario)
+    try:
+        yield
+    finally:
+        _origen.reset(token)
+
+
+@contextmanager
+def sin_auditoria():
+    """Para traslados internos (p. ej. el cierre de ejercicio) que no son cambios."""
+    token = _desactivada.set(True)
+    try:
+        yield
+    finally:
+        _desactivada.reset(token)
+
+
+def _usuario_actual():
+    origen = _origen.get()
+    # La petición se guarda entera porque la API asigna request.user dentro de la vista
+    usuario = getattr(origen, "user", origen)
+    if usuario is not None and getattr(usuario, "is_authenticated", False):
+        return usuario.pk
+    return None
+
+
+def _campos(modelo):
+    return [f for f in modelo._meta.concrete_fields if not f.primary_key]
+
+
+def _valor(valor):
+    if valor is None or isinstance(valor, (bool, int, float, str)):
+        return valor
+    if isinstance(valor, (date, datetime)):
+        return valor.isoformat()
+    # Decimal y demás tipos se guardan como texto
+    return str(valor)
+
+
+def _comparable(campo, valor):
+    try:
+        return campo.to_python(valor)
+    except Exception:
+        return valor
+
+
+class _Lote:
+    """Registros pendientes de una transacción; se escriben al confirmarla."""
+
+    def __init__(self, alias):
+        self.alias = alias
+        self.registros = []
+
+    def __call__(self):
+        registros, self.registros = self.registros, []
+        escribir_registros(registros, self.alias)
+
+
+def _lote_activo(alias):
+    conexion = transaction.get_connection(alias)
+    if not conexion.in_atomic_block:
+        return None
+    lotes = _estado.__dict__.setdefault("lotes", {})
+    lote = lotes.get(alias)
+    # Si la transacción anterior se revirtió, Django descartó su callback y
+    # con él el lote: se empieza uno nuevo.
+    if lote is None or not any(pendiente[1] is lote for pendiente in conexion.run_on_commit):
+        lote = lotes[alias] = _Lote(alias)
+        transaction.on_commit(lote, using=alias)
+    return lote
+
+
+def _anotar(registros, alias):
+    if not registros:
+        return
+    alias = alias or alias_principal()
+    lote = _lote_activo(alias)
+    if lote is None:
+        escribir_registros(registros, alias)
+    else:
+        lote.registros.extend(registros)
+
+
+def _registro(modelo, objeto_id, accion, cambios):
+    return {
+        "modelo": modelo._meta.concrete_model._meta.model_name,
+        "objeto_id": objeto_id,
+        "accion": accion,
+        "usuario_id": _usuario_actual(),
+        "fecha": timezone.now().isoformat(),
+        "cambios": cambios,
+    }
+
+
+def escribir_registros(registros, alias=None):
+    if not registros:
+        return
+    alias = alias or alias_principal()
+    if len(registros) > MAXIMO_DIRECTO:
+        from .tareas import encolar
+
+        encolar("registrar_auditoria", base=alias, registros=registros)
+    else:
+        insertar_registros(registros, alias)
+
+
+def insertar_registros(registros, alias=None):
+    from .models import RegistroAuditoria
+
+    alias = alias or alias_principal()
+    RegistroAuditoria.objects.using(alias).bulk_create(
+        [RegistroAuditoria(**registro) for registro in registros], batch_size=TAMAÑO_LOTE
+    )
+    # El listado del registro cachea el conteo y los filtros con esta etiqueta
+    invalidar(RegistroAuditoria, using=alias)
+
+
+def anotar_altas(objetos, using=None):
+    """Audita objetos creados con ``bulk_create``, que no emite señales."""
+    if _desactivada.get() or not objetos:
+        return
+    campos = _campos(type(objetos[0]))
+    _anotar([
+        _registro(type(obj), obj.pk, "A", {
+            c.attname: [None, _valor(getattr(obj, c.attname))]
+            for c in campos if getattr(obj, c.attname) not in (None, "")
+        })
+        for obj in objetos
+    ], using)
+
+
+def anotar_modificaciones(modelo, anteriores, nuevos, using=None):
+    """Audita un UPDATE por conjuntos.
+
+    ``anteriores`` y ``nuevos`` son ``{pk: {campo: valor}}`` con los valores
+    leídos antes del UPDATE y los que el UPDATE asignó.
+    """
+    if _desactivada.get():
+        return
+    registros = []
+    for pk, valores in anteriores.items():
+        diferencias = {
+            campo: [_valor(valores.get(campo)), _valor(nuevo)]
+            for campo, nuevo in nuevos[pk].items() if valores.get(campo) != nuevo
+        }
+        if diferencias:
+            registros.append(_registro(modelo, pk, "M", diferencias))
+    _anotar(registros, using)
+
+
+def _antes_de_guardar(sender, instance, raw=False, using=None, update_fields=None, **kwargs):
+    instance._auditoria_anterior = None
+    if raw or _desactivada.get() or instance._state.adding or instance.pk is None:
+        return
+    campos = [c.attname for c in _campos(sender) if update_fields is None or c.name in update_fields]
+    instance._auditoria_anterior = (
+        sender._base_manager.using(using).filter(pk=instance.pk).values(*campos).first()
+    )
+
+
+def _despues_de_guardar(sender, instance, created, raw=False, using=None, **kwargs):
+    if raw or _desactivada.get():
+        return
+    if created:
+        anotar_altas([instance], using=using)
+        return
+    anteriores = getattr(instance, "_auditoria_anterior", None)
+    if not anteriores:
+        return
+    campos = {c.attname: c for c in _campos(sender)}
+    cambios = {}
+    for attname, anterior in anteriores.items():
+        actual = getattr(instance, attname)
+        if _comparable(campos[attname], actual) != anterior:
+            cambios[attname] = [_valor(anterior), _valor(_comparable(campos[attname], actual))]
+    if cambios:
+        _anotar([_registro(sender, instance.pk, "M", cambios)], using)
+
+
+def _despues_de_borrar(sender, instance, using=None, **kwargs):
+    if _desactivada.get():
+        return
+    _anotar([_registro(sender, instance.pk, "B", {
+        c.attname: [_valor(getattr(instance, c.attname)), None]
+        for c in _campos(sender) if getattr(instance, c.attname) not in (None, "")
+    })], using)
+
+
+def conectar():
+    # Solo los modelos concretos: los proxy del archivo emiten señales con su
+    # propia clase y no se auditan.
+    for nombre in MODELOS_AUDITADOS:
+        modelo = registro_apps.get_model("apps", nombre)
+        pre_save.connect(_antes_de_guardar, sender=modelo, dispatch_uid=f"auditoria_pre_{nombre}")
+        post_save.connect(_despues_de_guardar, sender=modelo, dispatch_uid=f"auditoria_post_{nombre}")
+        post_delete.connect(_despues_de_borrar, sender=modelo, dispatch_uid=f"auditoria_borrar_{nombre}")
+
+
+def historial(modelo, objeto_id, antes=None, limite=ENTRADAS_POR_PAGINA):
+    """Entradas de un objeto, de la más reciente a la más antigua, paginadas por id."""
+    from .models import RegistroAuditoria
+
+    consulta = RegistroAuditoria.objects.filter(
+        modelo=modelo._meta.concrete_model._meta.model_name, objeto_id=objeto_id
+    )
+    if antes:
+        consulta = consulta.filter(id__lt=antes)
+    return list(consulta.select_related("usuario").order_by("-id")[:limite])
+
+
+class HistorialAuditoriaMixin:
+    """Sustituye el historial de LogEntry del admin por el de ``RegistroAuditoria``."""
+
+    object_history_template = "admin/apps/historial_auditoria.html"
+
+    def history_view(self, request, object_id, extra_context=None):
+        obj = self.get_object(request, unquote(object_id))
+        if obj is None:
+            return self._get_obj_does_not_exist_redirect(request, self.opts, object_id)
+        if not self.has_view_or_change_permission(request, obj):
+            raise PermissionDenied
+
+        antes = request.GET.get("antes")
+        entradas = historial(self.model, obj.pk, antes if antes and antes.isdigit() else None,
+                             ENTRADAS_POR_PAGINA + 1)
+        hay_mas = len(entradas) > ENTRADAS_POR_PAGINA
+        entradas = entradas[:ENTRADAS_POR_PAGINA]
+
+        nombres = {c.attname: str(c.verbose_name).rstrip(":") for c in _campos(self.model)}
+        context = {
+            **self.admin_site.each_context(request),
+            "title": f"Historial: {obj}",
+            "subtitle": None,
+            "object": obj,
+            "opts": self.opts,
+            "module_name": str(self.opts.verbose_name_plural),
+            "entradas": [
+                {
+                    "registro": entrada,
+                    "cambios": [
+                        (nombres.get(campo, campo), antes_, despues)
+                        for campo, (antes_, despues) in entrada.cambios.items()
+                    ],
+                }
+                for entrada in entradas
+            ],
+            "siguiente": entradas[-1].id if hay_mas else None,
+            "preserved_filters": self.get_preserved_filters(request),
+            **(extra_context or {}),
+        }
+        request.current_app = self.admin_site.name
+        return TemplateResponse(request, self.object_history_template, context)
@@ -0,0 +1,170 @@
+"""
+Ficheros de lote para el banco con las transferencias emitidas.
+
+``reservar_lote`` marca con un identificador de lote, en un único UPDATE
+condicionado a que aún no tengan lote, las operaciones en tránsito de
+solicitudes por transferencia; las ya exportadas o que otra petición marcó a
+la vez quedan fuera, así que ninguna operación sale en dos lotes.
+``lineas_lote`` genera el fichero de un lote ya marcado leyendo sus
+operaciones en una sola consulta, por lo que se puede enviar por streaming y
+volver a descargar igual más adelante.
+
+Formatos:
+
+``ancho_fijo`` (ASCII, registros de 112 caracteres terminados en CRLF)
+    Cabecera ``C``: lote (20), fecha AAAAMMDD, cuenta de la empresa (20).
+    Detalle ``D``: secuencia (6), cuenta del beneficiario (20, con ceros a la
+    izquierda), importe en centavos (15), beneficiario (40), referencia (30).
+    Control ``T``: cantidad (6), total en centavos (18), suma de control (20).
+``csv`` (UTF-8, separado por ``;``)
+    Una fila por operación y una fila final ``TOTAL`` con los mismos controles.
+
+La suma de control es la suma de los números de cuenta de los beneficiarios,
+módulo 10^20.
+"""
+import csv
+import io
+import itertools
+import secrets
+import unicodedata
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from .auditoria import anotar_modificaciones
+from .cache_etiquetas import invalidar
+from .empresas import alias_principal
+from .models import OperacionesEmitidas
+
+FORMATOS = {"ancho_fijo": "txt", "csv": "csv"}
+LARGO_CUENTA = 20
+LARGO_REGISTRO = 112
+MODULO_CONTROL = 10 ** LARGO_CUENTA
+TAMAÑO_LECTURA = 2000
+
+COLUMNAS = ("pk", "numero_operacion", "importe_emitido", "solicitud__numero_de_H90",
+            "solicitud__cuenta_bancaria", "solicitud__nombre_del_proveedor", "solicitud__cuenta_de_empresa")
+
+
+class ErrorLote(Exception):
+    """El lote no se puede generar; el mensaje es para el usuario."""
+
+
+def exportables():
+    """Operaciones que pueden ir en un lote nuevo."""
+    return OperacionesEmitidas.objects.filter(
+        lote_banco__isnull=True, estado="Tránsito", solicitud__forma_de_pago="Transferencia"
+    )
+
+
+def _cuenta(valor):
+    cuenta = (valor or "").replace(" ", "").replace("-", "")
+    return cuenta if cuenta.isdigit() and len(cuenta) <= LARGO_CUENTA else None
+
+
+def _texto(valor, largo):
+    # El formato de ancho fijo solo admite ASCII en mayúsculas
+    ascii_ = unicodedata.normalize("NFKD", valor or "").encode("ascii", "ignore").decode()
+    return " ".join(ascii_.upper().split())[:largo].ljust(largo)
+
+
+def _centavos(importe):
+    return int((importe or Decimal(0)) * 100)
+
+
+def _lote_nuevo():
+    # Dentro de la transacción del UPDATE, para que nadie use el mismo entre medias
+    while True:
+        lote = f"{timezone.localtime():%Y%m%d%H%M%S}-{secrets.token_hex(2).upper()}"
+        if not OperacionesEmitidas.objects.filter(lote_banco=lote).exists():
+            return lote
+
+
+def reservar_lote(ids):
+    """Marca con un lote nuevo las operaciones exportables de ``ids``; devuelve ``(lote, cantidad)``.
+
+    Las operaciones deben ser de una misma cuenta de empresa y tener la cuenta
+    bancaria y el nombre del beneficiario válidos; si no, no marca ninguna.
+    """
+    candidatas = exportables().filter(pk__in=ids)
+    filas = list(candidatas.values_list("pk", "solicitud__numero_de_H90", "solicitud__cuenta_bancaria",
+                                        "solicitud__nombre_del_proveedor", "solicitud__cuenta_de_empresa"))
+    if not filas:
+        raise ErrorLote("Ninguna de las operaciones seleccionadas es una transferencia en tránsito sin exportar.")
+    if len({f[4] for f in filas}) > 1:
+        raise ErrorLote("Un lote solo puede llevar operaciones de una misma cuenta de la empresa.")
+    invalidas = [
+        f"H90 N° {h90}" for _, h90, cuenta, nombre, _ in filas if not _cuenta(cuenta) or not (nombre or "").strip()
+    ]
+    if invalidas:
+        raise ErrorLote("Cuenta bancaria o beneficiario no válidos en: " + ", ".join(invalidas[:10]))
+
+    with transaction.atomic(using=alias_principal()):
+        lote = _lote_nuevo()
+        # Condicionado a que sigan sin lote: lo que otra petición ya marcó queda fuera
+        candidatas.update(lote_banco=lote)
+        marcadas = list(OperacionesEmitidas.objects.filter(lote_banco=lote).values_list("pk", flat=True))
+        if not marcadas:
+            raise ErrorLote("Las operaciones seleccionadas se exportaron mientras tanto.")
+        anotar_modificaciones(
+            OperacionesEmitidas, {pk: {"lote_banco": None} for pk in marcadas}, {pk: {"lote_banco": lote} for pk in marcadas}
+        )
+        invalidar(OperacionesEmitidas)
+    return lote, len(marcadas)
+
+
+def _operaciones(lote):
+    filas = OperacionesEmitidas.objects.filter(lote_banco=lote).order_by("pk").values_list(*COLUMNAS)
+    return filas.iterator(chunk_size=TAMAÑO_LECTURA)
+
+
+def _linea_csv():
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer, delimiter=";", lineterminator="\r\n")
+
+    def linea(*valores):
+        escritor.writerow(valores)
+        texto = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return texto
+    return linea
+
+
+def lineas_lote(lote, formato="ancho_fijo"):
+    """Genera las líneas del fichero del lote, calculando los controles mientras lee."""
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato desconocido: {formato}.")
+    filas = _operaciones(lote)
+    primera = next(filas, None)
+    if primera is None:
+        raise ErrorLote(f"No existe el lote {lote}.")
+    cuenta_empresa = primera[6]
+    linea_csv = _linea_csv()
+
+    if formato == "csv":
+        yield linea_csv("lote", "cuenta_empresa", "secuencia", "h90", "cuenta_beneficiario",
+                        "beneficiario", "importe", "referencia")
+    else:
+        # La fecha es la del lote, para que volver a descargarlo dé el mismo fichero
+        yield f"C{lote:<20.20}{lote[:8]}{_texto(cuenta_empresa, 20)}".ljust(LARGO_REGISTRO) + "\r\n"
+
+    cantidad = centavos = control = 0
+    for fila in itertools.chain([primera], filas):
+        _, referencia, importe, h90, cuenta, beneficiario, _ = fila
+        cuenta = _cuenta(cuenta)
+        cantidad += 1
+        centavos += _centavos(importe)
+        control = (control + int(cuenta)) % MODULO_CONTROL
+        if formato == "csv":
+            yield linea_csv(lote, cuenta_empresa, cantidad, h90, cuenta, (beneficiario or "").strip(),
+                            f"{importe:.2f}", referencia)
+        else:
+            yield (f"D{cantidad:06d}{cuenta:0>{LARGO_CUENTA}}{_centavos(importe):015d}"
+                   f"{_texto(beneficiario, 40)}{_texto(referencia, 30)}\r\n")
+
+    if formato == "csv":
+        yield linea_csv("TOTAL", cuenta_empresa, cantidad, "", "", "", f"{Decimal(centavos) / 100:.2f}", control)
+    else:
+        yield f"T{cantidad:06d}{centavos:018d}{control:020d}".ljust(LARGO_REGISTRO) + "\r\n"
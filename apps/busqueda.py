@@ -0,0 +1,162 @@
+"""
+Búsqueda de texto completo en las solicitudes de pago.
+
+La migración 0042 crea en cada base SQLite de empresa el índice FTS5
+``apps_busqueda_solicitudes``, con una fila por solicitud (``rowid`` es su
+id): número de H90, datos del proveedor, conceptos normales con sus números
+y descripción. Lo mantienen al día triggers sobre las solicitudes, los
+conceptos normales y el nombre del proveedor, de modo que también recoge las
+escrituras por conjuntos.
+
+Los triggers nombran varias tablas, y SQLite no deja reconstruir una tabla
+(``AlterField``, ``RemoveField``) a la que se refiere el trigger de otra; al
+reconstruirla, además, se pierden los suyos. Por eso no los crea la
+migración: se borran antes de cada ``migrate`` que aplique migraciones y se
+vuelven a crear al terminar, reconstruyendo el índice con lo escrito
+mientras tanto.
+
+Cada palabra buscada se busca como prefijo y deben aparecer todas. Las bases
+de archivo no tienen índice; en ellas el admin busca con ``search_fields``.
+"""
+import re
+
+from django.db import connections
+from django.db.models.signals import post_migrate, pre_migrate
+from django.db.models.expressions import RawSQL
+
+from .cache_etiquetas import TABLAS_DERIVADAS, etiqueta
+from .models import Proveedores, SolicitudesDePago, ConceptoNormal
+
+TABLA = "apps_busqueda_solicitudes"
+TABLAS_DERIVADAS[TABLA] = tuple(etiqueta(m) for m in (SolicitudesDePago, ConceptoNormal, Proveedores))
+
+_con_indice = set()
+
+
+def _indexar(donde):
+    return f"""
+        INSERT INTO {TABLA}(rowid, h90, proveedor, conceptos, descripcion)
+        SELECT s.id,
+               s.numero_de_H90,
+               coalesce(p.ident_del_prov, '') || ' ' || coalesce(s.nombre_del_proveedor, '') || ' '
+                   || coalesce(s.codigo_del_proveedor, '') || ' ' || coalesce(s.cuenta_bancaria, ''),
+               (SELECT group_concat(c.concepto || ' ' || coalesce(c.numero, ''), ' ')
+                  FROM apps_conceptonormal c WHERE c.solicitud_id = s.id),
+               coalesce(s.descripcion, '')
+          FROM apps_solicitudesdepago s
+          LEFT JOIN apps_proveedores p ON p.id = s.identificador_del_proveedor_id
+         WHERE {donde};"""
+
+
+# Triggers y no señales: los servicios y los inlines escriben por conjuntos
+TRIGGERS = {
+    "solicitud_ai": ("INSERT ON apps_solicitudesdepago", _indexar("s.id = NEW.id")),
+    "solicitud_au": (
+        "UPDATE OF numero_de_H90, identificador_del_proveedor_id, nombre_del_proveedor, codigo_del_proveedor, "
+        "cuenta_bancaria, descripcion ON apps_solicitudesdepago",
+        f"DELETE FROM {TABLA} WHERE rowid = OLD.id;" + _indexar("s.id = NEW.id"),
+    ),
+    "solicitud_ad": ("DELETE ON apps_solicitudesdepago", f"DELETE FROM {TABLA} WHERE rowid = OLD.id;"),
+    "concepto_ai": (
+        "INSERT ON apps_conceptonormal",
+        f"DELETE FROM {TABLA} WHERE rowid = NEW.solicitud_id;" + _indexar("s.id = NEW.solicitud_id"),
+    ),
+    "concepto_au": (
+        "UPDATE OF solicitud_id, concepto, numero ON apps_conceptonormal",
+        f"DELETE FROM {TABLA} WHERE rowid IN (OLD.solicitud_id, NEW.solicitud_id);"
+        + _indexar("s.id IN (OLD.solicitud_id, NEW.solicitud_id)"),
+    ),
+    "concepto_ad": (
+        "DELETE ON apps_conceptonormal",
+        f"DELETE FROM {TABLA} WHERE rowid = OLD.solicitud_id;" + _indexar("s.id = OLD.solicitud_id"),
+    ),
+    "proveedor_au": (
+        "UPDATE OF ident_del_prov ON apps_proveedores",
+        f"DELETE FROM {TABLA} WHERE rowid IN "
+        f"(SELECT id FROM apps_solicitudesdepago WHERE identificador_del_proveedor_id = NEW.id);"
+        + _indexar("s.identificador_del_proveedor_id = NEW.id"),
+    ),
+}
+
+
+def _tiene_indice(conexion):
+    return conexion.vendor == "sqlite" and TABLA in conexion.introspection.table_names()
+
+
+def disponible(alias):
+    """Si la base tiene el índice (no lo tienen las de archivo ni las aún sin migrar)."""
+    if alias not in _con_indice:
+        if not _tiene_indice(connections[alias]):
+            return False
+        _con_indice.add(alias)
+    return True
+
+
+def borrar_triggers(conexion):
+    with conexion.cursor() as cursor:
+        for nombre in TRIGGERS:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {TABLA}_{nombre}")
+
+
+def crear_triggers(conexion):
+    with conexion.cursor() as cursor:
+        for nombre, (evento, cuerpo) in TRIGGERS.items():
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {TABLA}_{nombre} AFTER {evento} FOR EACH ROW BEGIN {cuerpo} END;"
+            )
+
+
+def reindexar(conexion):
+    with conexion.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLA}")
+        cursor.execute(_indexar("1"))
+
+
+def expresion(texto):
+    """Consulta FTS5: todas las palabras, cada una como prefijo."""
+    return " ".join(f'"{palabra}"*' for palabra in re.findall(r"\w+", texto))
+
+
+def h90_o_proveedor(texto):
+    """Consulta FTS5 del número de H90 exacto o de las palabras en los datos del proveedor."""
+    partes = []
+    if texto.strip().isdecimal():
+        partes.append(f'h90 : "{int(texto)}"')
+    palabras = expresion(texto)
+    if palabras:
+        partes.append(f"proveedor : ({palabras})")
+    return " OR ".join(partes)
+
+
+def coincidentes(consulta):
+    """Ids de las solicitudes que cumplen la consulta FTS5, como subconsulta."""
+    return RawSQL(f"SELECT rowid FROM {TABLA} WHERE {TABLA} MATCH %s", (consulta,))
+
+
+def filtrar(queryset, texto):
+    consulta = expresion(texto)
+    if not consulta:
+        return queryset
+    return queryset.filter(pk__in=coincidentes(consulta))
+
+
+def _antes_de_migrar(sender, using, plan=None, **kwargs):
+    conexion = connections[using]
+    if plan and conexion.vendor == "sqlite":
+        borrar_triggers(conexion)
+
+
+def _despues_de_migrar(sender, using, plan=None, **kwargs):
+    conexion = connections[using]
+    if not _tiene_indice(conexion):
+        _con_indice.discard(using)
+        return
+    crear_triggers(conexion)
+    # Sin plan es un flush, que tampoco vacía el índice
+    if plan is None or plan:
+        reindexar(conexion)
+
+
+def conectar(config):
+    pre_migrate.connect(_antes_de_migrar, sender=config, dispatch_uid="busqueda_antes_de_migrar")
+    post_migrate.connect(_despues_de_migrar, sender=config, dispatch_uid="busqueda_despues_de_migrar")
@@ -0,0 +1,168 @@
+"""
+Caché compartida con invalidación por etiquetas.
+
+Los valores derivados (años de los filtros, totales y conteos de los
+listados, datos de un proveedor...) se guardan con ``cacheado()`` bajo una
+clave que incluye la versión de cada etiqueta de la que dependen. Hay una
+etiqueta por tabla, de modo que un modelo proxy del archivo comparte la de
+su modelo concreto.
+
+Guardar o borrar un registro (señales ``post_save`` y ``post_delete``)
+cambia la versión de la etiqueta de su tabla; las operaciones por conjuntos
+(``update``, ``bulk_create``, ``bulk_update``) no emiten señales y llaman a
+``invalidar()`` explícitamente. Las claves con versiones antiguas ya no se
+consultan nunca y caducan solas. Dentro de una transacción las versiones se
+cambian al confirmarla, una sola vez por etiqueta; si se revierte, no se
+cambian. Cada empresa tiene sus propias claves (``empresas.clave_cache``).
+"""
+import re
+import threading
+import time
+from functools import lru_cache
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import CASCADE
+from django.db.models.signals import post_delete, post_save
+
+from .empresas import alias_principal
+
+DURACION = 60 * 60
+# Cambia con invalidar_todo(); forma parte de todas las claves
+ETIQUETA_GLOBAL = "*"
+
+# Modelos sin receptores de señales: las tareas y la auditoría cambian a
+# menudo y no se cachean. Los conceptos solo se escriben por conjuntos
+# (inlines del admin, servicios), que invalidan a mano; con un receptor de
+# post_delete, Django dejaría de borrarlos en cascada con un solo DELETE.
+MODELOS_SIN_SEÑALES = ("Tarea", "RegistroAuditoria", "ConceptoNormal", "ConceptoSalario")
+
+# Tablas sin modelo que la base mantiene a partir de tablas de apps (p. ej.
+# el índice de ``apps.busqueda``): las consultas que las usan dependen de
+# las etiquetas de sus tablas de origen. ``{tabla: (tablas de origen)}``
+TABLAS_DERIVADAS = {}
+
+_estado = threading.local()
+
+
+def etiqueta(modelo):
+    return modelo._meta.concrete_model._meta.db_table
+
+
+@lru_cache(maxsize=None)
+def _tablas():
+    from django.apps import apps
+
+    return frozenset(m._meta.db_table for m in apps.get_app_config("apps").get_models())
+
+
+def etiquetas_de_consulta(queryset):
+    """Etiquetas de todas las tablas que usa la consulta, incluidas las de sus subconsultas."""
+    sql, _ = queryset.query.sql_with_params()
+    palabras = set(re.findall(r"\w+", sql))
+    for tabla in palabras.intersection(TABLAS_DERIVADAS):
+        palabras.update(TABLAS_DERIVADAS[tabla])
+    return _tablas().intersection(palabras)
+
+
+def _clave_version(nombre):
+    # Las tablas que no son de apps (usuarios) son comunes a todas las empresas.
+    # Las etiquetas de parte de una tabla son "<tabla>:<parte>".
+    if nombre == ETIQUETA_GLOBAL or nombre.partition(":")[0] in _tablas():
+        return f"version:{nombre}"
+    return f"comun:version:{nombre}"
+
+
+def _nueva_version():
+    # Única aunque la caché se vacíe: nunca se reutiliza una versión antigua
+    return time.time_ns()
+
+
+def versiones(etiquetas):
+    nombres = sorted({ETIQUETA_GLOBAL, *etiquetas})
+    claves = [_clave_version(nombre) for nombre in nombres]
+    actuales = cache.get_many(claves)
+    for clave in claves:
+        if clave not in actuales:
+            cache.add(clave, _nueva_version(), None)
+            actuales[clave] = cache.get(clave)
+    return [actuales[clave] for clave in claves]
+
+
+def clave_versionada(clave, etiquetas):
+    """La clave con las versiones actuales de las etiquetas: cambia al invalidar cualquiera."""
+    return f"{clave}:{'.'.join(str(v) for v in versiones(etiquetas))}"
+
+
+def cacheado(clave, etiquetas, calcular, duracion=DURACION):
+    """``calcular()`` cacheado mientras no cambie ninguna de las ``etiquetas``."""
+    return cache.get_or_set(clave_versionada(clave, etiquetas), calcular, duracion)
+
+
+def _cambiar_versiones(etiquetas):
+    cache.set_many({_clave_version(nombre): _nueva_version() for nombre in etiquetas}, None)
+
+
+class _Pendientes:
+    """Etiquetas a invalidar al confirmar la transacción en curso."""
+
+    def __init__(self):
+        self.etiquetas = set()
+
+    def __call__(self):
+        etiquetas, self.etiquetas = self.etiquetas, set()
+        _cambiar_versiones(etiquetas)
+
+
+def _pendientes(alias):
+    conexion = transaction.get_connection(alias)
+    if not conexion.in_atomic_block:
+        return None
+    todas = _estado.__dict__.setdefault("pendientes", {})
+    pendientes = todas.get(alias)
+    # Como en auditoria._lote_activo: si la transacción anterior se revirtió,
+    # su callback se descartó y se empieza otro.
+    if pendientes is None or not any(p[1] is pendientes for p in conexion.run_on_commit):
+        pendientes = todas[alias] = _Pendientes()
+        transaction.on_commit(pendientes, using=alias)
+    return pendientes
+
+
+def invalidar(*modelos, using=None):
+    """Invalida lo cacheado que depende de los modelos, al confirmar la transacción."""
+    invalidar_etiquetas({etiqueta(modelo) for modelo in modelos}, using=using)
+
+
+def invalidar_etiquetas(etiquetas, using=None):
+    pendientes = _pendientes(using or alias_principal())
+    if pendientes is None:
+        _cambiar_versiones(etiquetas)
+    else:
+        pendientes.etiquetas.update(etiquetas)
+
+
+def invalidar_todo():
+    """Invalida toda la caché derivada, p. ej. tras restaurar una copia de la base."""
+    _cambiar_versiones([ETIQUETA_GLOBAL])
+
+
+def _al_guardar(sender, using=DEFAULT_DB_ALIAS, raw=False, **kwargs):
+    if not raw:
+        invalidar(sender, using=using)
+
+
+def _al_borrar(sender, using=DEFAULT_DB_ALIAS, **kwargs):
+    # También las tablas que se borran en cascada sin señales (conceptos)
+    relacionados = [rel.related_model for rel in sender._meta.related_objects if rel.on_delete is CASCADE]
+    invalidar(sender, *relacionados, using=using)
+
+
+def conectar():
+    from django.apps import apps
+
+    for modelo in apps.get_app_config("apps").get_models():
+        if modelo.__name__ in MODELOS_SIN_SEÑALES:
+            continue
+        uid = f"cache_{modelo.__name__}"
+        post_save.connect(_al_guardar, sender=modelo, dispatch_uid=f"{uid}_guardar")
+        post_delete.connect(_al_borrar, sender=modelo, dispatch_uid=f"{uid}_borrar")
@@ -0,0 +1,49 @@
+"""
+Reglas de los conceptos de pago de una solicitud.
+
+Las comparten los formsets del admin, la API y los importadores, de modo que
+una solicitud se valida y se totaliza igual venga de donde venga.
+"""
+from django.core.exceptions import ValidationError
+
+
+def validar_conceptos_normales(conceptos):
+    """``conceptos``: lista con el valor del campo ``concepto`` de cada fila."""
+    if len(set(conceptos)) > 1:
+        raise ValidationError("En conceptos normales, todos deben ser iguales.")
+
+
+def validar_conceptos_salario(numeros, forma_de_pago):
+    """``numeros``: lista con el valor del campo ``numero`` de cada fila."""
+    if any(numeros):
+        raise ValidationError("En conceptos de salario, el campo Número debe quedar vacío.")
+    if forma_de_pago != "Cheque":
+        raise ValidationError("Cuando se registran conceptos de salario, la forma de pago debe ser Cheque.")
+
+
+def validar_tablas_conceptos(hay_normales, hay_salarios):
+    if hay_normales == hay_salarios:
+        raise ValidationError("No puede dejar llenas ni vacías ambas tablas. Solo una puede contener datos.")
+
+
+def calcular_importe(normales, salarios):
+    """Importe total a partir de pares ``(concepto, importe)``.
+
+    Devuelve ``(total, mensaje)``; ``mensaje`` explica por qué el total es 0
+    cuando los conceptos no permiten sumarlo.
+    """
+    if normales and salarios:
+        return 0, "No se pueden guardar datos en ambas tablas a la vez."
+
+    if normales:
+        primer_concepto = normales[0][0]
+        if primer_concepto == "Ninguno":
+            return sum(importe for _, importe in normales), None
+        if all(concepto == primer_concepto for concepto, _ in normales):
+            return sum(importe for _, importe in normales), None
+        return 0, "Los conceptos normales son distintos, no se realizó la suma."
+
+    if salarios:
+        return sum(importe for _, importe in salarios), None
+
+    return 0, "Debe existir al menos un concepto en alguna tabla."
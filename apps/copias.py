@@ -0,0 +1,194 @@
+"""
+Copias de seguridad en caliente de las bases de datos SQLite.
+
+La copia usa la API de backup de SQLite copiando unas pocas páginas por
+paso, con una pausa entre pasos, dentro de una transacción de lectura que
+se mantiene abierta (``BEGIN``) toda la copia. En modo WAL esa transacción
+fija una instantánea: la copia es el estado de la base al empezar, y el
+admin y el trabajador de tareas siguen leyendo y escribiendo mientras tanto
+sin que la copia tenga que volver a empezar. A cambio, mientras dura no se
+puede completar ningún checkpoint del WAL, que crece con lo escrito durante
+la copia. Cada copia se verifica con ``PRAGMA integrity_check`` antes de
+comprimirla con gzip, y solo se conservan las más recientes.
+"""
+import gzip
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils import timezone
+
+from .cache_etiquetas import invalidar_todo
+
+# Páginas por paso: con páginas de 4 KiB son 1 MiB, unos pocos milisegundos
+PAGINAS_POR_PASO = 256
+# Pausa entre pasos para dejar pasar a los escritores
+PAUSA_ENTRE_PASOS = 0.005
+COPIAS_A_CONSERVAR = 14
+TAMAÑO_BLOQUE = 1024 * 1024
+# Segundos de espera por el bloqueo de escritura, como en DATABASES
+ESPERA_BLOQUEO = 20
+
+
+class ErrorCopia(Exception):
+    pass
+
+
+@dataclass
+class ResultadoCopia:
+    ruta: Path
+    paginas: int = 0
+    pasos: int = 0
+    duracion: float = 0.0
+    tiempos_paso: list = field(default_factory=list, repr=False)
+
+    @property
+    def paso_maximo_ms(self):
+        return max(self.tiempos_paso, default=0) * 1000
+
+    @property
+    def paso_medio_ms(self):
+        return sum(self.tiempos_paso) / len(self.tiempos_paso) * 1000 if self.tiempos_paso else 0
+
+    @property
+    def tamaño(self):
+        return self.ruta.stat().st_size
+
+
+def directorio_copias():
+    return Path(getattr(settings, "DIRECTORIO_COPIAS", Path(settings.BASE_DIR) / "copias"))
+
+
+def _ruta_base(alias):
+    configuracion = settings.DATABASES.get(alias)
+    if configuracion is None:
+        raise ErrorCopia(f"No existe la base de datos '{alias}'.")
+    if connections[alias].vendor != "sqlite":
+        raise ErrorCopia(f"La base de datos '{alias}' no es SQLite.")
+    return Path(configuracion["NAME"])
+
+
+def _conectar(ruta):
+    return sqlite3.connect(str(ruta), timeout=ESPERA_BLOQUEO)
+
+
+def verificar_integridad(ruta):
+    conexion = sqlite3.connect(f"file:{ruta}?mode=ro", uri=True)
+    try:
+        filas = conexion.execute("PRAGMA integrity_check").fetchall()
+    finally:
+        conexion.close()
+    mensajes = [fila[0] for fila in filas]
+    if mensajes != ["ok"]:
+        raise ErrorCopia("La copia está dañada: " + "; ".join(mensajes[:10]))
+
+
+def _copiar_por_pasos(origen, destino, paginas, pausa, resultado, progreso=None):
+    ultimo = time.perf_counter()
+
+    def al_avanzar(estado, restantes, total):
+        nonlocal ultimo
+        ahora = time.perf_counter()
+        # El tiempo entre dos avisos es el paso más la pausa
+        resultado.tiempos_paso.append(max(ahora - ultimo - pausa, 0))
+        resultado.pasos += 1
+        resultado.paginas = total
+        ultimo = ahora
+        if progreso:
+            progreso(total - restantes, total)
+
+    conexion_origen, conexion_destino = _conectar(origen), sqlite3.connect(str(destino))
+    try:
+        # Una transacción de lectura abierta fija la instantánea (en WAL no
+        # bloquea a los escritores); sin ella, cada escritura de otra conexión
+        # obligaría a reiniciar la copia y con escrituras frecuentes no
+        # terminaría nunca.
+        conexion_origen.execute("BEGIN")
+        conexion_origen.execute("SELECT count(*) FROM sqlite_master").fetchone()
+        conexion_origen.backup(conexion_destino, pages=paginas, progress=al_avanzar, sleep=pausa)
+        # La copia hereda el modo WAL del origen; como fichero suelto no lo necesita
+        conexion_destino.execute("PRAGMA journal_mode=DELETE")
+    finally:
+        conexion_destino.close()
+        conexion_origen.close()
+
+
+def rotar(directorio, prefijo, conservar):
+    copias = sorted(directorio.glob(f"{prefijo}-*.sqlite3.gz"), reverse=True)
+    for antigua in copias[conservar:]:
+        antigua.unlink()
+    return copias[conservar:]
+
+
+def hacer_copia(alias=DEFAULT_DB_ALIAS, directorio=None, paginas=PAGINAS_POR_PASO,
+                pausa=PAUSA_ENTRE_PASOS, conservar=COPIAS_A_CONSERVAR, progreso=None):
+    """Copia, verifica, comprime y rota. Devuelve un ``ResultadoCopia``."""
+    origen = _ruta_base(alias)
+    if not origen.exists():
+        raise ErrorCopia(f"No existe el fichero {origen}.")
+    directorio = Path(directorio) if directorio else directorio_copias()
+    directorio.mkdir(parents=True, exist_ok=True)
+
+    prefijo = origen.stem
+    final = directorio / f"{prefijo}-{timezone.localtime():%Y%m%d-%H%M%S}.sqlite3.gz"
+    resultado = ResultadoCopia(ruta=final)
+    inicio = time.perf_counter()
+
+    descriptor, temporal = tempfile.mkstemp(suffix=".sqlite3", dir=directorio)
+    os.close(descriptor)
+    temporal = Path(temporal)
+    parcial = final.with_name(final.name + ".part")
+    try:
+        _copiar_por_pasos(origen, temporal, paginas, pausa, resultado, progreso)
+        verificar_integridad(temporal)
+        with open(temporal, "rb") as entrada, gzip.open(parcial, "wb", compresslevel=6) as salida:
+            shutil.copyfileobj(entrada, salida, TAMAÑO_BLOQUE)
+        os.replace(parcial, final)
+    finally:
+        temporal.unlink(missing_ok=True)
+        parcial.unlink(missing_ok=True)
+
+    resultado.duracion = time.perf_counter() - inicio
+    rotar(directorio, prefijo, conservar)
+    return resultado
+
+
+def restaurar_copia(ruta, alias=DEFAULT_DB_ALIAS):
+    """Sustituye el contenido de la base por el de la copia, tras verificarla.
+
+    La restauración se hace también con la API de backup, de modo que las
+    conexiones abiertas ven el cambio completo o nada.
+    """
+    ruta = Path(ruta)
+    if not ruta.exists():
+        raise ErrorCopia(f"No existe el fichero {ruta}.")
+    destino = _ruta_base(alias)
+
+    descriptor, temporal = tempfile.mkstemp(suffix=".sqlite3", dir=destino.parent)
+    os.close(descriptor)
+    temporal = Path(temporal)
+    try:
+        abrir = gzip.open if ruta.suffix == ".gz" else open
+        try:
+            with abrir(ruta, "rb") as entrada, open(temporal, "wb") as salida:
+                shutil.copyfileobj(entrada, salida, TAMAÑO_BLOQUE)
+        except (OSError, EOFError) as e:
+            raise ErrorCopia(f"No se pudo descomprimir {ruta}: {e}")
+        verificar_integridad(temporal)
+
+        connections[alias].close()
+        conexion_copia, conexion_destino = sqlite3.connect(str(temporal)), _conectar(destino)
+        try:
+            conexion_copia.backup(conexion_destino)
+        finally:
+            conexion_destino.close()
+            conexion_copia.close()
+        invalidar_todo()
+    finally:
+        temporal.unlink(missing_ok=True)
@@ -0,0 +1,203 @@
+"""
+Varias empresas en un mismo despliegue.
+
+Cada empresa de ``settings.EMPRESAS`` lleva su contabilidad en su propia base
+SQLite (alias igual a su clave) y archiva sus ejercicios cerrados en
+``<clave>_archivo``; la empresa principal sigue usando ``default`` y
+``archivo``. Los usuarios, las sesiones y el historial del admin son comunes
+y están siempre en ``default``.
+
+``MiddlewareEmpresa`` elige la empresa de cada petición por el subdominio
+(``<clave>.servidor``) o, si no lo hay, por la elegida en la sesión desde
+``/admin/empresa/``, y la activa con ``usar_empresa()`` mientras dura la
+petición. Cada usuario trabaja en la empresa principal y en las empresas de
+cuyo grupo (``Empresa: <clave>``, creado al migrar) es miembro; los
+superusuarios, en todas. Con una empresa activa, ``routers.RouterEmpresas`` envía a su base
+los modelos de ``apps``, y ``clave_cache`` separa sus claves de caché. En los
+comandos se activa con ``python manage.py empresa <clave> <comando>``.
+"""
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.exceptions import PermissionDenied
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models.signals import post_migrate
+from django.shortcuts import redirect
+from django.urls import reverse
+from django.template.response import TemplateResponse
+
+ALIAS_ARCHIVO_PRINCIPAL = "archivo"
+SUFIJO_ARCHIVO = "_archivo"
+CLAVE_SESION = "empresa"
+# Claves de caché de datos comunes a todas las empresas (sesiones, usuarios)
+PREFIJOS_COMUNES = ("comun:", "django.contrib.sessions.")
+PREFIJO_GRUPO = "Empresa: "
+
+_estado = threading.local()
+
+
+def empresas():
+    """``{clave: nombre}`` de las empresas además de la principal."""
+    return getattr(settings, "EMPRESAS", {})
+
+
+def nombre_empresa(clave):
+    if clave is None:
+        return getattr(settings, "NOMBRE_EMPRESA_PRINCIPAL", "Empresa principal")
+    return empresas()[clave]
+
+
+def grupo_empresa(clave):
+    return f"{PREFIJO_GRUPO}{clave}"
+
+
+def empresas_de(usuario):
+    """Claves de las empresas, además de la principal, en las que trabaja el usuario."""
+    if not usuario.is_authenticated:
+        return set()
+    if usuario.is_superuser:
+        return set(empresas())
+    # Queda en el usuario, que apps.sesiones cachea
+    grupos = getattr(usuario, "_grupos_empresa", None)
+    if grupos is None:
+        grupos = usuario._grupos_empresa = set(
+            usuario.groups.filter(name__startswith=PREFIJO_GRUPO).values_list("name", flat=True)
+        )
+    return {clave for clave in empresas() if grupo_empresa(clave) in grupos}
+
+
+def puede_usar_empresa(usuario, clave):
+    return clave is None or clave in empresas_de(usuario)
+
+
+def empresa_actual():
+    """Clave de la empresa activa; ``None`` para la principal."""
+    return getattr(_estado, "empresa", None)
+
+
+@contextmanager
+def usar_empresa(clave):
+    if clave is not None and clave not in empresas():
+        raise ValueError(f"Empresa desconocida: {clave}.")
+    anterior = empresa_actual()
+    _estado.empresa = clave
+    try:
+        yield
+    finally:
+        _estado.empresa = anterior
+
+
+def alias_principal():
+    """Base con los datos de la empresa activa."""
+    return empresa_actual() or DEFAULT_DB_ALIAS
+
+
+def alias_archivo():
+    """Base de archivo de la empresa activa."""
+    return alias_archivo_de(alias_principal())
+
+
+def alias_archivo_de(alias):
+    """Base de archivo de la base principal ``alias``; ``None`` si no es la principal de ninguna empresa."""
+    if alias == DEFAULT_DB_ALIAS:
+        return ALIAS_ARCHIVO_PRINCIPAL
+    if es_base_de_empresa(alias):
+        return f"{alias}{SUFIJO_ARCHIVO}"
+    return None
+
+
+def es_base_de_empresa(alias):
+    return alias in empresas()
+
+
+def es_base_de_archivo(alias):
+    return alias == ALIAS_ARCHIVO_PRINCIPAL or (
+        alias.endswith(SUFIJO_ARCHIVO) and alias[:-len(SUFIJO_ARCHIVO)] in empresas()
+    )
+
+
+def clave_cache(key, key_prefix, version):
+    """``KEY_FUNCTION`` de la caché: las mismas claves no se comparten entre empresas."""
+    empresa = "" if key.startswith(PREFIJOS_COMUNES) else empresa_actual() or ""
+    return f"{key_prefix}:{version}:{empresa}:{key}"
+
+
+def _en_empresa(clave, contenido):
+    # Las respuestas por streaming se generan después de salir del middleware
+    with usar_empresa(clave):
+        yield from contenido
+
+
+class MiddlewareEmpresa:
+    """Va después de ``AuthenticationMiddleware``: comprueba que el usuario trabaje en la empresa."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def subdominio(self, request):
+        subdominio = request.get_host().partition(":")[0].split(".")[0]
+        return subdominio if subdominio in empresas() else None
+
+    def empresa_de(self, request):
+        subdominio = self.subdominio(request)
+        if subdominio:
+            return subdominio
+        clave = request.session.get(CLAVE_SESION)
+        return clave if clave in empresas() else None
+
+    def __call__(self, request):
+        # Sin leer la sesión: añadiría "Vary: Cookie" a los estáticos cacheados un año
+        if request.path.startswith(settings.STATIC_URL):
+            request.empresa = None
+            return self.get_response(request)
+        clave = self.empresa_de(request)
+        # Sin usuario (inicio de sesión, API con token) no se lee nada de la empresa aún
+        if request.user.is_authenticated and not puede_usar_empresa(request.user, clave):
+            # La empresa de la sesión se puede cambiar por otra desde la página de elegir empresa
+            if self.subdominio(request) or request.path != reverse("seleccionar_empresa"):
+                raise PermissionDenied("No trabaja en esta empresa.")
+            clave = None
+        request.empresa = clave
+        with usar_empresa(clave):
+            response = self.get_response(request)
+        if response.streaming:
+            response.streaming_content = _en_empresa(clave, response.streaming_content)
+        return response
+
+
+def seleccionar_empresa(request):
+    """Elige la empresa de la sesión; con subdominio, la empresa es la del subdominio."""
+    from django.contrib import admin
+
+    if request.method == "POST":
+        clave = request.POST.get("empresa") or None
+        if clave is not None and clave not in empresas():
+            messages.error(request, "Empresa desconocida.")
+        elif not puede_usar_empresa(request.user, clave):
+            raise PermissionDenied("No trabaja en esta empresa.")
+        else:
+            request.session[CLAVE_SESION] = clave
+            messages.success(request, f"Trabajando en {nombre_empresa(clave)}.")
+            return redirect("admin:index")
+    propias = empresas_de(request.user)
+    opciones = [(None, nombre_empresa(None)), *((c, n) for c, n in empresas().items() if c in propias)]
+    return TemplateResponse(request, "admin/empresa.html", {
+        **admin.site.each_context(request),
+        "title": "Empresa",
+        "opciones": [(clave or "", nombre, clave == request.empresa) for clave, nombre in opciones],
+    })
+
+
+def _crear_grupos(sender, using=DEFAULT_DB_ALIAS, **kwargs):
+    from django.contrib.auth.models import Group
+
+    if using != DEFAULT_DB_ALIAS:
+        return
+    for clave in empresas():
+        Group.objects.using(using).get_or_create(name=grupo_empresa(clave))
+
+
+def conectar(config):
+    post_migrate.connect(_crear_grupos, sender=config, dispatch_uid="empresas_crear_grupos")
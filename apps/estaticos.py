@@ -0,0 +1,116 @@
+"""
+Ficheros estáticos con huella y precomprimidos, servidos por la aplicación.
+
+``collectstatic`` con ``ManifestComprimido`` copia cada fichero con el hash de
+su contenido en el nombre (``custom.3f2a9c1b.css``) y, para los de texto,
+escribe a su lado las variantes ``.gz`` y, si está instalado ``brotli``,
+``.br``. Como el nombre cambia con el contenido, ``servir_estatico`` puede
+enviarlos con caché de un año: el navegador no vuelve a pedirlos hasta que
+cambian, y cuando los pide recibe la variante comprimida que acepte.
+"""
+import gzip
+import mimetypes
+import os
+from functools import lru_cache
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - opcional, sin él solo se genera .gz
+    brotli = None
+
+EXTENSIONES_COMPRIMIBLES = (".css", ".js", ".map", ".svg", ".json", ".txt", ".html", ".xml", ".ttf", ".eot", ".otf")
+# Por debajo de este tamaño la cabecera de compresión cuesta más de lo que ahorra
+TAMAÑO_MINIMO = 512
+# Solo se conserva la variante si ahorra al menos un 5 %
+PROPORCION_MAXIMA = 0.95
+
+CACHE_INMUTABLE = "public, max-age=31536000, immutable"
+# Ficheros pedidos por su nombre sin huella (p. ej. desde una URL antigua)
+CACHE_SIN_HUELLA = "public, max-age=3600"
+
+VARIANTES = (("br", ".br"), ("gzip", ".gz"))
+
+
+def _comprimir(ruta):
+    datos = ruta.read_bytes()
+    if len(datos) < TAMAÑO_MINIMO:
+        return []
+    variantes = {".gz": gzip.compress(datos, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variantes[".br"] = brotli.compress(datos, quality=11)
+    escritas = []
+    for extension, comprimido in variantes.items():
+        if len(comprimido) <= len(datos) * PROPORCION_MAXIMA:
+            destino = ruta.with_name(ruta.name + extension)
+            destino.write_bytes(comprimido)
+            escritas.append(destino)
+    return escritas
+
+
+class ManifestComprimido(ManifestStaticFilesStorage):
+    """Almacenamiento con huella que además precomprime los ficheros de texto."""
+
+    # jazzmin pide {% static %} de directorios (p. ej. vendor/bootswatch), que
+    # no están en el manifiesto: se sirven con su nombre, sin huella.
+    manifest_strict = False
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for nombre in sorted(set(self.hashed_files.values())):
+            if not nombre.lower().endswith(EXTENSIONES_COMPRIMIBLES):
+                continue
+            ruta = Path(self.path(nombre))
+            # El nombre con huella depende del contenido: si ya existe la
+            # variante de una ejecución anterior, sigue siendo válida.
+            if any(ruta.with_name(ruta.name + ext).exists() for _, ext in VARIANTES):
+                continue
+            for destino in _comprimir(ruta):
+                yield str(destino.relative_to(self.location)), str(destino.relative_to(self.location)), True
+
+
+@lru_cache(maxsize=1)
+def _nombres_con_huella():
+    # Sin ManifestComprimido (en desarrollo) no hay huellas: caché corta
+    return frozenset(getattr(staticfiles_storage, "hashed_files", {}).values())
+
+
+def _variante(ruta, aceptadas):
+    for codificacion, extension in VARIANTES:
+        if codificacion in aceptadas and os.path.exists(ruta + extension):
+            return ruta + extension, codificacion
+    return ruta, None
+
+
+def servir_estatico(request, ruta):
+    """Sirve un fichero de ``STATIC_ROOT`` con la variante comprimida que acepte el cliente."""
+    try:
+        completa = safe_join(settings.STATIC_ROOT, ruta)
+    except ValueError:
+        raise Http404
+    if not os.path.isfile(completa):
+        raise Http404
+
+    estado = os.stat(completa)
+    if not was_modified_since(request.META.get("HTTP_IF_MODIFIED_SINCE"), estado.st_mtime):
+        respuesta = HttpResponseNotModified()
+    else:
+        aceptadas = {c.split(";")[0].strip() for c in request.META.get("HTTP_ACCEPT_ENCODING", "").split(",")}
+        fichero, codificacion = _variante(completa, aceptadas)
+        tipo, _ = mimetypes.guess_type(completa)
+        respuesta = FileResponse(open(fichero, "rb"), content_type=tipo or "application/octet-stream")
+        if codificacion:
+            respuesta.headers["Content-Encoding"] = codificacion
+        respuesta.headers["Last-Modified"] = http_date(estado.st_mtime)
+    respuesta.headers["Vary"] = "Accept-Encoding"
+    respuesta.headers["Cache-Control"] = CACHE_INMUTABLE if ruta in _nombres_con_huella() else CACHE_SIN_HUELLA
+    return respuesta
@@ -0,0 +1,208 @@
+"""
+Registro anual de H90 en Excel.
+
+Una hoja por forma de pago y cuenta de empresa, con las solicitudes en
+orden de H90 y las filas de totales al final de cada hoja. El libro se
+escribe en modo ``write_only`` a partir de un único iterador ordenado por
+forma, cuenta y H90 (con los conceptos y operaciones cargados por bloques), de modo que la memoria no crece con la cantidad de
+solicitudes. Los ejercicios cerrados se leen también de la base de archivo.
+
+openpyxl se importa al generar el primer registro y no al arrancar: cuesta
+más de 100 ms y casi ningún proceso lo necesita.
+"""
+import heapq
+from collections import Counter, defaultdict
+from decimal import Decimal
+from itertools import islice
+
+from .archivo import bases_para_año
+from .models import SolicitudesDePago, ConceptoNormal, ConceptoSalario, OperacionesEmitidas
+
+TAMAÑO_ITERADOR = 2000
+FORMATO_IMPORTE = "#,##0.00"
+FORMATO_FECHA = "DD/MM/YYYY"
+
+COLUMNAS = (
+    ("H90", 8),
+    ("Fecha", 12),
+    ("Beneficiario", 40),
+    ("Código", 10),
+    ("Cuenta Bancaria", 20),
+    ("Conceptos", 40),
+    ("Descripción", 40),
+    ("Importe", 16),
+    ("Inversiones", 12),
+    ("Estado", 12),
+    ("Operación", 16),
+    ("Fecha de Emisión", 14),
+)
+
+
+class ErrorInforme(Exception):
+    pass
+
+
+CAMPOS = (
+    "pk", "numero_de_H90", "fecha_del_modelo", "forma_de_pago", "cuenta_de_empresa",
+    "nombre_del_proveedor", "codigo_del_proveedor", "cuenta_bancaria", "descripcion",
+    "importe_total", "inversiones", "estado",
+)
+
+
+def _por_solicitud(consulta, campos, ids):
+    agrupados = defaultdict(list)
+    for solicitud_id, *valores in consulta.filter(solicitud_id__in=ids).values_list("solicitud_id", *campos):
+        agrupados[solicitud_id].append(valores)
+    return agrupados
+
+
+def _solicitudes_del_año(año, alias):
+    """Filas del año en orden de forma, cuenta y H90, con sus conceptos y operaciones.
+
+    Se leen tuplas en lugar de modelos y los conceptos y las operaciones se
+    cargan con una consulta por bloque de ``TAMAÑO_ITERADOR`` solicitudes.
+    """
+    filas = (
+        SolicitudesDePago.objects.using(alias)
+        .filter(fecha_del_modelo__year=año)
+        .order_by("forma_de_pago", "cuenta_de_empresa", "numero_de_H90", "pk")
+        .values_list(*CAMPOS, named=True)
+        .iterator(chunk_size=TAMAÑO_ITERADOR)
+    )
+    normales = ConceptoNormal.objects.using(alias).order_by("pk")
+    salarios = ConceptoSalario.objects.using(alias).order_by("pk")
+    operaciones = OperacionesEmitidas.objects.using(alias).order_by("fecha_emision", "pk")
+    while True:
+        bloque = list(islice(filas, TAMAÑO_ITERADOR))
+        if not bloque:
+            return
+        ids = [fila.pk for fila in bloque]
+        conceptos_normales = _por_solicitud(normales, ("concepto", "numero"), ids)
+        conceptos_salarios = _por_solicitud(salarios, ("concepto",), ids)
+        emitidas = _por_solicitud(operaciones, ("numero_operacion", "fecha_emision"), ids)
+        for fila in bloque:
+            if conceptos_normales[fila.pk]:
+                conceptos = ", ".join(f"{c} {n}" if n else c for c, n in conceptos_normales[fila.pk])
+            else:
+                conceptos = ", ".join(c for c, in conceptos_salarios[fila.pk])
+            ultima = emitidas[fila.pk][-1] if emitidas[fila.pk] else (None, None)
+            yield fila, conceptos, ultima
+
+
+def _ordenadas(año):
+    iteradores = [_solicitudes_del_año(año, alias) for alias in bases_para_año(año)]
+    if len(iteradores) == 1:
+        return iteradores[0]
+    return heapq.merge(
+        *iteradores,
+        key=lambda s: (s[0].forma_de_pago, s[0].cuenta_de_empresa, s[0].numero_de_H90 or 0, s[0].pk),
+    )
+
+
+def _openpyxl():
+    try:
+        import openpyxl
+    except ImportError:  # pragma: no cover - solo hace falta para exportar a Excel
+        raise ErrorInforme("Para exportar a Excel instale openpyxl.")
+    return openpyxl
+
+
+def _celda(hoja, valor, formato=None, negrita=False):
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+
+    celda = WriteOnlyCell(hoja, value=valor)
+    if formato:
+        celda.number_format = formato
+    if negrita:
+        celda.font = Font(bold=True)
+    return celda
+
+
+class _Hoja:
+    def __init__(self, libro, forma, cuenta, año):
+        from openpyxl.utils import get_column_letter
+
+        self.hoja = libro.create_sheet(title=f"{forma[:13]} {cuenta[:11]}"[:31])
+        self.total = Decimal(0)
+        self.inversiones = Decimal(0)
+        self.por_estado = Counter()
+        self.importe_por_estado = Counter()
+        for indice, (_, ancho) in enumerate(COLUMNAS):
+            self.hoja.column_dimensions[get_column_letter(indice + 1)].width = ancho
+        self.hoja.append([_celda(self.hoja, f"Registro de H90 {año} - {forma} - {cuenta}", negrita=True)])
+        self.hoja.append([])
+        self.hoja.append([_celda(self.hoja, titulo, negrita=True) for titulo, _ in COLUMNAS])
+        self.fecha = _celda(self.hoja, None, FORMATO_FECHA)
+        self.importe = _celda(self.hoja, None, FORMATO_IMPORTE)
+        self.emision = _celda(self.hoja, None, FORMATO_FECHA)
+
+    def agregar(self, solicitud, conceptos, operacion):
+        numero_operacion, fecha_emision = operacion
+        # append() escribe la fila en el momento, así que las celdas con
+        # formato se reutilizan en lugar de crear tres por fila.
+        self.fecha.value = solicitud.fecha_del_modelo
+        self.importe.value = solicitud.importe_total
+        self.emision.value = fecha_emision
+        self.hoja.append([
+            solicitud.numero_de_H90,
+            self.fecha,
+            solicitud.nombre_del_proveedor,
+            solicitud.codigo_del_proveedor,
+            solicitud.cuenta_bancaria,
+            conceptos,
+            solicitud.descripcion,
+            self.importe,
+            "Sí" if solicitud.inversiones else "No",
+            solicitud.estado,
+            numero_operacion,
+            self.emision,
+        ])
+        self.por_estado[solicitud.estado] += 1
+        self.importe_por_estado[solicitud.estado] += solicitud.importe_total
+        if solicitud.estado != "Cancelado":
+            self.total += solicitud.importe_total
+            if solicitud.inversiones:
+                self.inversiones += solicitud.importe_total
+
+    def cerrar(self):
+        self.hoja.append([])
+        for estado in ("Activo", "Emitido", "Cancelado"):
+            if self.por_estado[estado]:
+                self._fila_total(f"{estado}s ({self.por_estado[estado]})", self.importe_por_estado[estado])
+        self._fila_total("Total (sin cancelados)", self.total)
+        self._fila_total("De ellos, inversiones", self.inversiones)
+
+    def _fila_total(self, etiqueta, importe):
+        fila = [None] * len(COLUMNAS)
+        fila[6] = _celda(self.hoja, etiqueta, negrita=True)
+        fila[7] = _celda(self.hoja, importe, FORMATO_IMPORTE, negrita=True)
+        self.hoja.append(fila)
+
+
+def registro_h90(año, destino, progreso=None):
+    """Escribe el registro del año en ``destino`` (ruta o fichero binario).
+
+    Devuelve la cantidad de solicitudes incluidas.
+    """
+    libro = _openpyxl().Workbook(write_only=True)
+    hoja = None
+    grupo = None
+    cantidad = 0
+    for solicitud, conceptos, operacion in _ordenadas(año):
+        clave = (solicitud.forma_de_pago, solicitud.cuenta_de_empresa)
+        if clave != grupo:
+            if hoja:
+                hoja.cerrar()
+            hoja = _Hoja(libro, *clave, año)
+            grupo = clave
+        hoja.agregar(solicitud, conceptos, operacion)
+        cantidad += 1
+        if progreso and cantidad % TAMAÑO_ITERADOR == 0:
+            progreso(cantidad)
+    if hoja:
+        hoja.cerrar()
+    else:
+        libro.create_sheet(title="Sin datos").append([f"No hay solicitudes en {año}."])
+    libro.save(destino)
+    return cantidad
@@ -0,0 +1,226 @@
+"""
+Revisión de integridad de los datos ya guardados.
+
+Aplica a cada registro las mismas reglas que el admin (``clean_fields()`` y
+``clean()`` de su modelo, y las reglas de conceptos de ``apps.conceptos``)
+y comprueba invariantes entre tablas que ninguna validación por formulario
+garantiza: H90 repetidos, estados de solicitud incoherentes con sus
+operaciones e importes totales que no cuadran con sus conceptos.
+
+Los registros se reparten en tramos de claves primarias que revisan varios
+procesos en paralelo, cada uno recorriendo su tramo con ``iterator()``. Las
+reglas que en ``clean()`` consultan la base de datos fila a fila (H90
+repetido, estado anterior de la operación) se comprueban por conjuntos en
+``invariantes()``.
+"""
+import os
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.utils import timezone
+
+MODELOS_REVISADOS = (
+    "Proveedores",
+    "SolicitudesDePago",
+    "ConceptoNormal",
+    "ConceptoSalario",
+    "OperacionesEmitidas",
+    "Ingreso",
+    "ServicioBancario",
+    "AjusteInversiones",
+)
+
+TAMAÑO_TRAMO = 20000
+TAMAÑO_ITERADOR = 2000
+
+
+def _problema(modelo, pk, campo, mensaje):
+    return {"modelo": modelo, "id": pk, "campo": campo, "mensaje": str(mensaje)}
+
+
+def _errores(error):
+    if hasattr(error, "error_dict"):
+        return [(campo, m) for campo, mensajes in error.message_dict.items() for m in mensajes]
+    return [("__all__", m) for m in error.messages]
+
+
+def _conceptos_del_tramo(desde, hasta):
+    from .models import ConceptoNormal, ConceptoSalario
+
+    normales, salarios = defaultdict(list), defaultdict(list)
+    for solicitud_id, concepto, importe in ConceptoNormal.objects.filter(
+        solicitud_id__gte=desde, solicitud_id__lt=hasta
+    ).values_list("solicitud_id", "concepto", "importe").iterator(chunk_size=TAMAÑO_ITERADOR):
+        normales[solicitud_id].append((concepto, importe))
+    for solicitud_id, concepto, numero, importe in ConceptoSalario.objects.filter(
+        solicitud_id__gte=desde, solicitud_id__lt=hasta
+    ).values_list("solicitud_id", "concepto", "numero", "importe").iterator(chunk_size=TAMAÑO_ITERADOR):
+        salarios[solicitud_id].append((concepto, importe, numero))
+    return normales, salarios
+
+
+def _revisar_solicitud(obj, normales, salarios):
+    from .conceptos import (
+        calcular_importe, validar_conceptos_normales, validar_conceptos_salario, validar_tablas_conceptos,
+    )
+
+    problemas = []
+    normales = normales.get(obj.pk, [])
+    salarios = salarios.get(obj.pk, [])
+    try:
+        if normales:
+            validar_conceptos_normales([c for c, _ in normales])
+        if salarios:
+            validar_conceptos_salario([n for _, _, n in salarios], obj.forma_de_pago)
+        validar_tablas_conceptos(bool(normales), bool(salarios))
+    except ValidationError as e:
+        problemas.extend(("conceptos", m) for m in e.messages)
+
+    total, _ = calcular_importe(normales, [(c, i) for c, i, _ in salarios])
+    if total != obj.importe_total:
+        problemas.append(("importe_total", f"El importe total {obj.importe_total} no coincide con sus conceptos ({total})."))
+    esperado = obj.importe_total if obj.inversiones else 0
+    if obj.importe_inversiones != esperado:
+        problemas.append(("importe_inversiones", f"El importe de inversiones {obj.importe_inversiones} debería ser {esperado}."))
+
+    # clean() consulta si el H90 está repetido; eso se revisa en invariantes()
+    obj.numero_de_H90 = None
+    return problemas
+
+
+def _revisar_operacion(obj):
+    problemas = []
+    if obj.estado in ("Debitado", "Cancelado") and not obj.fecha_final:
+        problemas.append(("fecha_final", f"Una operación {obj.estado} debe tener fecha final."))
+    # Sin pk, clean() no compara con el estado anterior (no tiene sentido en
+    # datos ya guardados) y no hace dos consultas por fila.
+    obj.pk = None
+    return problemas
+
+
+def revisar_tramo(nombre_modelo, desde, hasta):
+    """Revisa los registros con ``desde <= pk < hasta``; se ejecuta en un proceso del pool."""
+    from django.apps import apps
+
+    modelo = apps.get_model("apps", nombre_modelo)
+    # Las claves foráneas se validarían con una consulta por fila
+    excluir = [f.name for f in modelo._meta.concrete_fields if f.is_relation]
+    conceptos = _conceptos_del_tramo(desde, hasta) if nombre_modelo == "SolicitudesDePago" else None
+
+    problemas = []
+    revisados = 0
+    consulta = modelo.objects.filter(pk__gte=desde, pk__lt=hasta).order_by("pk")
+    for obj in consulta.iterator(chunk_size=TAMAÑO_ITERADOR):
+        revisados += 1
+        pk = obj.pk
+        encontrados = []
+        if nombre_modelo == "SolicitudesDePago":
+            encontrados.extend(_revisar_solicitud(obj, *conceptos))
+        elif nombre_modelo == "OperacionesEmitidas":
+            encontrados.extend(_revisar_operacion(obj))
+        try:
+            obj.clean_fields(exclude=excluir)
+        except ValidationError as e:
+            encontrados.extend(_errores(e))
+        try:
+            obj.clean()
+        except ValidationError as e:
+            encontrados.extend(_errores(e))
+        problemas.extend(_problema(nombre_modelo, pk, campo, mensaje) for campo, mensaje in encontrados)
+    return nombre_modelo, revisados, problemas
+
+
+def invariantes():
+    """Reglas entre filas y tablas, comprobadas con consultas agrupadas."""
+    from django.db.models import Count, Exists, F, OuterRef, Window
+    from django.db.models.functions import ExtractYear
+
+    from .models import SolicitudesDePago, OperacionesEmitidas
+
+    problemas = []
+    grupo_h90 = [F("forma_de_pago"), F("cuenta_de_empresa"), F("numero_de_H90"), ExtractYear("fecha_del_modelo")]
+    repetidas = (
+        SolicitudesDePago.objects.exclude(numero_de_H90=None)
+        .annotate(repeticiones=Window(Count("pk"), partition_by=grupo_h90))
+        .filter(repeticiones__gt=1)
+        .values_list("pk", "numero_de_H90", "forma_de_pago", "cuenta_de_empresa", "fecha_del_modelo", "repeticiones")
+    )
+    for pk, numero, forma, cuenta, fecha, repeticiones in repetidas:
+        problemas.append(_problema(
+            "SolicitudesDePago", pk, "numero_de_H90",
+            f"El H90 {numero} está repetido {repeticiones} veces en {forma} - {cuenta} {fecha.year}.",
+        ))
+
+    operaciones = OperacionesEmitidas.objects.filter(solicitud=OuterRef("pk"))
+    for pk in SolicitudesDePago.objects.filter(estado="Activo").filter(Exists(operaciones)).values_list("pk", flat=True):
+        problemas.append(_problema("SolicitudesDePago", pk, "estado", "La solicitud está Activa pero tiene operaciones emitidas."))
+    for pk in SolicitudesDePago.objects.filter(estado="Emitido").exclude(Exists(operaciones)).values_list("pk", flat=True):
+        problemas.append(_problema("SolicitudesDePago", pk, "estado", "La solicitud está Emitida pero no tiene operaciones."))
+    for pk in OperacionesEmitidas.objects.filter(estado="Cancelado").exclude(
+        solicitud__estado="Cancelado"
+    ).values_list("pk", flat=True):
+        problemas.append(_problema("OperacionesEmitidas", pk, "estado", "La operación está Cancelada pero su solicitud no."))
+    return problemas
+
+
+def tramos(nombre_modelo, tamaño=TAMAÑO_TRAMO):
+    from django.apps import apps
+    from django.db.models import Max, Min
+
+    limites = apps.get_model("apps", nombre_modelo).objects.aggregate(desde=Min("pk"), hasta=Max("pk"))
+    if limites["desde"] is None:
+        return []
+    return [
+        (nombre_modelo, inicio, min(inicio + tamaño, limites["hasta"] + 1))
+        for inicio in range(limites["desde"], limites["hasta"] + 1, tamaño)
+    ]
+
+
+def _iniciar_proceso():
+    import django
+
+    django.setup()
+
+
+def revisar_integridad(procesos=None, modelos=MODELOS_REVISADOS, tamaño=TAMAÑO_TRAMO, progreso=None):
+    """Revisa toda la base de datos principal y devuelve el informe como diccionario."""
+    inicio = time.perf_counter()
+    procesos = procesos or os.cpu_count() or 1
+    trabajos = [t for nombre in modelos for t in tramos(nombre, tamaño)]
+
+    revisados = Counter()
+    problemas = invariantes() if "SolicitudesDePago" in modelos else []
+
+    if procesos == 1:
+        resultados = (revisar_tramo(*t) for t in trabajos)
+        for i, (nombre, cantidad, encontrados) in enumerate(resultados, start=1):
+            revisados[nombre] += cantidad
+            problemas.extend(encontrados)
+            if progreso:
+                progreso(i, len(trabajos))
+    else:
+        # Los procesos hijos abren sus propias conexiones
+        connections.close_all()
+        contexto = get_context("fork" if os.name == "posix" else "spawn")
+        with ProcessPoolExecutor(procesos, mp_context=contexto, initializer=_iniciar_proceso) as pool:
+            futuros = pool.map(revisar_tramo, *zip(*trabajos)) if trabajos else []
+            for i, (nombre, cantidad, encontrados) in enumerate(futuros, start=1):
+                revisados[nombre] += cantidad
+                problemas.extend(encontrados)
+                if progreso:
+                    progreso(i, len(trabajos))
+
+    problemas.sort(key=lambda p: (p["modelo"], p["id"], p["campo"]))
+    return {
+        "fecha": timezone.now().isoformat(),
+        "duracion_segundos": round(time.perf_counter() - inicio, 2),
+        "procesos": procesos,
+        "revisados": dict(revisados),
+        "cantidad_problemas": len(problemas),
+        "resumen": dict(Counter(f"{p['modelo']}.{p['campo']}" for p in problemas)),
+        "problemas": problemas,
+    }
@@ -0,0 +1,297 @@
+"""
+Utilidades para los listados (changelists) del admin.
+
+Los listados grandes no deben pagar un ``COUNT(*)`` en cada petición ni un
+``OFFSET`` que crece con el número de página. ``ListadoOptimizadoMixin``
+cachea los conteos (invalidados al cambiar las tablas que consultan, ver
+``apps.cache_etiquetas``) y, cuando el admin define ``keyset_ordering``, navega con
+paginación por cursor (keyset): cada página se obtiene con un ``WHERE`` sobre
+la última fila vista y un ``LIMIT``, de modo que el coste no depende de la
+página en la que se esté.
+
+Además, las filas de la página se cargan solo con las columnas que el
+listado muestra (``list_only``) y con sus relaciones precargadas
+(``list_prefetch_related``), en lugar de traer los campos de texto largos.
+
+Los filtros laterales por campos con opciones muestran cuántas filas del
+listado filtrado hay en cada opción. Los conteos de todos los filtros se
+calculan con agregados condicionales en la misma consulta que los totales
+del pie, y se cachean con ellos.
+
+Al recargar un listado sin cambios en sus tablas se responde 304 sin
+construirlo (ver ``apps.respuestas``).
+"""
+import hashlib
+
+from django.contrib.admin.filters import ChoicesFieldListFilter, FieldListFilter
+from django.contrib.admin.views.main import ChangeList, ORDER_VAR, PAGE_VAR
+from django.core.exceptions import PermissionDenied
+from django.core.paginator import Paginator
+from django.db.models import Count, Prefetch, Q
+from django.utils.functional import cached_property
+
+from .cache_etiquetas import cacheado, etiqueta, etiquetas_de_consulta
+from .respuestas import respuesta_condicional
+
+CURSOR_SIGUIENTE = "despues"
+CURSOR_ANTERIOR = "antes"
+
+
+def clave_consulta(prefijo, queryset):
+    sql, params = queryset.query.sql_with_params()
+    resumen = hashlib.md5(f"{sql}|{params!r}".encode()).hexdigest()
+    return f"{prefijo}:{queryset.model._meta.label_lower}:{resumen}"
+
+
+def conteo_cacheado(queryset):
+    queryset = queryset.order_by()
+    return cacheado(clave_consulta("conteo", queryset), etiquetas_de_consulta(queryset), queryset.count)
+
+
+def totales_cacheados(queryset, **agregados):
+    """Cantidad de filas y agregados del listado en una sola consulta, cacheados."""
+    queryset = queryset.order_by()
+
+    def calcular():
+        return queryset.aggregate(cantidad=Count("pk"), **agregados)
+
+    return cacheado(clave_consulta("totales", queryset), etiquetas_de_consulta(queryset), calcular)
+
+
+def años_cacheados(queryset, campo):
+    """Años con registros, para los filtros por año."""
+    queryset = queryset.order_by()
+
+    def calcular():
+        return [fecha.year for fecha in queryset.dates(campo, "year")]
+
+    return cacheado(clave_consulta(f"años:{campo}", queryset), etiquetas_de_consulta(queryset), calcular)
+
+
+def formato_importe(valor):
+    if valor is not None:
+        s = f"{float(valor):,.2f}"
+        return s.replace(",", " ").replace(".", ",")
+    return "0,00"
+
+
+class ChoicesConConteo(ChoicesFieldListFilter):
+    """Filtro por opciones que añade a cada opción su conteo, si el listado lo calcula."""
+
+    def valores(self):
+        # Mismo orden en que ChoicesFieldListFilter.choices() produce las opciones
+        valores = [valor for valor, _ in self.field.flatchoices if valor is not None]
+        if any(valor is None for valor, _ in self.field.flatchoices):
+            valores.append(None)
+        return valores
+
+    def condicion(self, valor):
+        if valor is None:
+            return Q(**{f"{self.field_path}__isnull": True})
+        return Q(**{self.field_path: valor})
+
+    def choices(self, changelist):
+        opciones = super().choices(changelist)
+        conteos = changelist.conteos_filtro(self) if hasattr(changelist, "conteos_filtro") else None
+        if conteos is None:
+            yield from opciones
+            return
+        yield next(opciones)
+        for opcion, cantidad in zip(opciones, conteos):
+            yield {**opcion, "display": f"{opcion['display']} ({cantidad})"}
+
+
+FieldListFilter.register(lambda f: f.choices, ChoicesConConteo, take_priority=True)
+
+
+class PaginadorConteoCacheado(Paginator):
+    @cached_property
+    def count(self):
+        return conteo_cacheado(self.object_list)
+
+
+class ChangeListOptimizado(ChangeList):
+    keyset = False
+    enlace_anterior = None
+    enlace_siguiente = None
+    _conteos = None
+
+    def _agregados_filtros(self):
+        agregados = {}
+        for i, spec in enumerate(self.filter_specs):
+            if isinstance(spec, ChoicesConConteo):
+                for j, valor in enumerate(spec.valores()):
+                    agregados[f"filtro_{i}_{j}"] = Count("pk", filter=spec.condicion(valor))
+        return agregados
+
+    def totales(self, **agregados):
+        """Totales del pie y conteos de los filtros, en una sola consulta cacheada."""
+        resultado = totales_cacheados(self.queryset, **agregados, **self._agregados_filtros())
+        self._conteos = resultado
+        return resultado
+
+    def conteos_filtro(self, spec):
+        if self._conteos is None:
+            self.totales()
+        i = self.filter_specs.index(spec)
+        return [self._conteos[f"filtro_{i}_{j}"] for j in range(len(spec.valores()))]
+
+    def _campos_keyset(self):
+        return list(self.model_admin.keyset_ordering or ())
+
+    def usar_keyset(self, request):
+        campos = self._campos_keyset()
+        if not campos or ORDER_VAR in self.params or self.show_all:
+            return False
+        # Con ?p= explícito (enlaces antiguos) se mantiene la paginación clásica
+        if PAGE_VAR in request.GET:
+            return False
+        return list(self.queryset.query.order_by) == campos
+
+    def _valor_campo(self, nombre, texto):
+        campo = self.lookup_opts.pk if nombre == "pk" else self.lookup_opts.get_field(nombre)
+        return campo.to_python(texto)
+
+    def _codificar_cursor(self, obj):
+        return "|".join(str(getattr(obj, c.lstrip("-"))) for c in self._campos_keyset())
+
+    def _decodificar_cursor(self, cursor):
+        partes = cursor.split("|")
+        campos = self._campos_keyset()
+        if len(partes) != len(campos):
+            return None
+        try:
+            return [self._valor_campo(c.lstrip("-"), p) for c, p in zip(campos, partes)]
+        except Exception:
+            return None
+
+    def _filtro_keyset(self, valores, hacia_adelante):
+        # Comparación lexicográfica (a, b) < (x, y)  ->  a < x OR (a = x AND b < y)
+        campos = self._campos_keyset()
+        filtro = Q()
+        for i, campo in enumerate(campos):
+            nombre = campo.lstrip("-")
+            descendente = campo.startswith("-")
+            operador = "lt" if descendente == hacia_adelante else "gt"
+            iguales = {c.lstrip("-"): v for c, v in zip(campos[:i], valores[:i])}
+            filtro |= Q(**iguales, **{f"{nombre}__{operador}": valores[i]})
+        return filtro
+
+    def proyectar(self, queryset):
+        campos = self.model_admin.list_only
+        if campos:
+            cursor = [c.lstrip("-") for c in self._campos_keyset() if c.lstrip("-") != "pk"]
+            queryset = queryset.only(*campos, *cursor)
+        if self.model_admin.list_prefetch_related:
+            queryset = queryset.prefetch_related(*self.model_admin.list_prefetch_related)
+        return queryset
+
+    def _orden_invertido(self):
+        return [c[1:] if c.startswith("-") else f"-{c}" for c in self._campos_keyset()]
+
+    def get_results(self, request):
+        # La proyección se aplica solo a las filas mostradas: ``self.queryset``
+        # sigue completo para los totales y para las acciones del admin.
+        completo = self.queryset
+        self.queryset = self.proyectar(completo)
+        try:
+            if self.usar_keyset(request):
+                self._resultados_keyset(request)
+            else:
+                super().get_results(request)
+        finally:
+            self.queryset = completo
+
+    def _resultados_keyset(self, request):
+        paginator = self.model_admin.get_paginator(request, self.queryset, self.list_per_page)
+        self.result_count = paginator.count
+        self.full_result_count = None
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.can_show_all = False
+        self.multi_page = self.result_count > self.list_per_page
+        self.paginator = paginator
+        self.keyset = True
+
+        direccion, cursor = getattr(request, "cursor_keyset", (None, None))
+        valores = self._decodificar_cursor(cursor) if cursor else None
+        queryset = self.queryset
+        if valores and direccion == CURSOR_ANTERIOR:
+            queryset = queryset.filter(self._filtro_keyset(valores, False)).order_by(*self._orden_invertido())
+        elif valores:
+            queryset = queryset.filter(self._filtro_keyset(valores, True))
+
+        filas = list(queryset[:self.list_per_page + 1])
+        hay_mas = len(filas) > self.list_per_page
+        filas = filas[:self.list_per_page]
+        if valores and direccion == CURSOR_ANTERIOR:
+            filas.reverse()
+        self.result_list = filas
+
+        if valores and direccion == CURSOR_ANTERIOR:
+            hay_anterior, hay_siguiente = hay_mas, True
+        else:
+            hay_anterior, hay_siguiente = bool(valores), hay_mas
+        if filas:
+            if hay_anterior:
+                self.enlace_anterior = self.get_query_string(
+                    {CURSOR_ANTERIOR: self._codificar_cursor(filas[0])}, [CURSOR_SIGUIENTE, PAGE_VAR]
+                )
+            if hay_siguiente:
+                self.enlace_siguiente = self.get_query_string(
+                    {CURSOR_SIGUIENTE: self._codificar_cursor(filas[-1])}, [CURSOR_ANTERIOR, PAGE_VAR]
+                )
+
+
+class ListadoOptimizadoMixin:
+    """Conteos cacheados, paginación por cursor y proyección de columnas en los listados."""
+
+    paginator = PaginadorConteoCacheado
+    show_full_result_count = False
+    # Orden completo (incluido el desempate por pk) sobre el que se pagina por
+    # cursor. Debe coincidir con el orden por defecto del listado.
+    keyset_ordering = None
+    # Columnas que necesita ``list_display`` (incluidas las de relaciones
+    # unidas con ``list_select_related``) y relaciones a precargar.
+    list_only = None
+    list_prefetch_related = ()
+    # Responder 304 a las recargas sin cambios; solo si todas las tablas que
+    # muestra el listado cambian de versión al escribirse.
+    listado_revalidable = True
+
+    def get_changelist(self, request, **kwargs):
+        return ChangeListOptimizado
+
+    def etiquetas_listado(self):
+        """Tablas del modelo, de sus claves foráneas y de las relaciones unidas o precargadas."""
+        modelos = {self.model}
+        modelos.update(f.related_model for f in self.model._meta.concrete_fields if f.is_relation)
+        rutas = [r for r in self.list_select_related if isinstance(r, str)] if isinstance(
+            self.list_select_related, (list, tuple)) else []
+        rutas += [r.prefetch_through if isinstance(r, Prefetch) else r for r in self.list_prefetch_related]
+        for ruta in rutas:
+            modelo = self.model
+            for nombre in ruta.split("__"):
+                modelo = modelo._meta.get_field(nombre).related_model
+                modelos.add(modelo)
+        return {etiqueta(modelo) for modelo in modelos}
+
+    def changelist_view(self, request, extra_context=None):
+        vista = super().changelist_view
+        if not self.listado_revalidable:
+            return vista(request, extra_context)
+        # Antes del 304, que no pasa por la comprobación de la vista
+        if not self.has_view_or_change_permission(request):
+            raise PermissionDenied
+        return respuesta_condicional(request, self.etiquetas_listado(), lambda: vista(request, extra_context))
+
+    def get_changelist_instance(self, request):
+        # Los parámetros del cursor no son filtros: se retiran antes de que el
+        # ChangeList los interprete como lookups.
+        request.GET = request.GET.copy()
+        request.cursor_keyset = (None, None)
+        for direccion in (CURSOR_SIGUIENTE, CURSOR_ANTERIOR):
+            valor = request.GET.pop(direccion, None)
+            if valor:
+                request.cursor_keyset = (direccion, valor[0])
+        return super().get_changelist_instance(request)
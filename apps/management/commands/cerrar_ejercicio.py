@@ -0,0 +1,40 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.archivo import archivo_configurado, cerrar_ejercicio, problemas_de_cierre
+from apps.empresas import alias_archivo
+
+
+class Command(BaseCommand):
+    help = (
+        "Cierra un ejercicio: traslada sus solicitudes, operaciones, ingresos, servicios "
+        "bancarios y ajustes a la base de datos de archivo."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("año", type=int)
+        parser.add_argument(
+            "--simular",
+            action="store_true",
+            help="Solo comprueba si el ejercicio se puede cerrar.",
+        )
+
+    def handle(self, *args, **options):
+        año = options["año"]
+        if not archivo_configurado():
+            raise CommandError(f"Falta la base de datos '{alias_archivo()}' en DATABASES.")
+
+        problemas = problemas_de_cierre(año)
+        if problemas:
+            raise CommandError("No se puede cerrar el ejercicio:\n- " + "\n- ".join(problemas))
+        if options["simular"]:
+            self.stdout.write(self.style.SUCCESS(f"El ejercicio {año} se puede cerrar."))
+            return
+
+        # El archivo siempre con el mismo esquema que la base principal
+        call_command("migrate", database=alias_archivo(), verbosity=0, interactive=False)
+
+        resumen = cerrar_ejercicio(año)
+        for modelo, cantidad in resumen.items():
+            self.stdout.write(f"  {modelo}: {cantidad}")
+        self.stdout.write(self.style.SUCCESS(f"Ejercicio {año} cerrado y archivado."))
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.copias import (
+    COPIAS_A_CONSERVAR, PAGINAS_POR_PASO, PAUSA_ENTRE_PASOS, ErrorCopia, directorio_copias, hacer_copia,
+)
+from apps.empresas import alias_archivo, alias_principal
+
+
+class Command(BaseCommand):
+    help = (
+        "Copia en caliente las bases de datos SQLite sin bloquear el admin, verifica cada "
+        "copia, la comprime y conserva solo las más recientes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--base",
+            action="append",
+            dest="bases",
+            help="Alias de la base de datos a copiar (se puede repetir). Por defecto, la principal y el archivo de la empresa.",
+        )
+        parser.add_argument("--directorio", help=f"Destino de las copias (por defecto {directorio_copias()}).")
+        parser.add_argument("--conservar", type=int, default=COPIAS_A_CONSERVAR, help="Copias que se conservan por base.")
+        parser.add_argument("--paginas", type=int, default=PAGINAS_POR_PASO, help="Páginas copiadas en cada paso.")
+        parser.add_argument(
+            "--pausa",
+            type=float,
+            default=PAUSA_ENTRE_PASOS,
+            help="Segundos de pausa entre pasos para dejar escribir a los demás.",
+        )
+
+    def handle(self, *args, **options):
+        bases = options["bases"] or [alias_principal(), alias_archivo()]
+        for alias in bases:
+            try:
+                resultado = hacer_copia(
+                    alias,
+                    directorio=options["directorio"],
+                    paginas=options["paginas"],
+                    pausa=options["pausa"],
+                    conservar=options["conservar"],
+                )
+            except ErrorCopia as e:
+                if options["bases"]:
+                    raise CommandError(str(e))
+                # Sin --base se omite el archivo si aún no se ha cerrado ningún ejercicio
+                self.stderr.write(f"{alias}: {e}")
+                continue
+            self.stdout.write(self.style.SUCCESS(
+                f"{alias}: {resultado.ruta} ({resultado.tamaño / 1024 / 1024:.1f} MiB comprimidos, "
+                f"{resultado.paginas} páginas en {resultado.pasos} pasos, {resultado.duracion:.1f} s; "
+                f"paso máximo {resultado.paso_maximo_ms:.1f} ms, medio {resultado.paso_medio_ms:.1f} ms)"
+            ))
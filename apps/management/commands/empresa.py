@@ -0,0 +1,67 @@
+import argparse
+import os
+import subprocess
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.empresas import alias_principal, empresas, usar_empresa
+
+PRINCIPAL = "principal"
+TODAS = "todas"
+
+
+class Command(BaseCommand):
+    help = (
+        "Ejecuta un comando con una empresa activa (su clave o 'principal') o en todas a la vez "
+        "('todas', un proceso por empresa). migrate migra la base de la empresa y su archivo. "
+        "Ejemplos: empresa filial migrate; empresa todas procesar_tareas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--procesos", type=int, help="Empresas a la vez con 'todas' (por defecto, todas).")
+        parser.add_argument("empresa", help=f"Clave de la empresa, '{PRINCIPAL}' o '{TODAS}'.")
+        parser.add_argument("comando")
+        parser.add_argument("argumentos", nargs=argparse.REMAINDER)
+
+    def handle(self, *args, **options):
+        empresa, comando, argumentos = options["empresa"], options["comando"], options["argumentos"]
+        if empresa == TODAS:
+            return self._en_todas(comando, argumentos, options["procesos"])
+        clave = None if empresa == PRINCIPAL else empresa
+        if clave is not None and clave not in empresas():
+            raise CommandError(f"Empresa desconocida: {empresa}. Configuradas: {', '.join(empresas()) or 'ninguna'}.")
+        with usar_empresa(clave):
+            if comando == "migrate":
+                alias = alias_principal()
+                Path(settings.DATABASES[alias]["NAME"]).parent.mkdir(parents=True, exist_ok=True)
+                call_command("migrate", *argumentos, database=alias)
+            else:
+                call_command(comando, *argumentos)
+
+    def _en_todas(self, comando, argumentos, procesos):
+        claves = [PRINCIPAL, *empresas()]
+        entorno = {**os.environ, "DJANGO_SETTINGS_MODULE": settings.SETTINGS_MODULE}
+        cerrojo = threading.Lock()
+
+        def ejecutar(clave):
+            proceso = subprocess.Popen(
+                [sys.executable, "-m", "django", "empresa", clave, comando, *argumentos],
+                cwd=settings.BASE_DIR, env=entorno, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+            )
+            for linea in proceso.stdout:
+                with cerrojo:
+                    self.stdout.write(f"[{clave}] {linea.rstrip()}")
+            return proceso.wait()
+
+        with ThreadPoolExecutor(procesos or len(claves)) as pool:
+            codigos = dict(zip(claves, pool.map(ejecutar, claves)))
+        fallidas = [clave for clave, codigo in codigos.items() if codigo]
+        if fallidas:
+            raise CommandError(f"El comando falló en: {', '.join(fallidas)}.")
+        self.stdout.write(self.style.SUCCESS(f"{comando} terminado en {len(claves)} empresas."))
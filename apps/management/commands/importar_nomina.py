@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.nomina import ErrorImportacion, importar_nomina
+
+
+class Command(BaseCommand):
+    help = "Importa la nómina (CSV o XLSX) como solicitudes H90 de salario pagadas con Cheque."
+
+    def add_arguments(self, parser):
+        parser.add_argument("archivo", help="Ruta del fichero .csv o .xlsx de la nómina.")
+        parser.add_argument(
+            "--simular",
+            action="store_true",
+            help="Valida el fichero completo sin crear ninguna solicitud.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            solicitudes = importar_nomina(options["archivo"], simular=options["simular"])
+        except FileNotFoundError:
+            raise CommandError(f"No existe el fichero {options['archivo']}.")
+        except ErrorImportacion as e:
+            for fila, mensajes in sorted(e.errores.items()):
+                for mensaje in mensajes:
+                    self.stderr.write(f"Fila {fila}: {mensaje}")
+            raise CommandError(f"No se importó nada: {len(e.errores)} filas con errores.")
+
+        if options["simular"]:
+            self.stdout.write(self.style.SUCCESS(
+                f"El fichero es válido: se crearían {len(solicitudes)} solicitudes."
+            ))
+            return
+        numeros = ", ".join(str(s.numero_de_H90) for s in solicitudes[:20])
+        if len(solicitudes) > 20:
+            numeros += ", ..."
+        self.stdout.write(self.style.SUCCESS(
+            f"Se crearon {len(solicitudes)} solicitudes de salario (H90 {numeros})."
+        ))
@@ -0,0 +1,90 @@
+import statistics
+from contextlib import ExitStack
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from apps.models import SolicitudesDePago, OperacionesEmitidas, Ingreso, ServicioBancario, AjusteInversiones
+
+PAGINAS = ("index",) + tuple(
+    m._meta.model_name for m in (SolicitudesDePago, OperacionesEmitidas, Ingreso, ServicioBancario, AjusteInversiones)
+)
+
+CONFIGURACIONES = {
+    "sesión en base": {
+        "SESSION_ENGINE": "django.contrib.sessions.backends.db",
+        "AUTHENTICATION_BACKENDS": ["django.contrib.auth.backends.ModelBackend"],
+    },
+    "sesión en caché": {
+        "SESSION_ENGINE": "django.contrib.sessions.backends.cached_db",
+        "AUTHENTICATION_BACKENDS": ["apps.sesiones.BackendCacheado"],
+    },
+}
+# Consultas que solo se deben a la sesión y al usuario
+TABLAS_AUTENTICACION = ("django_session", "auth_user", "auth_permission", "auth_group", "django_content_type")
+
+
+class _Deshacer(Exception):
+    pass
+
+
+def _url(pagina):
+    return reverse("admin:index") if pagina == "index" else reverse(f"admin:apps_{pagina}_changelist")
+
+
+class Command(BaseCommand):
+    help = (
+        "Cuenta las consultas SQL por petición del índice del admin y de los listados, con la "
+        "sesión y el usuario leídos de la base de datos y de la caché."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeticiones", type=int, default=5)
+
+    def _medir(self, usuario, repeticiones):
+        cliente = Client()
+        cliente.force_login(usuario)
+        resultados = {}
+        for pagina in PAGINAS:
+            url = _url(pagina)
+            cliente.get(url)  # La primera llena la caché
+            totales, autenticacion = [], []
+            for _ in range(repeticiones):
+                with ExitStack() as pila:
+                    capturas = [pila.enter_context(CaptureQueriesContext(c)) for c in connections.all()]
+                    respuesta = cliente.get(url)
+                if respuesta.status_code != 200:
+                    raise CommandError(f"{url} respondió {respuesta.status_code}.")
+                consultas = [q["sql"] for captura in capturas for q in captura.captured_queries]
+                totales.append(len(consultas))
+                autenticacion.append(sum(any(t in sql for t in TABLAS_AUTENTICACION) for sql in consultas))
+            resultados[pagina] = (statistics.median(totales), statistics.median(autenticacion))
+        return resultados
+
+    def handle(self, *args, **options):
+        repeticiones = options["repeticiones"]
+        if repeticiones < 1:
+            raise CommandError("Hace falta al menos una repetición.")
+        resultados = {}
+        try:
+            with transaction.atomic():
+                usuario = get_user_model().objects.create_superuser("medicion_consultas", None, None)
+                for nombre, ajustes in CONFIGURACIONES.items():
+                    with override_settings(**ajustes):
+                        resultados[nombre] = self._medir(usuario, repeticiones)
+                raise _Deshacer
+        except _Deshacer:
+            pass
+
+        nombres = list(CONFIGURACIONES)
+        self.stdout.write(
+            f"Consultas SQL por petición, mediana de {repeticiones} (entre paréntesis, de sesión y usuario):"
+        )
+        self.stdout.write(f"  {'página':<22}" + "".join(f"{n:>20}" for n in nombres))
+        for pagina in PAGINAS:
+            celdas = "".join(f"{f'{total:g} ({auth:g})':>20}" for total, auth in (resultados[n][pagina] for n in nombres))
+            self.stdout.write(f"  {pagina:<22}{celdas}")
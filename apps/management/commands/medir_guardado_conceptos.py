@@ -0,0 +1,126 @@
+import statistics
+import time
+from datetime import date
+from urllib.parse import urlencode
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from apps.admin import ConceptosEnLoteFormset
+from apps.models import SolicitudesDePago
+
+
+class _Deshacer(Exception):
+    pass
+
+
+def _gestion(prefijo, total, iniciales):
+    return {
+        f"{prefijo}-TOTAL_FORMS": str(total),
+        f"{prefijo}-INITIAL_FORMS": str(iniciales),
+        f"{prefijo}-MIN_NUM_FORMS": "0",
+        f"{prefijo}-MAX_NUM_FORMS": "1000",
+    }
+
+
+def _fila(i, importe, pk=None, solicitud=None, borrar=False):
+    prefijo = f"conceptos_normales-{i}"
+    datos = {f"{prefijo}-concepto": "Factura", f"{prefijo}-numero": f"F-{i}", f"{prefijo}-importe": importe}
+    if pk:
+        datos.update({f"{prefijo}-id": str(pk), f"{prefijo}-solicitud": str(solicitud)})
+    if borrar:
+        datos[f"{prefijo}-DELETE"] = "on"
+    return datos
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide el guardado desde el admin de una solicitud con muchos conceptos: el alta con todas "
+        "las filas y una edición que modifica la mitad, borra una cuarta parte y añade otra. "
+        "Todo se hace en una transacción que se deshace al terminar."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--filas", type=int, default=500, help="Conceptos de la solicitud (por defecto 500).")
+        parser.add_argument("--repeticiones", type=int, default=3)
+        parser.add_argument(
+            "--por-fila",
+            action="store_true",
+            help="Guarda los inlines fila a fila, como el formset de Django, para comparar.",
+        )
+
+    def handle(self, *args, **options):
+        filas = options["filas"]
+        if filas < 4:
+            raise CommandError("Hacen falta al menos 4 filas.")
+        ConceptosEnLoteFormset.guardar_en_lote = not options["por_fila"]
+        tiempos = {"alta": [], "edición": []}
+        consultas = {}
+        try:
+            for _ in range(options["repeticiones"]):
+                for escenario, (duracion, cantidad) in self._medir(filas).items():
+                    tiempos[escenario].append(duracion)
+                    consultas[escenario] = cantidad
+        finally:
+            ConceptosEnLoteFormset.guardar_en_lote = True
+
+        modo = "fila a fila" if options["por_fila"] else "en lote"
+        self.stdout.write(f"{filas} conceptos, guardado {modo}:")
+        for escenario, valores in tiempos.items():
+            self.stdout.write(
+                f"  {escenario:<9} mediana {statistics.median(valores) * 1000:8.1f} ms   "
+                f"mínimo {min(valores) * 1000:8.1f} ms   {consultas[escenario]} consultas"
+            )
+
+    def _enviar(self, cliente, url, datos):
+        with CaptureQueriesContext(connection) as capturadas:
+            inicio = time.perf_counter()
+            # Como lo envía el navegador, sin el coste de codificar multipart del cliente de pruebas
+            respuesta = cliente.post(url, urlencode(datos), content_type="application/x-www-form-urlencoded")
+            duracion = time.perf_counter() - inicio
+        if respuesta.status_code != 302:
+            raise CommandError(f"El admin rechazó el formulario ({respuesta.status_code}).")
+        return duracion, len(capturadas)
+
+    def _medir(self, filas):
+        resultados = {}
+        try:
+            with transaction.atomic():
+                usuario = get_user_model().objects.create_superuser("medicion_conceptos", None, None)
+                cliente = Client()
+                cliente.force_login(usuario)
+
+                datos = {
+                    "fecha_del_modelo": date.today().strftime("%d/%m/%Y"),
+                    "forma_de_pago": "Transferencia",
+                    "cuenta_de_empresa": "CUP",
+                    "estado": "Activo",
+                    **_gestion("conceptos_normales", filas, 0),
+                    **_gestion("conceptos_salarios", 0, 0),
+                }
+                for i in range(filas):
+                    datos.update(_fila(i, "10.00"))
+                resultados["alta"] = self._enviar(cliente, reverse("admin:apps_solicitudesdepago_add"), datos)
+
+                solicitud = SolicitudesDePago.objects.latest("pk")
+                ids = list(solicitud.conceptos_normales.order_by("pk").values_list("pk", flat=True))
+                nuevas = filas // 4
+                datos.update(_gestion("conceptos_normales", filas + nuevas, filas))
+                for i, pk in enumerate(ids):
+                    # Mitad modificadas, un cuarto borradas, el resto igual
+                    if i < filas // 2:
+                        datos.update(_fila(i, "12.50", pk, solicitud.pk))
+                    else:
+                        datos.update(_fila(i, "10.00", pk, solicitud.pk, borrar=i < filas * 3 // 4))
+                for i in range(filas, filas + nuevas):
+                    datos.update(_fila(i, "7.25"))
+                url = reverse("admin:apps_solicitudesdepago_change", args=[solicitud.pk])
+                resultados["edición"] = self._enviar(cliente, url, datos)
+                raise _Deshacer
+        except _Deshacer:
+            pass
+        return resultados
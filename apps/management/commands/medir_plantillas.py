@@ -0,0 +1,96 @@
+import statistics
+import time
+
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.template import engines
+from django.test import RequestFactory
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from apps.models import SolicitudesDePago, OperacionesEmitidas, Ingreso, ServicioBancario, AjusteInversiones
+
+PAGINAS = ("index",) + tuple(
+    m._meta.model_name for m in (SolicitudesDePago, OperacionesEmitidas, Ingreso, ServicioBancario, AjusteInversiones)
+)
+
+CARGADORES = [
+    "django.template.loaders.filesystem.Loader",
+    "django.template.loaders.app_directories.Loader",
+]
+
+
+class _Deshacer(Exception):
+    pass
+
+
+def _plantillas(cacheadas):
+    opciones = {k: v for k, v in engines.templates["django"]["OPTIONS"].items() if k != "loaders"}
+    cargadores = [("django.template.loaders.cached.Loader", CARGADORES)] if cacheadas else CARGADORES
+    return [{
+        **engines.templates["django"],
+        "APP_DIRS": False,
+        "OPTIONS": {**opciones, "loaders": cargadores},
+    }]
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide el tiempo de render de las plantillas del índice del admin y de los listados con "
+        "pie de totales, sin caché de plantillas ni de fragmentos y con ellas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeticiones", type=int, default=20)
+
+    def _vista(self, pagina, usuario):
+        if pagina == "index":
+            url, vista = reverse("admin:index"), admin.site.index
+        else:
+            modelo = next(m for m in admin.site._registry if m._meta.model_name == pagina)
+            url, vista = reverse(f"admin:apps_{pagina}_changelist"), admin.site._registry[modelo].changelist_view
+        request = RequestFactory().get(url)
+        request.user = usuario
+        return lambda: vista(request)
+
+    def _medir(self, usuario, repeticiones):
+        tiempos = {}
+        for pagina in PAGINAS:
+            vista = self._vista(pagina, usuario)
+            valores = []
+            for _ in range(repeticiones):
+                respuesta = vista()
+                # La vista devuelve un TemplateResponse sin renderizar
+                inicio = time.perf_counter()
+                respuesta.render()
+                valores.append(time.perf_counter() - inicio)
+            # La primera vez se compila; interesa el régimen estable
+            tiempos[pagina] = statistics.median(valores[1:] or valores)
+        return tiempos
+
+    def handle(self, *args, **options):
+        repeticiones = options["repeticiones"]
+        if repeticiones < 1:
+            raise CommandError("Hace falta al menos una repetición.")
+        resultados = {}
+        try:
+            with transaction.atomic():
+                usuario = get_user_model().objects.create_superuser("medicion_plantillas", None, None)
+                sin_fragmentos = {"template_fragments": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+                from django.conf import settings
+
+                with override_settings(TEMPLATES=_plantillas(False), CACHES={**settings.CACHES, **sin_fragmentos}):
+                    resultados["sin caché"] = self._medir(usuario, repeticiones)
+                with override_settings(TEMPLATES=_plantillas(True)):
+                    resultados["con caché"] = self._medir(usuario, repeticiones)
+                raise _Deshacer
+        except _Deshacer:
+            pass
+
+        self.stdout.write(f"Render de plantillas, mediana de {repeticiones} peticiones (ms):")
+        self.stdout.write(f"  {'página':<22}{'sin caché':>12}{'con caché':>12}")
+        for pagina in PAGINAS:
+            antes, despues = resultados["sin caché"][pagina], resultados["con caché"][pagina]
+            self.stdout.write(f"  {pagina:<22}{antes * 1000:12.1f}{despues * 1000:12.1f}")
@@ -0,0 +1,30 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.commands.migrate import Command as MigrateDjango
+
+from apps.empresas import alias_archivo_de
+
+
+class Command(MigrateDjango):
+    help = (
+        MigrateDjango.help
+        + " Al migrar la base principal de una empresa migra también su base de archivo, si ya existe"
+        " (la crea cerrar_ejercicio), para que los ejercicios archivados sigan el esquema de la principal."
+    )
+
+    def handle(self, *args, **options):
+        super().handle(*args, **options)
+        archivo = alias_archivo_de(options["database"])
+        if archivo is None or archivo not in settings.DATABASES:
+            return
+        if not Path(settings.DATABASES[archivo]["NAME"]).exists():
+            return
+        if options["verbosity"]:
+            self.stdout.write(self.style.MIGRATE_HEADING(f"Base de archivo '{archivo}':"))
+        call_command(
+            "migrate", *[a for a in (options["app_label"], options["migration_name"]) if a],
+            database=archivo, verbosity=options["verbosity"], interactive=False,
+            fake=options["fake"], plan=options["plan"], stdout=self.stdout, stderr=self.stderr,
+        )
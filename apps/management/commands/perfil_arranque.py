@@ -0,0 +1,90 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Lo mismo que hace wsgi.py, midiendo cada fase
+ARRANQUE = """
+import json, os, sys, time
+inicio = time.perf_counter()
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", {modulo!r})
+import django
+django.setup()
+configurado = time.perf_counter()
+from django.core.wsgi import get_wsgi_application
+get_wsgi_application()
+cargado = time.perf_counter()
+from apps.arranque import calentar
+calentar()
+fin = time.perf_counter()
+print(json.dumps({{"setup": configurado - inicio, "wsgi": cargado - configurado, "calentar": fin - cargado}}))
+"""
+
+
+def _leer_importtime(texto):
+    """Filas ``(modulo, propio_us, acumulado_us, nivel)`` de la salida de ``-X importtime``."""
+    filas = []
+    for linea in texto.splitlines():
+        if not linea.startswith("import time:") or "self [us]" in linea:
+            continue
+        propio, acumulado, nombre = linea[len("import time:"):].split("|")
+        nivel = (len(nombre) - len(nombre.lstrip())) // 2
+        filas.append((nombre.strip(), int(propio), int(acumulado), nivel))
+    return filas
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide el arranque de un proceso del servidor (django.setup, carga de la aplicación WSGI "
+        "y calentamiento) en procesos nuevos, y desglosa el tiempo de importación por paquete "
+        "y por módulo con python -X importtime."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeticiones", type=int, default=5)
+        parser.add_argument("--top", type=int, default=15, help="Módulos y paquetes a mostrar.")
+
+    def _arrancar(self):
+        codigo = ARRANQUE.format(modulo=os.environ.get("DJANGO_SETTINGS_MODULE", "gestor_pagos.settings"))
+        proceso = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", codigo],
+            cwd=settings.BASE_DIR, capture_output=True, text=True,
+        )
+        if proceso.returncode != 0:
+            raise CommandError(proceso.stderr.strip().splitlines()[-1])
+        return json.loads(proceso.stdout.strip().splitlines()[-1]), _leer_importtime(proceso.stderr)
+
+    def handle(self, *args, **options):
+        fases = defaultdict(list)
+        for _ in range(max(options["repeticiones"], 1)):
+            tiempos, importaciones = self._arrancar()
+            for fase, valor in tiempos.items():
+                fases[fase].append(valor)
+            fases["total"].append(sum(tiempos.values()))
+
+        self.stdout.write(f"Arranque de un proceso (mediana de {options['repeticiones']}):")
+        for fase in ("setup", "wsgi", "calentar", "total"):
+            self.stdout.write(f"  {fase:<10} {statistics.median(fases[fase]) * 1000:8.1f} ms")
+
+        # El desglose es de la última repetición
+        top = options["top"]
+        por_paquete = defaultdict(int)
+        for nombre, propio, _, _ in importaciones:
+            por_paquete[nombre.split(".")[0]] += propio
+        self.stdout.write(f"\nImportación por paquete ({sum(por_paquete.values()) / 1000:.1f} ms en total):")
+        for paquete, propio in sorted(por_paquete.items(), key=lambda p: -p[1])[:top]:
+            self.stdout.write(f"  {propio / 1000:8.1f} ms  {paquete}")
+
+        self.stdout.write("\nMódulos del proyecto y dependencias directas, por tiempo acumulado:")
+        propios = ("apps", "gestor_pagos")
+        raices = [
+            fila for fila in importaciones
+            if fila[0].split(".")[0] in propios or fila[3] == 0
+        ]
+        for nombre, _, acumulado, _ in sorted(raices, key=lambda f: -f[2])[:top]:
+            self.stdout.write(f"  {acumulado / 1000:8.1f} ms  {nombre}")
@@ -0,0 +1,55 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from apps.tareas import ejecutar_tarea, nombre_trabajador, reclamar_tarea
+
+
+class Command(BaseCommand):
+    help = "Ejecuta las tareas en segundo plano pendientes (exportaciones, recálculos, conciliaciones)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--una-vez",
+            action="store_true",
+            help="Procesa las tareas disponibles y termina, en lugar de quedarse esperando.",
+        )
+        parser.add_argument(
+            "--intervalo",
+            type=float,
+            default=2.0,
+            help="Segundos de espera cuando no hay tareas pendientes (por defecto 2).",
+        )
+        parser.add_argument("--nombre", default="", help="Nombre del trabajador en los registros.")
+
+    def handle(self, *args, **options):
+        trabajador = options["nombre"] or nombre_trabajador()
+        self._detener = False
+        signal.signal(signal.SIGTERM, self._senal_detener)
+        signal.signal(signal.SIGINT, self._senal_detener)
+
+        self.stdout.write(f"Trabajador {trabajador} iniciado.")
+        while not self._detener:
+            close_old_connections()
+            tarea = reclamar_tarea(trabajador)
+            if tarea is None:
+                if options["una_vez"]:
+                    break
+                time.sleep(options["intervalo"])
+                continue
+
+            self.stdout.write(f"Ejecutando {tarea} (intento {tarea.intentos}/{tarea.max_intentos})...")
+            inicio = time.monotonic()
+            if ejecutar_tarea(tarea):
+                self.stdout.write(self.style.SUCCESS(
+                    f"Tarea #{tarea.pk} completada en {time.monotonic() - inicio:.1f} s."
+                ))
+            else:
+                self.stdout.write(self.style.ERROR(f"Tarea #{tarea.pk} falló."))
+        self.stdout.write(f"Trabajador {trabajador} detenido.")
+
+    def _senal_detener(self, signum, frame):
+        # Termina la tarea en curso antes de salir
+        self._detener = True
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.informes import ErrorInforme, registro_h90
+
+
+class Command(BaseCommand):
+    help = "Genera el registro anual de H90 en Excel, con una hoja por forma de pago y cuenta."
+
+    def add_arguments(self, parser):
+        parser.add_argument("año", type=int)
+        parser.add_argument("--salida", help="Fichero .xlsx de destino (por defecto registro_h90_<año>.xlsx).")
+
+    def handle(self, *args, **options):
+        año = options["año"]
+        salida = options["salida"] or f"registro_h90_{año}.xlsx"
+        inicio = time.perf_counter()
+        try:
+            cantidad = registro_h90(año, salida)
+        except ErrorInforme as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f"Registro de H90 {año}: {cantidad} solicitudes en {salida} ({time.perf_counter() - inicio:.1f} s)."
+        ))
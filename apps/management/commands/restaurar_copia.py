@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.copias import ErrorCopia, hacer_copia, restaurar_copia
+
+
+class Command(BaseCommand):
+    help = "Restaura una base de datos SQLite desde una copia de seguridad verificada."
+
+    def add_arguments(self, parser):
+        parser.add_argument("copia", help="Fichero .sqlite3.gz generado por copia_seguridad.")
+        parser.add_argument("--base", default="default", help="Alias de la base de datos a restaurar.")
+        parser.add_argument(
+            "--sin-copia-previa",
+            action="store_true",
+            help="No copia el estado actual antes de restaurar.",
+        )
+        parser.add_argument(
+            "--noinput",
+            "--no-input",
+            action="store_false",
+            dest="interactive",
+            help="No pide confirmación.",
+        )
+
+    def handle(self, *args, **options):
+        alias = options["base"]
+        if options["interactive"]:
+            respuesta = input(
+                f"Se sustituirá todo el contenido de la base '{alias}' por el de {options['copia']}.\n"
+                "Escriba 'si' para continuar: "
+            )
+            if respuesta.strip().lower() not in ("si", "sí"):
+                raise CommandError("Restauración cancelada.")
+
+        try:
+            if not options["sin_copia_previa"]:
+                previa = hacer_copia(alias, conservar=10 ** 6)
+                self.stdout.write(f"Estado actual guardado en {previa.ruta}.")
+            restaurar_copia(options["copia"], alias)
+        except ErrorCopia as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f"Base '{alias}' restaurada desde {options['copia']}."))
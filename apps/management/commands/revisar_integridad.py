@@ -0,0 +1,51 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from apps.integridad import MODELOS_REVISADOS, TAMAÑO_TRAMO, revisar_integridad
+
+
+class Command(BaseCommand):
+    help = (
+        "Revisa que los datos guardados cumplan las validaciones de los modelos y las "
+        "reglas entre tablas, y escribe un informe JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--salida",
+            default="-",
+            help="Fichero del informe JSON ('-' para la salida estándar).",
+        )
+        parser.add_argument("--procesos", type=int, help="Procesos en paralelo (por defecto, uno por CPU).")
+        parser.add_argument("--tramo", type=int, default=TAMAÑO_TRAMO, help="Registros por tramo de trabajo.")
+        parser.add_argument(
+            "--modelo",
+            action="append",
+            dest="modelos",
+            choices=MODELOS_REVISADOS,
+            help="Revisa solo este modelo (se puede repetir).",
+        )
+
+    def handle(self, *args, **options):
+        informe = revisar_integridad(
+            procesos=options["procesos"],
+            modelos=options["modelos"] or MODELOS_REVISADOS,
+            tamaño=options["tramo"],
+        )
+        texto = json.dumps(informe, ensure_ascii=False, indent=2, default=str)
+        if options["salida"] == "-":
+            self.stdout.write(texto)
+        else:
+            with open(options["salida"], "w", encoding="utf-8") as fichero:
+                fichero.write(texto)
+
+        revisados = sum(informe["revisados"].values())
+        resumen = f"{revisados} registros revisados en {informe['duracion_segundos']} s con {informe['procesos']} procesos"
+        # Por stderr: stdout puede llevar el informe JSON
+        if informe["cantidad_problemas"]:
+            self.stderr.write(f"{resumen}: {informe['cantidad_problemas']} problemas.", self.style.WARNING)
+            for regla, cantidad in sorted(informe["resumen"].items()):
+                self.stderr.write(f"  {regla}: {cantidad}", self.style.WARNING)
+        else:
+            self.stderr.write(f"{resumen}: sin problemas.", self.style.SUCCESS)
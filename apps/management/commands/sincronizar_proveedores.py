@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.models import Proveedores
+from apps.servicios import sincronizar_datos_proveedores
+
+
+class Command(BaseCommand):
+    help = (
+        "Copia los datos actuales de los proveedores (titular, código, cuenta y dirección) "
+        "a sus solicitudes Activas. Las Emitidas y Canceladas no se modifican."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "proveedores",
+            nargs="*",
+            help="Códigos de los proveedores a sincronizar. Sin códigos, todos.",
+        )
+        parser.add_argument(
+            "--simular",
+            action="store_true",
+            help="Solo cuenta las solicitudes que se actualizarían.",
+        )
+
+    def handle(self, *args, **options):
+        proveedores = None
+        if options["proveedores"]:
+            proveedores = list(Proveedores.objects.filter(codigo__in=options["proveedores"]).values_list("pk", flat=True))
+            if not proveedores:
+                raise CommandError("No existe ningún proveedor con esos códigos.")
+
+        cantidad = sincronizar_datos_proveedores(proveedores, simular=options["simular"])
+        if options["simular"]:
+            self.stdout.write(self.style.SUCCESS(f"Se actualizarían {cantidad} solicitudes activas."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Se actualizaron {cantidad} solicitudes activas."))
@@ -0,0 +1,46 @@
+# Generated by Django 4.2.7 on 2026-10-19 14:59
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('apps', '0035_ajusteinversiones'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tarea',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(max_length=100, verbose_name='Tipo')),
+                ('parametros', models.JSONField(blank=True, default=dict, verbose_name='Parámetros')),
+                ('estado', models.CharField(choices=[('Pendiente', 'Pendiente'), ('En curso', 'En curso'), ('Completada', 'Completada'), ('Fallida', 'Fallida')], default='Pendiente', max_length=20, verbose_name='Estado')),
+                ('progreso', models.PositiveIntegerField(default=0, verbose_name='Progreso')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='Total')),
+                ('mensaje', models.CharField(blank=True, default='', max_length=255, verbose_name='Mensaje')),
+                ('intentos', models.PositiveIntegerField(default=0, verbose_name='Intentos')),
+                ('max_intentos', models.PositiveIntegerField(default=3, verbose_name='Máximo de Intentos')),
+                ('disponible_desde', models.DateTimeField(default=django.utils.timezone.now, help_text='La tarea no se reclama antes de esta fecha (se usa para espaciar los reintentos).', verbose_name='Disponible desde')),
+                ('trabajador', models.CharField(blank=True, default='', max_length=100, verbose_name='Trabajador')),
+                ('bloqueada_hasta', models.DateTimeField(blank=True, help_text='Si el trabajador no reporta progreso antes de esta fecha, la tarea vuelve a reclamarse.', null=True, verbose_name='Bloqueada hasta')),
+                ('resultado', models.FileField(blank=True, null=True, upload_to='tareas/', verbose_name='Resultado')),
+                ('error', models.TextField(blank=True, null=True, verbose_name='Error')),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de Creación')),
+                ('fecha_inicio', models.DateTimeField(blank=True, null=True, verbose_name='Fecha de Inicio')),
+                ('fecha_fin', models.DateTimeField(blank=True, null=True, verbose_name='Fecha de Fin')),
+                ('creado_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='tareas', to=settings.AUTH_USER_MODEL, verbose_name='Creado por')),
+            ],
+            options={
+                'verbose_name': 'Tarea',
+                'verbose_name_plural': 'Tareas',
+                'ordering': ('-fecha_creacion',),
+                'indexes': [models.Index(fields=['estado', 'disponible_desde'], name='tarea_estado_disp_idx')],
+            },
+        ),
+    ]
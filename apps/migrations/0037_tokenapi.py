@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-19 15:03
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('apps', '0036_tarea'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TokenAPI',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(help_text='Sistema que usa el token (p. ej. Nómina, Compras).', max_length=100, verbose_name='Nombre')),
+                ('clave', models.CharField(editable=False, max_length=64, unique=True, verbose_name='Clave')),
+                ('activo', models.BooleanField(default=True, verbose_name='Activo')),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de Creación')),
+                ('ultimo_uso', models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Último Uso')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tokens_api', to=settings.AUTH_USER_MODEL, verbose_name='Usuario')),
+            ],
+            options={
+                'verbose_name': 'Token de API',
+                'verbose_name_plural': 'Tokens de API',
+            },
+        ),
+    ]
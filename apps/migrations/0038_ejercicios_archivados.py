@@ -0,0 +1,93 @@
+# Generated by Django 4.2.7 on 2026-10-19 15:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0037_tokenapi'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EjercicioCerrado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('año', models.PositiveIntegerField(unique=True, verbose_name='Año')),
+                ('fecha_cierre', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de Cierre')),
+                ('resumen', models.JSONField(blank=True, default=dict, help_text='Cantidad de registros trasladados a la base de datos de archivo por modelo.', verbose_name='Resumen')),
+            ],
+            options={
+                'verbose_name': 'Ejercicio Cerrado',
+                'verbose_name_plural': 'Ejercicios Cerrados',
+                'ordering': ('-año',),
+            },
+        ),
+        migrations.CreateModel(
+            name='AjusteInversionesArchivado',
+            fields=[
+            ],
+            options={
+                'verbose_name': 'Ajuste de Inversión archivado',
+                'verbose_name_plural': 'Ajustes de Inversiones archivados',
+                'proxy': True,
+                'indexes': [],
+                'constraints': [],
+            },
+            bases=('apps.ajusteinversiones',),
+        ),
+        migrations.CreateModel(
+            name='IngresoArchivado',
+            fields=[
+            ],
+            options={
+                'verbose_name': 'Ingreso archivado',
+                'verbose_name_plural': 'Ingresos archivados',
+                'proxy': True,
+                'indexes': [],
+                'constraints': [],
+            },
+            bases=('apps.ingreso',),
+        ),
+        migrations.CreateModel(
+            name='OperacionArchivada',
+            fields=[
+            ],
+            options={
+                'verbose_name': 'Operación Emitida archivada',
+                'verbose_name_plural': 'Operaciones Emitidas archivadas',
+                'ordering': ('-fecha_emision',),
+                'proxy': True,
+                'indexes': [],
+                'constraints': [],
+            },
+            bases=('apps.operacionesemitidas',),
+        ),
+        migrations.CreateModel(
+            name='ServicioBancarioArchivado',
+            fields=[
+            ],
+            options={
+                'verbose_name': 'Servicio Bancario archivado',
+                'verbose_name_plural': 'Servicios Bancarios archivados',
+                'proxy': True,
+                'indexes': [],
+                'constraints': [],
+            },
+            bases=('apps.serviciobancario',),
+        ),
+        migrations.CreateModel(
+            name='SolicitudArchivada',
+            fields=[
+            ],
+            options={
+                'verbose_name': 'Solicitud de Pago archivada',
+                'verbose_name_plural': 'Solicitudes de Pago archivadas',
+                'proxy': True,
+                'indexes': [],
+                'constraints': [],
+            },
+            bases=('apps.solicitudesdepago',),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-19 15:11
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('apps', '0038_ejercicios_archivados'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegistroAuditoria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('modelo', models.CharField(max_length=40, verbose_name='Modelo')),
+                ('objeto_id', models.BigIntegerField(verbose_name='Id del Objeto')),
+                ('accion', models.CharField(choices=[('A', 'Alta'), ('M', 'Modificación'), ('B', 'Baja')], max_length=1, verbose_name='Acción')),
+                ('fecha', models.DateTimeField(verbose_name='Fecha')),
+                ('cambios', models.JSONField(default=dict, help_text='Campos modificados: {campo: [valor anterior, valor nuevo]}.', verbose_name='Cambios')),
+                ('usuario', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Usuario')),
+            ],
+            options={
+                'verbose_name': 'Registro de Auditoría',
+                'verbose_name_plural': 'Registros de Auditoría',
+                'ordering': ('-id',),
+                'indexes': [models.Index(fields=['modelo', 'objeto_id', '-id'], name='auditoria_objeto_idx')],
+            },
+        ),
+    ]
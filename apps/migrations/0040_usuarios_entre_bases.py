@@ -0,0 +1,26 @@
+# Generated by Django 4.2.7 on 2026-10-19 15:45
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('apps', '0039_registroauditoria'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='tarea',
+            name='creado_por',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='tareas', to=settings.AUTH_USER_MODEL, verbose_name='Creado por'),
+        ),
+        migrations.AlterField(
+            model_name='tokenapi',
+            name='usuario',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='tokens_api', to=settings.AUTH_USER_MODEL, verbose_name='Usuario'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 15:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0040_usuarios_entre_bases'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='operacionesemitidas',
+            name='lote_banco',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=30, null=True, verbose_name='Lote Bancario'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+from django.db import migrations
+
+TABLA = "apps_busqueda_solicitudes"
+
+# Los triggers que lo mantienen y el llenado los hace apps.busqueda al terminar
+# cada migrate: aquí harían fallar la reconstrucción de las tablas que nombran.
+TRIGGERS = (
+    "solicitud_ai", "solicitud_au", "solicitud_ad", "concepto_ai", "concepto_au", "concepto_ad", "proveedor_au",
+)
+
+
+def crear(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE {TABLA} USING fts5("
+        f"h90, proveedor, conceptos, descripcion, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+    )
+
+
+def borrar(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for nombre in TRIGGERS:
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {TABLA}_{nombre}")
+    schema_editor.execute(f"DROP TABLE IF EXISTS {TABLA}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("apps", "0041_lote_banco_operaciones"),
+    ]
+
+    operations = [
+        migrations.RunPython(crear, borrar),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-19 15:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0042_busqueda_solicitudes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='operacionesemitidas',
+            index=models.Index(fields=['numero_serie'], name='operacion_serie_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='operacionesemitidas',
+            index=models.Index(fields=['numero_operacion'], name='operacion_numero_idx'),
+        ),
+    ]
@@ -1,9 +1,12 @@
 from django.db import models
+from django.conf import settings
 from django.core.validators import RegexValidator, MinValueValidator
 from django.core.exceptions import ValidationError
 from django.utils import timezone
-from num2words import num2words
+from .conceptos import calcular_importe
+from .archivo import bases_para_año, ejercicio_cerrado
 import datetime
+import secrets
 from datetime import date
 
 class Proveedores(models.Model):
@@ -111,6 +114,9 @@ class SolicitudesDePago(models.Model):
     def importe_total_letras(self):
         if self.importe_total is None:
             return ""
+        # num2words tarda en importarse y solo hace falta en el formulario
+        from num2words import num2words
+
         entero = int(self.importe_total)
         centavos = int(round((self.importe_total - entero) * 100))
         texto_entero = num2words(entero, lang='es')
@@ -118,27 +124,9 @@ class SolicitudesDePago(models.Model):
         return f"{texto_entero} pesos con {texto_centavos} centavos"
 
     def calcular_importe_total(self):
-        normales = self.conceptos_normales.all()
-        salarios = self.conceptos_salarios.all()
-
-        if normales.exists() and salarios.exists():
-            return 0, "No se pueden guardar datos en ambas tablas a la vez."
-
-        if normales.exists():
-            primer_concepto = normales.first().concepto
-            if primer_concepto == "Ninguno":
-                return sum(c.importe for c in normales), None
-            if all(c.concepto == primer_concepto for c in normales):
-                total = sum(c.importe for c in normales)
-                return total, None
-            else:
-                return 0, "Los conceptos normales son distintos, no se realizó la suma."
-
-        if salarios.exists():
-            total = sum(c.importe for c in salarios)
-            return total, None
-
-        return 0, "Debe existir al menos un concepto en alguna tabla."
+        normales = list(self.conceptos_normales.values_list("concepto", "importe"))
+        salarios = list(self.conceptos_salarios.values_list("concepto", "importe"))
+        return calcular_importe(normales, salarios)
 
     def clean(self):
         """Validaciones de fecha y unicidad por forma de pago + año"""
@@ -155,6 +143,11 @@ class SolicitudesDePago(models.Model):
             })
 
         año = fecha.year
+        if ejercicio_cerrado(año):
+            raise ValidationError({
+                "fecha_del_modelo": f"El ejercicio {año} está cerrado y archivado. No se pueden registrar solicitudes en él."
+            })
+
         if self.numero_de_H90:
             existe = SolicitudesDePago.objects.filter(
                 forma_de_pago=self.forma_de_pago,
@@ -168,13 +161,29 @@ class SolicitudesDePago(models.Model):
                                      f"{self.forma_de_pago} - {self.cuenta_de_empresa} en {año}."
                 })
 
-    def save(self, *args, **kwargs):
+    @classmethod
+    def siguiente_numero_h90(cls, forma_de_pago, cuenta_de_empresa, año, excluir=None):
+        """Consecutivo por forma de pago, cuenta y año; incluye los ejercicios archivados."""
+        ultimo = 0
+        for alias in bases_para_año(año):
+            maximo = cls.objects.using(alias).filter(
+                forma_de_pago=forma_de_pago,
+                cuenta_de_empresa=cuenta_de_empresa,
+                fecha_del_modelo__year=año
+            ).exclude(pk=excluir).aggregate(maximo=models.Max('numero_de_H90'))['maximo']
+            ultimo = max(ultimo, maximo or 0)
+        return ultimo + 1
+
+    def copiar_datos_proveedor(self):
         if self.identificador_del_proveedor:
             self.nombre_del_proveedor = self.identificador_del_proveedor.tit_de_la_cuenta
             self.codigo_del_proveedor = self.identificador_del_proveedor.codigo
             self.cuenta_bancaria = self.identificador_del_proveedor.cuenta_banc
             self.direccion_proveedor = self.identificador_del_proveedor.direccion
 
+    def save(self, *args, **kwargs):
+        self.copiar_datos_proveedor()
+
         año = self.fecha_del_modelo.year
 
         if self.pk:
@@ -186,20 +195,14 @@ class SolicitudesDePago(models.Model):
             )
             if cambiaron_datos:
                 if self.numero_de_H90 == original.numero_de_H90:
-                    ultimo = SolicitudesDePago.objects.filter(
-                        forma_de_pago=self.forma_de_pago,
-                        cuenta_de_empresa=self.cuenta_de_empresa,
-                        fecha_del_modelo__year=año
-                    ).exclude(pk=self.pk).order_by('-numero_de_H90').first()
-                    self.numero_de_H90 = (ultimo.numero_de_H90 + 1) if ultimo else 1
+                    self.numero_de_H90 = SolicitudesDePago.siguiente_numero_h90(
+                        self.forma_de_pago, self.cuenta_de_empresa, año, excluir=self.pk
+                    )
         else:
             if not self.numero_de_H90:
-                ultimo = SolicitudesDePago.objects.filter(
-                    forma_de_pago=self.forma_de_pago,
-                    cuenta_de_empresa=self.cuenta_de_empresa,
-                    fecha_del_modelo__year=año
-                ).order_by('-numero_de_H90').first()
-                self.numero_de_H90 = (ultimo.numero_de_H90 + 1) if ultimo else 1
+                self.numero_de_H90 = SolicitudesDePago.siguiente_numero_h90(
+                    self.forma_de_pago, self.cuenta_de_empresa, año
+                )
 
         if self.inversiones:
             self.importe_inversiones = self.importe_total
@@ -354,11 +357,24 @@ class OperacionesEmitidas(models.Model):
         null=True,
         verbose_name="Observaciones"
     )
+    lote_banco = models.CharField(
+        max_length=30,
+        null=True,
+        blank=True,
+        editable=False,
+        db_index=True,
+        verbose_name="Lote Bancario"
+    )
 
     class Meta:
         verbose_name = "Operación Emitida"
         verbose_name_plural = "Operaciones Emitidas"
         ordering = ("-fecha_emision",)
+        indexes = [
+            # Búsqueda exacta y por prefijo (con rangos) desde el admin
+            models.Index(fields=["numero_serie"], name="operacion_serie_idx"),
+            models.Index(fields=["numero_operacion"], name="operacion_numero_idx"),
+        ]
 
     def clean(self):
         super().clean()
@@ -635,4 +651,212 @@ class AjusteInversiones(models.Model):
             })
 
     def __str__(self):
-        return f"Ajuste {self.clave} - {self.importe}"
\ No newline at end of file
+        return f"Ajuste {self.clave} - {self.importe}"
+
+
+class Tarea(models.Model):
+    tipo = models.CharField(max_length=100, verbose_name="Tipo")
+    parametros = models.JSONField(default=dict, blank=True, verbose_name="Parámetros")
+    estado = models.CharField(
+        max_length=20,
+        choices=(
+            ("Pendiente", "Pendiente"),
+            ("En curso", "En curso"),
+            ("Completada", "Completada"),
+            ("Fallida", "Fallida"),
+        ),
+        default="Pendiente",
+        verbose_name="Estado"
+    )
+    progreso = models.PositiveIntegerField(default=0, verbose_name="Progreso")
+    total = models.PositiveIntegerField(default=0, verbose_name="Total")
+    mensaje = models.CharField(max_length=255, blank=True, default="", verbose_name="Mensaje")
+    intentos = models.PositiveIntegerField(default=0, verbose_name="Intentos")
+    max_intentos = models.PositiveIntegerField(default=3, verbose_name="Máximo de Intentos")
+    disponible_desde = models.DateTimeField(
+        default=timezone.now,
+        verbose_name="Disponible desde",
+        help_text="La tarea no se reclama antes de esta fecha (se usa para espaciar los reintentos)."
+    )
+    trabajador = models.CharField(max_length=100, blank=True, default="", verbose_name="Trabajador")
+    bloqueada_hasta = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="Bloqueada hasta",
+        help_text="Si el trabajador no reporta progreso antes de esta fecha, la tarea vuelve a reclamarse."
+    )
+    resultado = models.FileField(upload_to="tareas/", null=True, blank=True, verbose_name="Resultado")
+    error = models.TextField(blank=True, null=True, verbose_name="Error")
+    # Sin restricción de clave foránea: los usuarios están en default y las
+    # tareas en la base de cada empresa (ver apps.empresas)
+    creado_por = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        db_constraint=False,
+        null=True,
+        blank=True,
+        related_name="tareas",
+        verbose_name="Creado por"
+    )
+    fecha_creacion = models.DateTimeField(auto_now_add=True, verbose_name="Fecha de Creación")
+    fecha_inicio = models.DateTimeField(null=True, blank=True, verbose_name="Fecha de Inicio")
+    fecha_fin = models.DateTimeField(null=True, blank=True, verbose_name="Fecha de Fin")
+
+    class Meta:
+        verbose_name = "Tarea"
+        verbose_name_plural = "Tareas"
+        ordering = ("-fecha_creacion",)
+        indexes = [
+            models.Index(fields=["estado", "disponible_desde"], name="tarea_estado_disp_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.tipo} #{self.pk} - {self.estado}"
+
+
+class TokenAPI(models.Model):
+    # Sin restricción de clave foránea, como Tarea.creado_por
+    usuario = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        db_constraint=False,
+        related_name="tokens_api",
+        verbose_name="Usuario"
+    )
+    nombre = models.CharField(
+        max_length=100,
+        verbose_name="Nombre",
+        help_text="Sistema que usa el token (p. ej. Nómina, Compras)."
+    )
+    clave = models.CharField(max_length=64, unique=True, editable=False, verbose_name="Clave")
+    activo = models.BooleanField(default=True, verbose_name="Activo")
+    fecha_creacion = models.DateTimeField(auto_now_add=True, verbose_name="Fecha de Creación")
+    ultimo_uso = models.DateTimeField(null=True, blank=True, editable=False, verbose_name="Último Uso")
+
+    class Meta:
+        verbose_name = "Token de API"
+        verbose_name_plural = "Tokens de API"
+
+    def save(self, *args, **kwargs):
+        if not self.clave:
+            self.clave = secrets.token_hex(32)
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.nombre} ({self.usuario})"
+
+
+class EjercicioCerrado(models.Model):
+    año = models.PositiveIntegerField(unique=True, verbose_name="Año")
+    fecha_cierre = models.DateTimeField(auto_now_add=True, verbose_name="Fecha de Cierre")
+    resumen = models.JSONField(
+        default=dict,
+        blank=True,
+        verbose_name="Resumen",
+        help_text="Cantidad de registros trasladados a la base de datos de archivo por modelo."
+    )
+
+    class Meta:
+        verbose_name = "Ejercicio Cerrado"
+        verbose_name_plural = "Ejercicios Cerrados"
+        ordering = ("-año",)
+
+    def __str__(self):
+        return f"Ejercicio {self.año}"
+
+
+class RegistroAuditoria(models.Model):
+    """Cambio de un registro de negocio; solo se añaden filas (ver apps.auditoria)."""
+    ACCIONES = (
+        ("A", "Alta"),
+        ("M", "Modificación"),
+        ("B", "Baja"),
+    )
+
+    modelo = models.CharField(max_length=40, verbose_name="Modelo")
+    objeto_id = models.BigIntegerField(verbose_name="Id del Objeto")
+    accion = models.CharField(max_length=1, choices=ACCIONES, verbose_name="Acción")
+    # Sin restricción de clave foránea: borrar un usuario no debe tocar el historial
+    usuario = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        blank=True,
+        related_name="+",
+        verbose_name="Usuario"
+    )
+    fecha = models.DateTimeField(verbose_name="Fecha")
+    cambios = models.JSONField(
+        default=dict,
+        verbose_name="Cambios",
+        help_text="Campos modificados: {campo: [valor anterior, valor nuevo]}."
+    )
+
+    class Meta:
+        verbose_name = "Registro de Auditoría"
+        verbose_name_plural = "Registros de Auditoría"
+        ordering = ("-id",)
+        indexes = [
+            models.Index(fields=["modelo", "objeto_id", "-id"], name="auditoria_objeto_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.pk:
+            raise ValueError("Los registros de auditoría no se modifican.")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValueError("Los registros de auditoría no se borran.")
+
+    def __str__(self):
+        return f"{self.modelo} #{self.objeto_id} - {self.get_accion_display()}"
+
+
+# Modelos proxy de solo lectura sobre la base de datos de archivo
+# (ver apps.routers.RouterArchivo).
+class SolicitudArchivada(SolicitudesDePago):
+    en_archivo = True
+
+    class Meta:
+        proxy = True
+        verbose_name = "Solicitud de Pago archivada"
+        verbose_name_plural = "Solicitudes de Pago archivadas"
+
+
+class OperacionArchivada(OperacionesEmitidas):
+    en_archivo = True
+
+    class Meta:
+        proxy = True
+        verbose_name = "Operación Emitida archivada"
+        verbose_name_plural = "Operaciones Emitidas archivadas"
+        ordering = ("-fecha_emision",)
+
+
+class IngresoArchivado(Ingreso):
+    en_archivo = True
+
+    class Meta:
+        proxy = True
+        verbose_name = "Ingreso archivado"
+        verbose_name_plural = "Ingresos archivados"
+
+
+class ServicioBancarioArchivado(ServicioBancario):
+    en_archivo = True
+
+    class Meta:
+        proxy = True
+        verbose_name = "Servicio Bancario archivado"
+        verbose_name_plural = "Servicios Bancarios archivados"
+
+
+class AjusteInversionesArchivado(AjusteInversiones):
+    en_archivo = True
+
+    class Meta:
+        proxy = True
+        verbose_name = "Ajuste de Inversión archivado"
+        verbose_name_plural = "Ajustes de Inversiones archivados"
+
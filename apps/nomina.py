@@ -0,0 +1,229 @@
+"""
+Importación de la nómina mensual como H90 de salario (Cheque).
+
+El fichero (CSV o XLSX) tiene una fila por concepto de salario con las
+columnas ``fecha``, ``cuenta``, ``concepto`` e ``importe`` y, opcionalmente,
+``proveedor`` (código o identificador), ``descripcion``, ``forma_de_pago`` y
+``grupo``. Las filas con el mismo ``grupo`` forman un único H90; sin esa
+columna cada fila es un H90.
+
+Todas las filas se validan antes de escribir: si alguna tiene errores no se
+crea nada y se devuelven los errores por número de fila del fichero.
+"""
+import csv
+import io
+import unicodedata
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+
+from django.db.models import Q
+
+from .models import Proveedores, ConceptoSalario
+from .servicios import ErroresLote, guardar_lote, validar_lote
+
+COLUMNAS_OBLIGATORIAS = ("fecha", "cuenta", "concepto", "importe")
+FORMATOS_FECHA = ("%d/%m/%Y", "%Y-%m-%d")
+
+
+class ErrorImportacion(Exception):
+    """Errores por fila del fichero: ``{numero_de_fila: [mensajes]}``."""
+
+    def __init__(self, errores):
+        super().__init__(f"{len(errores)} filas con errores.")
+        self.errores = errores
+
+
+def _normalizar(texto):
+    texto = unicodedata.normalize("NFKD", str(texto or "")).encode("ascii", "ignore").decode()
+    return texto.strip().lower().replace(" ", "_")
+
+
+def _openpyxl():
+    # Al leer el primer .xlsx y no al arrancar: importarlo cuesta
+    try:
+        import openpyxl
+    except ImportError:  # pragma: no cover - solo hace falta para ficheros .xlsx
+        raise ErrorImportacion({0: ["Para importar ficheros .xlsx instale openpyxl."]})
+    return openpyxl
+
+
+def _leer_texto(ruta):
+    # Excel en español guarda los CSV en Windows-1252 salvo que se elija UTF-8
+    datos = ruta.read_bytes()
+    for codificacion in ("utf-8-sig", "cp1252"):
+        try:
+            return datos.decode(codificacion)
+        except UnicodeDecodeError:
+            continue
+    raise ErrorImportacion({1: ["El fichero no está en UTF-8 ni en Windows-1252."]})
+
+
+def leer_filas(ruta):
+    """Devuelve ``[(numero_de_fila, {columna: valor})]`` del CSV o XLSX."""
+    ruta = Path(ruta)
+    if ruta.suffix.lower() in (".xlsx", ".xlsm"):
+        libro = _openpyxl().load_workbook(ruta, read_only=True, data_only=True)
+        try:
+            filas = libro.active.iter_rows(values_only=True)
+            cabecera = [_normalizar(c) for c in next(filas, ())]
+            datos = [(n, dict(zip(cabecera, fila))) for n, fila in enumerate(filas, start=2)]
+        finally:
+            libro.close()
+    else:
+        contenido = _leer_texto(ruta)
+        try:
+            dialecto = csv.Sniffer().sniff(contenido.splitlines()[0] if contenido else ",", delimiters=",;\t")
+        except csv.Error:
+            # Una sola columna: sin separador que detectar; faltarán columnas obligatorias
+            dialecto = csv.excel
+        lector = csv.reader(io.StringIO(contenido), dialecto)
+        cabecera = [_normalizar(c) for c in next(lector, [])]
+        datos = [(n, dict(zip(cabecera, fila))) for n, fila in enumerate(lector, start=2)]
+
+    faltan = [c for c in COLUMNAS_OBLIGATORIAS if c not in cabecera]
+    if faltan:
+        raise ErrorImportacion({1: [f"Faltan las columnas: {', '.join(faltan)}."]})
+    # Las filas totalmente vacías (habituales al final de las hojas) se ignoran
+    return [(n, fila) for n, fila in datos if any(v not in (None, "") for v in fila.values())]
+
+
+def _fecha(valor):
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    for formato in FORMATOS_FECHA:
+        try:
+            return datetime.strptime(str(valor).strip(), formato).date()
+        except ValueError:
+            continue
+    raise ValueError(f"Fecha inválida: '{valor}'. Use dd/mm/aaaa.")
+
+
+def _importe(valor):
+    if isinstance(valor, (int, float, Decimal)):
+        return Decimal(str(valor))
+    texto = str(valor or "").strip().replace(" ", "")
+    if "," in texto and "." in texto:
+        texto = texto.replace(".", "").replace(",", ".")
+    elif "," in texto:
+        texto = texto.replace(",", ".")
+    try:
+        return Decimal(texto)
+    except InvalidOperation:
+        raise ValueError(f"Importe inválido: '{valor}'.")
+
+
+def _texto(valor):
+    return str(valor).strip() if valor not in (None, "") else ""
+
+
+def _concepto(valor):
+    # Acepta "salario", "PRIMA", "pago de utilidades"... con el nombre canónico
+    texto = _texto(valor)
+    for opcion, _ in ConceptoSalario.CONCEPTO_CHOICES:
+        if _normalizar(opcion) == _normalizar(texto):
+            return opcion
+    return texto
+
+
+def _buscar_proveedores(filas):
+    claves = {_texto(fila.get("proveedor")) for _, fila in filas} - {""}
+    if not claves:
+        return {}
+    encontrados = {}
+    for proveedor in Proveedores.objects.filter(Q(codigo__in=claves) | Q(ident_del_prov__in=claves)):
+        encontrados.setdefault(proveedor.codigo, proveedor)
+        encontrados.setdefault(proveedor.ident_del_prov, proveedor)
+    return encontrados
+
+
+def preparar_solicitudes(filas):
+    """Agrupa las filas en solicitudes.
+
+    Devuelve ``(solicitudes, filas_por_solicitud, errores)``; las filas que no
+    se pueden interpretar quedan en ``errores`` y fuera de las solicitudes.
+    """
+    errores = {}
+    proveedores = _buscar_proveedores(filas)
+    grupos = OrderedDict()
+
+    for numero, fila in filas:
+        mensajes = []
+        try:
+            fecha = _fecha(fila.get("fecha"))
+        except ValueError as e:
+            mensajes.append(str(e))
+            fecha = None
+        try:
+            importe = _importe(fila.get("importe"))
+        except ValueError as e:
+            mensajes.append(str(e))
+            importe = None
+        clave_proveedor = _texto(fila.get("proveedor"))
+        proveedor = proveedores.get(clave_proveedor)
+        if clave_proveedor and proveedor is None:
+            mensajes.append(f"No existe el proveedor '{clave_proveedor}'.")
+        if mensajes:
+            errores[numero] = mensajes
+            continue
+
+        datos = {
+            "fecha_del_modelo": fecha,
+            "forma_de_pago": _texto(fila.get("forma_de_pago")) or "Cheque",
+            "cuenta_de_empresa": _texto(fila.get("cuenta")).upper(),
+            "identificador_del_proveedor": proveedor.pk if proveedor else None,
+            "descripcion": _texto(fila.get("descripcion")) or None,
+        }
+        grupo = _texto(fila.get("grupo")) or f"fila-{numero}"
+        solicitud = grupos.setdefault(grupo, dict(datos, conceptos_salarios=[], filas=[]))
+        if any(solicitud[campo] != valor for campo, valor in datos.items() if campo != "descripcion"):
+            errores[numero] = [f"La fila no coincide en fecha, cuenta, forma de pago o proveedor con el resto del grupo '{grupo}'."]
+            continue
+        solicitud["conceptos_salarios"].append({"concepto": _concepto(fila.get("concepto")), "importe": importe})
+        solicitud["filas"].append(numero)
+
+    solicitudes = list(grupos.values())
+    filas_por_solicitud = [s.pop("filas") for s in solicitudes]
+    return solicitudes, filas_por_solicitud, errores
+
+
+def _errores_por_fila(errores_lote, filas_por_solicitud):
+    errores = {}
+    for indice, campos in errores_lote.items():
+        mensajes = []
+        for campo, detalle in campos.items():
+            if isinstance(detalle, dict):
+                for conceptos in detalle.values():
+                    for campo_concepto, textos in conceptos.items():
+                        mensajes.extend(f"{campo_concepto}: {t}" for t in textos)
+            elif campo == "__all__":
+                mensajes.extend(detalle)
+            else:
+                mensajes.extend(f"{campo}: {t}" for t in detalle)
+        for numero in filas_por_solicitud[indice]:
+            errores.setdefault(numero, []).extend(mensajes)
+    return errores
+
+
+def importar_nomina(ruta, simular=False):
+    """Valida el fichero completo y crea las solicitudes en una transacción.
+
+    Devuelve la lista de solicitudes creadas (o validadas, si ``simular``) y
+    lanza ``ErrorImportacion`` sin escribir nada si alguna fila es inválida.
+    """
+    solicitudes, filas_por_solicitud, errores = preparar_solicitudes(leer_filas(ruta))
+    preparadas = []
+    if solicitudes:
+        try:
+            preparadas = validar_lote(solicitudes)
+        except ErroresLote as e:
+            for numero, mensajes in _errores_por_fila(e.errores, filas_por_solicitud).items():
+                errores.setdefault(numero, []).extend(mensajes)
+    if errores:
+        raise ErrorImportacion(errores)
+    if not simular:
+        guardar_lote(preparadas)
+    return [s for s, _, _ in preparadas]
@@ -0,0 +1,119 @@
+"""
+Compresión y validadores HTTP de las respuestas.
+
+``MiddlewareCompresion`` comprime con gzip las respuestas de texto (HTML del
+admin, JSON) a partir de ``COMPRESION_TAMAÑO_MINIMO`` bytes; por debajo, las
+cabeceras y el tiempo de compresión no compensan.
+
+Los listados del admin y los endpoints JSON se sirven con un ``ETag``
+calculado con ``respuesta_condicional()`` a partir de las versiones de las
+tablas de las que dependen (``apps.cache_etiquetas``), de modo que se obtiene
+antes de consultar nada: si el navegador ya tiene la
+versión vigente, se responde 304 sin ejecutar la vista. Como el admin marca
+sus vistas con ``never_cache`` (``no-store``) y así el navegador no guardaría
+la respuesta, ``MiddlewareRevalidacion`` cambia esas cabeceras por
+``private, no-cache`` en las respuestas con validadores: se guardan solo en
+el navegador del usuario y se revalidan en cada petición.
+"""
+import hashlib
+from datetime import date
+from functools import lru_cache
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import quote_etag
+
+from .cache_etiquetas import etiqueta, versiones
+
+TIPOS_COMPRIMIBLES = ("text/", "application/json", "application/javascript", "image/svg+xml")
+
+
+def _tamaño_minimo():
+    return getattr(settings, "COMPRESION_TAMAÑO_MINIMO", 1024)
+
+
+class MiddlewareCompresion(GZipMiddleware):
+    """GZipMiddleware solo para respuestas de texto de al menos el tamaño mínimo."""
+
+    def process_response(self, request, response):
+        tipo = response.get("Content-Type", "")
+        if not tipo.startswith(TIPOS_COMPRIMIBLES):
+            return response
+        if not response.streaming and len(response.content) < _tamaño_minimo():
+            return response
+        return super().process_response(request, response)
+
+
+class MiddlewareRevalidacion:
+    """Permite guardar en el navegador las respuestas de ``respuesta_condicional()``."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if getattr(response, "revalidable", False):
+            response.headers["Cache-Control"] = "private, no-cache"
+            response.headers.pop("Expires", None)
+        return response
+
+
+@lru_cache(maxsize=None)
+def _version_codigo():
+    """Cambia al desplegar otras plantillas o vistas, aunque los datos sean los mismos."""
+    base = Path(settings.BASE_DIR)
+    archivos = [*(base / "apps").glob("*.py"), *(base / "templates").rglob("*.html")]
+    return max((int(a.stat().st_mtime) for a in archivos), default=0)
+
+
+def _mensajes_pendientes(request):
+    almacen = getattr(request, "_messages", None)
+    # _loaded_messages los lee sin marcarlos como mostrados
+    return bool(almacen is not None and almacen._loaded_messages)
+
+
+def calcular_etag(request, etiquetas, *variantes):
+    """ETag de la respuesta para el usuario y las versiones actuales.
+
+    ``variantes`` son los demás datos de los que depende la respuesta además
+    de la URL completa, el usuario (con sus permisos) y la empresa.
+    """
+    # Los permisos del usuario deciden las acciones y los enlaces de la página
+    actuales = versiones({*etiquetas, etiqueta(get_user_model())})
+    partes = [
+        _version_codigo(),
+        request.get_full_path(),
+        getattr(request.user, "pk", None),
+        getattr(request, "empresa", None),
+        # El formulario de acciones lleva el token CSRF, que cambia al iniciar sesión
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME),
+        date.today().isoformat(),
+        *actuales,
+        *variantes,
+    ]
+    return hashlib.md5("|".join(map(str, partes)).encode()).hexdigest()
+
+
+def respuesta_condicional(request, etiquetas, generar, *variantes):
+    """Respuesta de ``generar()`` con ETag, o 304 si el navegador ya la tiene.
+
+    Solo para GET y HEAD, y no cuando hay mensajes pendientes de mostrar: una
+    respuesta 304 no los mostraría. Sin ``Last-Modified``: la fecha de las
+    tablas no cambia al cambiar de usuario, de empresa o de versión, y con
+    ``If-Modified-Since`` solo se respondería 304 con la página de otro.
+    """
+    if request.method not in ("GET", "HEAD") or _mensajes_pendientes(request):
+        return generar()
+    etag = quote_etag(calcular_etag(request, etiquetas, *variantes))
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = generar()
+        if response.status_code != 200:
+            return response
+        response.headers["ETag"] = etag
+    patch_vary_headers(response, ("Cookie",))
+    response.revalidable = True
+    return response
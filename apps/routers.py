@@ -0,0 +1,58 @@
+from django.db import DEFAULT_DB_ALIAS
+
+from .archivo import MODELOS_ARCHIVO
+from .empresas import alias_archivo, alias_principal, es_base_de_archivo, es_base_de_empresa
+
+
+class RouterArchivo:
+    """Envía los modelos proxy ``*Archivado`` a la base de datos de archivo.
+
+    Los modelos normales siguen en la base principal; los objetos leídos del
+    archivo resuelven sus relaciones en el archivo porque Django usa la base
+    de datos de la instancia cuando ningún router decide otra cosa.
+    """
+
+    def db_for_read(self, model, **hints):
+        if getattr(model, "en_archivo", False):
+            return alias_archivo()
+        return None
+
+    def db_for_write(self, model, **hints):
+        if getattr(model, "en_archivo", False):
+            return alias_archivo()
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if es_base_de_archivo(db):
+            return app_label == "apps" and model_name in MODELOS_ARCHIVO
+        return None
+
+
+class RouterEmpresas:
+    """Envía los modelos de ``apps`` a la base de la empresa activa (ver ``apps.empresas``).
+
+    Los demás (usuarios, sesiones, admin) son comunes a todas las empresas y
+    están siempre en ``default``. Va después de ``RouterArchivo``.
+    """
+
+    def _base(self, model, instance=None, **hints):
+        if model._meta.app_label != "apps":
+            return DEFAULT_DB_ALIAS
+        # Las relaciones de un objeto de apps se leen en su misma base (archivo)
+        if instance is not None and instance._meta.app_label == "apps" and instance._state.db:
+            return None
+        return alias_principal()
+
+    db_for_read = _base
+    db_for_write = _base
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Las claves foráneas a usuarios cruzan de la base de la empresa a default
+        if obj1._meta.app_label != "apps" or obj2._meta.app_label != "apps":
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if es_base_de_empresa(db):
+            return app_label == "apps"
+        return None
@@ -0,0 +1,395 @@
+"""
+Operaciones en lote sobre las solicitudes de pago.
+
+Aplican las mismas reglas que el admin (``clean()`` de los modelos y las
+reglas de conceptos de ``apps.conceptos``), pero validan todas las filas
+antes de escribir y escriben con consultas por conjuntos dentro de una
+única transacción.
+"""
+from datetime import date
+from decimal import Decimal
+
+from django import forms
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Exists, F, Max, OuterRef, Q, Subquery
+from django.db.models.functions import ExtractYear
+
+from .analisis import invalidar_meses
+from .auditoria import anotar_altas, anotar_modificaciones
+from .cache_etiquetas import invalidar
+from .conceptos import (
+    calcular_importe, validar_conceptos_normales, validar_conceptos_salario, validar_tablas_conceptos,
+)
+from .empresas import alias_principal
+from .models import Proveedores, SolicitudesDePago, ConceptoNormal, ConceptoSalario, OperacionesEmitidas
+
+TAMAÑO_LOTE = 500
+PROVEEDORES_POR_LOTE = 200
+
+# Campo de la solicitud: campo del proveedor del que se copia
+DATOS_PROVEEDOR = {
+    "nombre_del_proveedor": "tit_de_la_cuenta",
+    "codigo_del_proveedor": "codigo",
+    "cuenta_bancaria": "cuenta_banc",
+    "direccion_proveedor": "direccion",
+}
+
+# Tipos admitidos en cada campo; las fechas y los importes llegan ya
+# convertidos desde la importación de nómina
+TIPOS_SOLICITUD = {
+    "numero_de_H90": (int, str),
+    "fecha_del_modelo": (str, date),
+    "forma_de_pago": (str,),
+    "cuenta_de_empresa": (str,),
+    "descripcion": (str,),
+}
+TIPOS_CONCEPTO = {
+    "concepto": (str,),
+    "numero": (int, str),
+    "importe": (int, float, Decimal, str),
+}
+RELACIONES = ("conceptos_normales", "conceptos_salarios")
+
+
+class ErroresLote(Exception):
+    """Errores de validación por fila: ``{indice: {campo: [mensajes]}}``."""
+
+    def __init__(self, errores):
+        super().__init__(f"{len(errores)} filas con errores.")
+        self.errores = errores
+
+
+def _mensajes(error):
+    if hasattr(error, "error_dict"):
+        return error.message_dict
+    return {"__all__": error.messages}
+
+
+def _validar_instancia(instancia, exclude):
+    try:
+        instancia.clean_fields(exclude=exclude)
+    except ValidationError as e:
+        return _mensajes(e)
+    try:
+        instancia.clean()
+    except ValidationError as e:
+        return _mensajes(e)
+    return {}
+
+
+def _id_proveedor(valor):
+    if valor in (None, ""):
+        return None
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        return False
+
+
+def _booleano(valor):
+    # true/false, "true"/"false" o 1/0; None con cualquier otra cosa
+    return forms.NullBooleanField().to_python(valor)
+
+
+def _valores(datos, tipos, errores):
+    """Los valores de ``datos`` con el tipo esperado; los demás, ``None`` y un error."""
+    valores = {}
+    for campo, admitidos in tipos.items():
+        valor = datos.get(campo)
+        if valor is not None and (not isinstance(valor, admitidos) or isinstance(valor, bool)):
+            errores[campo] = ["Tipo de dato no válido."]
+            valor = None
+        valores[campo] = valor
+    return valores
+
+
+def _preparar_conceptos(fila, errores):
+    """``{relacion: [(posicion, datos)]}`` de las listas de conceptos que son objetos."""
+    conceptos = {}
+    for relacion in RELACIONES:
+        lista = fila.get(relacion) or []
+        if not isinstance(lista, list):
+            errores[relacion] = ["Debe ser una lista de conceptos."]
+            lista = []
+        conceptos[relacion] = []
+        for j, datos in enumerate(lista):
+            errores_concepto = {}
+            if isinstance(datos, dict):
+                valores = _valores(datos, TIPOS_CONCEPTO, errores_concepto)
+            else:
+                errores_concepto["__all__"] = ["Cada concepto debe ser un objeto."]
+            if errores_concepto:
+                errores.setdefault(relacion, {})[str(j)] = errores_concepto
+            else:
+                conceptos[relacion].append((j, valores))
+    return conceptos
+
+
+def _preparar_solicitud(fila, proveedores):
+    errores = {}
+    inversiones = _booleano(fila.get("inversiones", False))
+    if inversiones is None:
+        errores["inversiones"] = ["Debe ser true o false."]
+    valores = _valores(fila, TIPOS_SOLICITUD, errores)
+    solicitud = SolicitudesDePago(
+        numero_de_H90=valores["numero_de_H90"] or None,
+        fecha_del_modelo=valores["fecha_del_modelo"],
+        forma_de_pago=valores["forma_de_pago"] or "",
+        cuenta_de_empresa=valores["cuenta_de_empresa"] or "",
+        inversiones=bool(inversiones),
+        descripcion=valores["descripcion"] or None,
+        estado="Activo",
+    )
+
+    id_proveedor = _id_proveedor(fila.get("identificador_del_proveedor"))
+    if id_proveedor is False or (id_proveedor is not None and id_proveedor not in proveedores):
+        errores["identificador_del_proveedor"] = [
+            f"No existe el proveedor {fila.get('identificador_del_proveedor')}."
+        ]
+    elif id_proveedor is not None:
+        solicitud.identificador_del_proveedor = proveedores[id_proveedor]
+
+    # Los campos con un tipo no válido quedan vacíos y conservan ese error
+    for campo, mensajes in _validar_instancia(solicitud, exclude=["identificador_del_proveedor"]).items():
+        errores.setdefault(campo, mensajes)
+
+    conceptos = _preparar_conceptos(fila, errores)
+    instancias = {}
+    for relacion, modelo in (("conceptos_normales", ConceptoNormal), ("conceptos_salarios", ConceptoSalario)):
+        instancias[relacion] = []
+        for j, c in conceptos[relacion]:
+            concepto = modelo(concepto=c["concepto"] or "", numero=c["numero"] or None, importe=c["importe"])
+            error = _validar_instancia(concepto, exclude=["solicitud"])
+            if error:
+                errores.setdefault(relacion, {})[str(j)] = error
+            instancias[relacion].append(concepto)
+    normales, salarios = instancias["conceptos_normales"], instancias["conceptos_salarios"]
+
+    if "conceptos_normales" not in errores and "conceptos_salarios" not in errores:
+        try:
+            if normales:
+                validar_conceptos_normales([c.concepto for c in normales])
+            if salarios:
+                validar_conceptos_salario([c.numero for c in salarios], solicitud.forma_de_pago)
+            validar_tablas_conceptos(bool(normales), bool(salarios))
+        except ValidationError as e:
+            errores.setdefault("__all__", []).extend(e.messages)
+
+    return solicitud, normales, salarios, errores
+
+
+def _asignar_numeros_h90(solicitudes):
+    """Asigna los H90 que faltan con una consulta agrupada por forma, cuenta y año."""
+    pendientes = [s for s in solicitudes if not s.numero_de_H90]
+    if not pendientes:
+        return
+    grupos = {(s.forma_de_pago, s.cuenta_de_empresa, s.fecha_del_modelo.year) for s in pendientes}
+
+    filtro = Q()
+    for forma, cuenta, año in grupos:
+        filtro |= Q(forma_de_pago=forma, cuenta_de_empresa=cuenta, fecha_del_modelo__year=año)
+    ultimos = {
+        (fila["forma_de_pago"], fila["cuenta_de_empresa"], fila["año"]): fila["ultimo"] or 0
+        for fila in SolicitudesDePago.objects.filter(filtro)
+        .order_by()
+        .values("forma_de_pago", "cuenta_de_empresa", año=ExtractYear("fecha_del_modelo"))
+        .annotate(ultimo=Max("numero_de_H90"))
+    }
+    # Los números indicados explícitamente en el propio lote también cuentan
+    for s in solicitudes:
+        if s.numero_de_H90:
+            clave = (s.forma_de_pago, s.cuenta_de_empresa, s.fecha_del_modelo.year)
+            ultimos[clave] = max(ultimos.get(clave, 0), s.numero_de_H90)
+
+    for s in pendientes:
+        clave = (s.forma_de_pago, s.cuenta_de_empresa, s.fecha_del_modelo.year)
+        ultimos[clave] = ultimos.get(clave, 0) + 1
+        s.numero_de_H90 = ultimos[clave]
+
+
+def validar_lote(filas):
+    """Valida todas las filas sin escribir nada.
+
+    Devuelve la lista de ``(solicitud, normales, salarios)`` preparados o lanza
+    ``ErroresLote`` con los errores de todas las filas.
+    """
+    ids = {_id_proveedor(f.get("identificador_del_proveedor")) for f in filas}
+    proveedores = Proveedores.objects.in_bulk([i for i in ids if i])
+
+    errores = {}
+    preparadas = []
+    explicitos = {}
+    for i, fila in enumerate(filas):
+        solicitud, normales, salarios, errores_fila = _preparar_solicitud(fila, proveedores)
+        if solicitud.numero_de_H90 and "fecha_del_modelo" not in errores_fila:
+            clave = (solicitud.forma_de_pago, solicitud.cuenta_de_empresa,
+                     solicitud.fecha_del_modelo.year, solicitud.numero_de_H90)
+            if clave in explicitos:
+                errores_fila.setdefault("numero_de_H90", []).append(
+                    f"El H90 {solicitud.numero_de_H90} se repite en la fila {explicitos[clave]}."
+                )
+            explicitos.setdefault(clave, i)
+        if errores_fila:
+            errores[i] = errores_fila
+        preparadas.append((solicitud, normales, salarios))
+
+    if errores:
+        raise ErroresLote(errores)
+    return preparadas
+
+
+def crear_solicitudes_en_lote(filas):
+    """Crea solicitudes con sus conceptos; todas o ninguna.
+
+    Cada fila es un diccionario con los campos de ``SolicitudesDePago`` y las
+    listas ``conceptos_normales`` / ``conceptos_salarios``.
+    """
+    return guardar_lote(validar_lote(filas))
+
+
+def guardar_lote(preparadas):
+    """Escribe en una transacción el resultado de ``validar_lote``."""
+    solicitudes = []
+    for solicitud, normales, salarios in preparadas:
+        solicitud.copiar_datos_proveedor()
+        total, _ = calcular_importe(
+            [(c.concepto, c.importe) for c in normales],
+            [(c.concepto, c.importe) for c in salarios],
+        )
+        solicitud.importe_total = total
+        solicitud.importe_inversiones = total if solicitud.inversiones else 0
+        solicitudes.append(solicitud)
+
+    with transaction.atomic(using=alias_principal()):
+        _asignar_numeros_h90(solicitudes)
+        SolicitudesDePago.objects.bulk_create(solicitudes, batch_size=TAMAÑO_LOTE)
+
+        todos_normales, todos_salarios = [], []
+        for solicitud, normales, salarios in preparadas:
+            for concepto in normales:
+                concepto.solicitud = solicitud
+            for concepto in salarios:
+                concepto.solicitud = solicitud
+            todos_normales.extend(normales)
+            todos_salarios.extend(salarios)
+        ConceptoNormal.objects.bulk_create(todos_normales, batch_size=TAMAÑO_LOTE)
+        ConceptoSalario.objects.bulk_create(todos_salarios, batch_size=TAMAÑO_LOTE)
+        anotar_altas(solicitudes)
+        invalidar(SolicitudesDePago, ConceptoNormal, ConceptoSalario)
+        invalidar_meses([s.fecha_del_modelo for s in solicitudes])
+
+    return [(s, n, c) for s, n, c in preparadas]
+
+
+def sincronizar_datos_proveedores(proveedores=None, simular=False):
+    """Copia los datos actuales de los proveedores a sus solicitudes Activas.
+
+    Las solicitudes Emitidas o Canceladas conservan los datos con los que se
+    emitieron. Se hace un único UPDATE por lote de proveedores, solo sobre
+    las solicitudes cuyos datos difieren. Devuelve la cantidad de solicitudes
+    actualizadas (o que se actualizarían, si ``simular``).
+    """
+    if proveedores is None:
+        ids = list(Proveedores.objects.order_by("pk").values_list("pk", flat=True))
+    else:
+        ids = sorted(p.pk if isinstance(p, Proveedores) else int(p) for p in proveedores)
+
+    origen = Proveedores.objects.filter(pk=OuterRef("identificador_del_proveedor_id"))
+    asignaciones = {
+        campo: Subquery(origen.values(campo_proveedor)[:1])
+        for campo, campo_proveedor in DATOS_PROVEEDOR.items()
+    }
+    distintos = Q()
+    for campo, campo_proveedor in DATOS_PROVEEDOR.items():
+        distintos |= ~Q(**{campo: F(f"identificador_del_proveedor__{campo_proveedor}")})
+
+    actualizadas = 0
+    for inicio in range(0, len(ids), PROVEEDORES_POR_LOTE):
+        lote = ids[inicio:inicio + PROVEEDORES_POR_LOTE]
+        # estado="Activo" forma parte del UPDATE: una solicitud emitida
+        # mientras tanto no se modifica.
+        desactualizadas = SolicitudesDePago.objects.filter(
+            distintos, estado="Activo", identificador_del_proveedor__in=lote
+        )
+        with transaction.atomic(using=alias_principal()):
+            anteriores, nuevos = {}, {}
+            filas = desactualizadas.values(
+                "pk", *DATOS_PROVEEDOR, *(f"identificador_del_proveedor__{c}" for c in DATOS_PROVEEDOR.values())
+            )
+            for fila in filas.iterator(chunk_size=TAMAÑO_LOTE * 4):
+                anteriores[fila["pk"]] = {campo: fila[campo] for campo in DATOS_PROVEEDOR}
+                nuevos[fila["pk"]] = {
+                    campo: fila[f"identificador_del_proveedor__{campo_proveedor}"]
+                    for campo, campo_proveedor in DATOS_PROVEEDOR.items()
+                }
+            if simular or not anteriores:
+                actualizadas += len(anteriores)
+                continue
+            actualizadas += desactualizadas.update(**asignaciones)
+            anotar_modificaciones(SolicitudesDePago, anteriores, nuevos)
+            invalidar(SolicitudesDePago)
+    return actualizadas
+
+
+def _emitibles():
+    # Activas, o Emitidas desde el formulario a las que aún no se les creó la
+    # operación. La misma condición va en el UPDATE, así que una solicitud
+    # nunca se emite dos veces aunque el formulario se envíe dos veces.
+    return Q(estado__in=("Activo", "Emitido")) & ~Q(
+        Exists(OperacionesEmitidas.objects.filter(solicitud=OuterRef("pk")))
+    )
+
+
+def emitir_solicitudes(ids, numero_serie, fecha_inicial):
+    """Emite las solicitudes indicadas en una transacción; todas o ninguna.
+
+    Cada solicitud recibe una operación en Tránsito con un número de serie
+    consecutivo a partir de ``numero_serie``, en orden de forma, cuenta y
+    H90. Las que ya tienen operación se omiten. Devuelve la lista de
+    operaciones creadas; lanza ``ErroresLote`` (por id de solicitud) si
+    alguna operación no es válida.
+    """
+    with transaction.atomic(using=alias_principal()):
+        solicitudes = list(
+            SolicitudesDePago.objects.filter(_emitibles(), pk__in=ids)
+            .order_by("forma_de_pago", "cuenta_de_empresa", "numero_de_H90", "pk")
+            .only("numero_de_H90", "forma_de_pago", "cuenta_de_empresa", "fecha_del_modelo", "importe_total", "estado")
+        )
+        if not solicitudes:
+            return []
+
+        hoy = date.today()
+        inicio = int(numero_serie) if str(numero_serie).isdigit() else None
+        operaciones, errores = [], {}
+        for i, solicitud in enumerate(solicitudes):
+            operacion = OperacionesEmitidas(
+                solicitud=solicitud,
+                fecha_emision=hoy,
+                numero_operacion=f"H90-{solicitud.numero_de_H90}-{solicitud.forma_de_pago}-"
+                                 f"{solicitud.cuenta_de_empresa}-{solicitud.fecha_del_modelo.year}",
+                estado="Tránsito",
+                importe_emitido=solicitud.importe_total,
+                numero_serie=f"{inicio + i:07d}" if inicio is not None else numero_serie,
+                fecha_inicial=fecha_inicial,
+            )
+            error = _validar_instancia(operacion, exclude=["solicitud"])
+            if error:
+                errores[solicitud.pk] = error
+            operaciones.append(operacion)
+        if errores:
+            raise ErroresLote(errores)
+
+        anteriores = {s.pk: {"estado": s.estado} for s in solicitudes}
+        emitidas = SolicitudesDePago.objects.filter(
+            _emitibles(), pk__in=list(anteriores)
+        ).update(estado="Emitido")
+        if emitidas != len(solicitudes):
+            # Otra petición emitió alguna entre la lectura y el UPDATE
+            raise ErroresLote({None: {"__all__": ["Algunas solicitudes se emitieron mientras tanto; vuelva a intentarlo."]}})
+        OperacionesEmitidas.objects.bulk_create(operaciones, batch_size=TAMAÑO_LOTE)
+
+        anotar_modificaciones(SolicitudesDePago, anteriores, {pk: {"estado": "Emitido"} for pk in anteriores})
+        anotar_altas(operaciones)
+        invalidar(SolicitudesDePago, OperacionesEmitidas)
+    return operaciones
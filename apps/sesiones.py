@@ -0,0 +1,54 @@
+"""
+Sesiones y usuario de cada petición sin consultas a la base de datos.
+
+Las sesiones se leen de la caché y se guardan también en ``django_session``
+(``SESSION_ENGINE = cached_db``), de modo que cargar la sesión no compite por
+el fichero SQLite con quienes están guardando. ``BackendCacheado`` guarda en
+la caché el usuario de la sesión con sus permisos y sus empresas ya cargados
+(se consultan en cada página); se invalida al guardar o borrar el usuario o un
+grupo y al cambiar sus grupos o permisos.
+"""
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import Group
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+from .cache_etiquetas import cacheado, clave_versionada, etiqueta, invalidar
+from .empresas import empresas_de
+
+
+class BackendCacheado(ModelBackend):
+    def get_user(self, user_id):
+        def cargar():
+            usuario = super(BackendCacheado, self).get_user(user_id)
+            if usuario is not None:
+                # Quedan en _perm_cache, _user_perm_cache y _group_perm_cache
+                usuario.get_all_permissions()
+                empresas_de(usuario)
+            return usuario
+
+        return cacheado(f"comun:usuario:{user_id}", {etiqueta(get_user_model())}, cargar)
+
+
+def clave_permisos(request):
+    """Procesador de contexto: ``clave_permisos`` cambia al cambiar los permisos del usuario.
+
+    Para variar con ella los fragmentos de plantilla cacheados; se calcula solo
+    si la plantilla la usa.
+    """
+    return {
+        "clave_permisos": lambda: clave_versionada(f"usuario:{request.user.pk}", {etiqueta(get_user_model())})
+    }
+
+
+def _invalidar_usuarios(sender, using=None, **kwargs):
+    invalidar(get_user_model(), using=using)
+
+
+def conectar():
+    usuario = get_user_model()
+    for modelo in (usuario, Group):
+        post_save.connect(_invalidar_usuarios, sender=modelo, dispatch_uid=f"sesiones_{modelo.__name__}_guardar")
+        post_delete.connect(_invalidar_usuarios, sender=modelo, dispatch_uid=f"sesiones_{modelo.__name__}_borrar")
+    for relacion in (usuario.groups.through, usuario.user_permissions.through, Group.permissions.through):
+        m2m_changed.connect(_invalidar_usuarios, sender=relacion, dispatch_uid=f"sesiones_{relacion.__name__}")
@@ -0,0 +1,217 @@
+"""
+Cola de tareas en segundo plano respaldada por la base de datos.
+
+Las tareas se encolan con ``encolar`` y las ejecuta el comando
+``python manage.py procesar_tareas``. No hace falta ningún broker externo:
+la reclamación de una tarea es un UPDATE condicional sobre su fila, que en
+SQLite se ejecuta con el bloqueo de escritura tomado, de modo que dos
+trabajadores nunca reclaman la misma tarea.
+"""
+import io
+import logging
+import os
+import socket
+import time
+import traceback
+from datetime import timedelta
+
+from django.core.files.base import ContentFile
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import informes
+from .auditoria import como_usuario, insertar_registros
+from .models import SolicitudesDePago, Tarea
+
+logger = logging.getLogger(__name__)
+
+# Tiempo que un trabajador retiene una tarea sin reportar progreso. Pasado
+# ese plazo se asume que el proceso murió y la tarea vuelve a la cola.
+DURACION_BLOQUEO = timedelta(minutes=10)
+
+# Espera base entre reintentos; se duplica en cada intento fallido.
+ESPERA_REINTENTO = timedelta(seconds=30)
+
+# Intervalo mínimo entre escrituras de progreso en la base de datos.
+INTERVALO_PROGRESO = 1.0
+
+_TIPOS = {}
+
+
+def registrar_tarea(nombre):
+    """Decorador que registra una función como tipo de tarea.
+
+    La función recibe la instancia de ``Tarea`` y puede devolver un
+    ``ContentFile`` con nombre, que se guarda como resultado descargable.
+    """
+    def decorador(funcion):
+        _TIPOS[nombre] = funcion
+        return funcion
+    return decorador
+
+
+def tipos_registrados():
+    return sorted(_TIPOS)
+
+
+def encolar(tipo, usuario=None, max_intentos=3, **parametros):
+    if tipo not in _TIPOS:
+        raise ValueError(f"No existe ninguna tarea registrada con el nombre '{tipo}'.")
+    return Tarea.objects.create(
+        tipo=tipo,
+        parametros=parametros,
+        creado_por=usuario if usuario and usuario.is_authenticated else None,
+        max_intentos=max_intentos,
+    )
+
+
+def nombre_trabajador():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _disponibles(ahora):
+    return Q(estado="Pendiente", disponible_desde__lte=ahora) | Q(
+        estado="En curso", bloqueada_hasta__lt=ahora, intentos__lt=F("max_intentos")
+    )
+
+
+def reclamar_tarea(trabajador):
+    ahora = timezone.now()
+
+    # Tareas abandonadas por un trabajador caído que ya agotaron sus intentos
+    Tarea.objects.filter(
+        estado="En curso", bloqueada_hasta__lt=ahora, intentos__gte=F("max_intentos")
+    ).update(
+        estado="Fallida",
+        fecha_fin=ahora,
+        error="El trabajador dejó de responder y se agotaron los intentos.",
+    )
+
+    candidatas = list(
+        Tarea.objects.filter(_disponibles(ahora))
+        .order_by("disponible_desde", "pk")
+        .values_list("pk", flat=True)[:10]
+    )
+    for pk in candidatas:
+        # El UPDATE vuelve a comprobar la condición: si otro trabajador la
+        # reclamó primero, no se actualiza ninguna fila y se prueba la siguiente.
+        reclamadas = Tarea.objects.filter(_disponibles(ahora), pk=pk).update(
+            estado="En curso",
+            trabajador=trabajador,
+            bloqueada_hasta=ahora + DURACION_BLOQUEO,
+            fecha_inicio=ahora,
+            intentos=F("intentos") + 1,
+            error=None,
+        )
+        if reclamadas:
+            return Tarea.objects.get(pk=pk)
+    return None
+
+
+class Progreso:
+    """Reporta el avance de una tarea y renueva su bloqueo."""
+
+    def __init__(self, tarea):
+        self.tarea = tarea
+        self._ultimo = 0.0
+
+    def __call__(self, actual, total=None, mensaje=None, forzar=False):
+        ahora = time.monotonic()
+        if not forzar and ahora - self._ultimo < INTERVALO_PROGRESO:
+            return
+        self._ultimo = ahora
+        cambios = {
+            "progreso": actual,
+            "bloqueada_hasta": timezone.now() + DURACION_BLOQUEO,
+        }
+        if total is not None:
+            cambios["total"] = total
+        if mensaje is not None:
+            cambios["mensaje"] = mensaje[:255]
+        Tarea.objects.filter(pk=self.tarea.pk, trabajador=self.tarea.trabajador).update(**cambios)
+
+
+def _propia(tarea):
+    # Si el bloqueo caducó y otro trabajador la reclamó, esta ejecución ya no la escribe
+    return Tarea.objects.filter(pk=tarea.pk, trabajador=tarea.trabajador, estado="En curso")
+
+
+def ejecutar_tarea(tarea):
+    funcion = _TIPOS.get(tarea.tipo)
+    try:
+        if funcion is None:
+            raise ValueError(f"No existe ninguna tarea registrada con el nombre '{tarea.tipo}'.")
+        tarea.reportar_progreso = Progreso(tarea)
+        with como_usuario(tarea.creado_por):
+            archivo = funcion(tarea)
+    except Exception:
+        logger.exception("Falló la tarea %s", tarea)
+        error = traceback.format_exc()
+        if funcion is not None and tarea.intentos < tarea.max_intentos:
+            espera = ESPERA_REINTENTO * (2 ** (tarea.intentos - 1))
+            _propia(tarea).update(
+                estado="Pendiente",
+                disponible_desde=timezone.now() + espera,
+                bloqueada_hasta=None,
+                trabajador="",
+                error=error,
+            )
+        else:
+            _propia(tarea).update(
+                estado="Fallida",
+                bloqueada_hasta=None,
+                fecha_fin=timezone.now(),
+                error=error,
+            )
+        return False
+
+    if not _propia(tarea).exists():
+        logger.warning("La tarea %s la reclamó otro trabajador; se descarta el resultado", tarea)
+        return False
+    if archivo is not None:
+        tarea.resultado.save(archivo.name, archivo, save=False)
+    completada = _propia(tarea).update(
+        estado="Completada",
+        resultado=tarea.resultado.name if archivo is not None else None,
+        progreso=F("total"),
+        bloqueada_hasta=None,
+        fecha_fin=timezone.now(),
+    )
+    if not completada:
+        # La reclamaron mientras se guardaba el fichero
+        if archivo is not None:
+            tarea.resultado.delete(save=False)
+        return False
+    return True
+
+
+@registrar_tarea("recalcular_importes")
+def recalcular_importes(tarea):
+    ids = tarea.parametros.get("ids")
+    solicitudes = SolicitudesDePago.objects.all()
+    if ids:
+        solicitudes = solicitudes.filter(pk__in=ids)
+    total = solicitudes.count()
+    tarea.reportar_progreso(0, total=total, forzar=True)
+    for i, solicitud in enumerate(solicitudes.iterator(chunk_size=500), start=1):
+        importe, _ = solicitud.calcular_importe_total()
+        if importe != solicitud.importe_total:
+            solicitud.importe_total = importe
+            solicitud.save(update_fields=["importe_total", "importe_inversiones"])
+        tarea.reportar_progreso(i)
+    return None
+
+
+@registrar_tarea("registrar_auditoria")
+def registrar_auditoria(tarea):
+    insertar_registros(tarea.parametros["registros"], tarea.parametros.get("base"))
+    return None
+
+
+@registrar_tarea("registro_h90")
+def registro_h90(tarea):
+    año = int(tarea.parametros["año"])
+    salida = io.BytesIO()
+    cantidad = informes.registro_h90(año, salida, progreso=tarea.reportar_progreso)
+    tarea.reportar_progreso(cantidad, total=cantidad, forzar=True)
+    return ContentFile(salida.getvalue(), name=f"registro_h90_{año}.xlsx")
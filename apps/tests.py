@@ -1,3 +1,472 @@
-from django.test import TestCase
+import tempfile
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.contrib import admin
+from django.contrib.auth.models import Group, Permission, User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db.models import Model
+from django.test import Client, TestCase, override_settings
+from django.utils import timezone
+from django.urls import reverse
+
+from .archivo import cerrar_ejercicio
+from .banco import ErrorLote, LARGO_REGISTRO, lineas_lote, reservar_lote
+from .cache_etiquetas import _cambiar_versiones, etiqueta
+from .empresas import grupo_empresa
+from .models import (
+    Proveedores, SolicitudesDePago, ConceptoNormal, ConceptoSalario, OperacionesEmitidas,
+    Ingreso, ServicioBancario, AjusteInversiones, TokenAPI, Tarea,
+)
+from .nomina import ErrorImportacion, importar_nomina
+from .servicios import ErroresLote, validar_lote
+from .tareas import encolar, ejecutar_tarea, reclamar_tarea
+
+
+def crear_datos():
+    proveedor = Proveedores.objects.create(
+        ident_del_prov="Proveedor", tit_de_la_cuenta="Titular", abrev_del_tit="T",
+        codigo="001", cuenta_banc="1234567890123456", direccion="Calle 1",
+    )
+    normal = SolicitudesDePago.objects.create(
+        fecha_del_modelo=date(2025, 1, 10), forma_de_pago="Transferencia", cuenta_de_empresa="CUP",
+        identificador_del_proveedor=proveedor, descripcion="Detalle", importe_total=100,
+    )
+    ConceptoNormal.objects.create(solicitud=normal, concepto="Factura", numero="F-1", importe=100)
+    salario = SolicitudesDePago.objects.create(
+        fecha_del_modelo=date(2025, 1, 11), forma_de_pago="Cheque", cuenta_de_empresa="CUP",
+        identificador_del_proveedor=proveedor, importe_total=50,
+    )
+    ConceptoSalario.objects.create(solicitud=salario, concepto="Salario", importe=50)
+    for solicitud in (normal, salario):
+        OperacionesEmitidas.objects.create(
+            solicitud=solicitud, numero_operacion=f"H90-{solicitud.numero_de_H90}", importe_emitido=1,
+            numero_serie="0000001", fecha_inicial=date(2025, 1, 12), observaciones="Nota",
+        )
+    Ingreso.objects.create(cuenta_de_empresa="CUP", tipo_ingreso="Venta", importe=10, concepto="Venta")
+    ServicioBancario.objects.create(cuenta_de_empresa="CUP", importe=5, clave="Otro", descripcion="Otro")
+    AjusteInversiones.objects.create(cuenta_de_empresa="CUP", importe=-5, clave="Otro", descripcion="Otro")
+
+
+# La caché de ficheros sobrevive a la base de datos de pruebas, y dentro de
+# un TestCase las versiones no cambian porque nunca se confirma la transacción
+CACHE_PRUEBAS = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+@override_settings(CACHES=CACHE_PRUEBAS)
+class ProyeccionListadosTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_superuser("admin", "admin@example.com", "clave")
+        crear_datos()
+
+    def setUp(self):
+        # El usuario cacheado de otra clase de pruebas tendría el mismo pk
+        cache.clear()
+        self.client.force_login(self.usuario)
+
+    def test_listados_no_cargan_campos_diferidos(self):
+        def carga_diferida(instancia, using=None, fields=None, **kwargs):
+            raise AssertionError(
+                f"El listado cargó campos diferidos {fields} de {type(instancia).__name__}; "
+                f"añádalos a list_only."
+            )
+
+        for modelo, model_admin in admin.site._registry.items():
+            # Los admins del archivo heredan list_only de los admins principales
+            if not getattr(model_admin, "list_only", None) or getattr(modelo, "en_archivo", False):
+                continue
+            url = reverse(f"admin:{modelo._meta.app_label}_{modelo._meta.model_name}_changelist")
+            with self.subTest(modelo=modelo.__name__), mock.patch.object(Model, "refresh_from_db", carga_diferida):
+                respuesta = self.client.get(url)
+                self.assertEqual(respuesta.status_code, 200)
+                self.assertTrue(respuesta.context["cl"].result_list)
+
+
+@override_settings(CACHES=CACHE_PRUEBAS)
+class RegistroH90Tests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_superuser("admin", "admin@example.com", "clave")
+        crear_datos()
+
+    def setUp(self):
+        # El usuario cacheado de otra clase de pruebas tendría el mismo pk
+        cache.clear()
+        self.client = Client(enforce_csrf_checks=True)
+        self.client.force_login(self.usuario)
+
+    def test_solo_se_encola_desde_el_formulario(self):
+        listado = self.client.get(reverse("admin:apps_solicitudesdepago_changelist"), {"año": "2025"})
+        url = listado.context["registro_h90_url"]
+        self.assertEqual(self.client.get(url).status_code, 405)
+        self.assertEqual(self.client.post(url).status_code, 403)
+        self.assertFalse(Tarea.objects.exists())
+
+        respuesta = self.client.post(url, {"csrfmiddlewaretoken": listado.context["csrf_token"]})
+        self.assertEqual(respuesta.status_code, 302)
+        self.assertEqual(Tarea.objects.get().parametros, {"año": 2025})
+
+
+@override_settings(CACHES=CACHE_PRUEBAS)
+class IndiceAdminTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.usuario = User.objects.create_user("cajero", is_staff=True)
+        self.permiso = Permission.objects.get(codename="view_solicitudesdepago")
+        self.usuario.user_permissions.add(self.permiso)
+        self.client.force_login(self.usuario)
+
+    def test_indice_cacheado_sigue_los_permisos(self):
+        listado = reverse("admin:apps_solicitudesdepago_changelist")
+        self.assertContains(self.client.get(reverse("admin:index")), listado)
+
+        self.usuario.user_permissions.remove(self.permiso)
+        # Lo que hace la invalidación al confirmarse, que en un TestCase no llega
+        _cambiar_versiones({etiqueta(User)})
+        self.assertNotContains(self.client.get(reverse("admin:index")), listado)
+
+
+@override_settings(CACHES=CACHE_PRUEBAS)
+class BusquedaSolicitudesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_superuser("admin", "admin@example.com", "clave")
+        crear_datos()
+        cls.solicitud = SolicitudesDePago.objects.get(forma_de_pago="Transferencia")
+
+    def setUp(self):
+        # El usuario cacheado de otra clase de pruebas tendría el mismo pk
+        cache.clear()
+        self.client.force_login(self.usuario)
+
+    def test_busqueda_exacta_de_operacion_requiere_permiso(self):
+        url = reverse("admin:apps_operacionesemitidas_changelist")
+        operacion = OperacionesEmitidas.objects.get(solicitud=self.solicitud)
+        OperacionesEmitidas.objects.filter(pk=operacion.pk).update(numero_operacion="OP-77")
+        operacion.refresh_from_db()
+        respuesta = self.client.get(url, {"q": operacion.numero_operacion})
+        self.assertRedirects(respuesta, reverse("admin:apps_operacionesemitidas_change", args=[operacion.pk]))
+
+        cajero = User.objects.create_user("cajero", is_staff=True)
+        self.client.force_login(cajero)
+        self.assertEqual(self.client.get(url, {"q": operacion.numero_operacion}).status_code, 403)
+
+    def buscar(self, texto):
+        respuesta = self.client.get(reverse("admin:apps_solicitudesdepago_changelist"), {"q": texto})
+        self.assertEqual(respuesta.status_code, 200)
+        return [s.pk for s in respuesta.context["cl"].result_list]
+
+    def test_encuentra_concepto_guardado_desde_el_inline(self):
+        solicitud = self.solicitud
+        concepto = solicitud.conceptos_normales.get()
+        datos = {
+            "fecha_del_modelo": solicitud.fecha_del_modelo.isoformat(),
+            "forma_de_pago": solicitud.forma_de_pago,
+            "cuenta_de_empresa": solicitud.cuenta_de_empresa,
+            "identificador_del_proveedor": solicitud.identificador_del_proveedor_id,
+            "numero_de_H90": solicitud.numero_de_H90,
+            "descripcion": solicitud.descripcion,
+            "estado": solicitud.estado,
+            "conceptos_normales-TOTAL_FORMS": 1,
+            "conceptos_normales-INITIAL_FORMS": 1,
+            "conceptos_normales-0-id": concepto.pk,
+            "conceptos_normales-0-solicitud": solicitud.pk,
+            "conceptos_normales-0-concepto": concepto.concepto,
+            "conceptos_normales-0-numero": "00457",
+            "conceptos_normales-0-importe": "100.00",
+            "conceptos_salarios-TOTAL_FORMS": 0,
+            "conceptos_salarios-INITIAL_FORMS": 0,
+            "_save": "Guardar",
+        }
+        respuesta = self.client.post(reverse("admin:apps_solicitudesdepago_change", args=[solicitud.pk]), datos)
+        self.assertEqual(respuesta.status_code, 302)
+
+        self.assertEqual(self.buscar("Factura 00457"), [solicitud.pk])
+        self.assertEqual(self.buscar("00458"), [])
+
+
+@override_settings(CACHES=CACHE_PRUEBAS, EMPRESAS={"filial": "Filial"})
+class EmpresasTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user("cajero", password="clave", is_staff=True)
+
+    def setUp(self):
+        # El usuario cacheado de otra clase de pruebas tendría el mismo pk
+        cache.clear()
+        self.client.force_login(self.usuario)
+
+    def elegir(self, clave):
+        return self.client.post(reverse("seleccionar_empresa"), {"empresa": clave})
+
+    def test_solo_elige_empresas_de_sus_grupos(self):
+        self.assertEqual(self.elegir("filial").status_code, 403)
+        self.assertNotContains(self.client.get(reverse("seleccionar_empresa")), 'value="filial"')
+
+        self.usuario.groups.add(Group.objects.create(name=grupo_empresa("filial")))
+        # La invalidación del usuario cacheado espera a que se confirme la transacción
+        cache.clear()
+        self.assertEqual(self.elegir("filial").status_code, 302)
+        self.assertEqual(self.client.session["empresa"], "filial")
+
+    def test_estaticos_sin_sesion(self):
+        respuesta = self.client.get("/static/admin/css/base.css")
+        self.assertNotIn("Cookie", respuesta.get("Vary", ""))
+
+
+@override_settings(CACHES=CACHE_PRUEBAS)
+class ApiSolicitudesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        usuario = User.objects.create_superuser("admin", "admin@example.com", "clave")
+        cls.token = TokenAPI.objects.create(usuario=usuario, nombre="Nómina")
+        crear_datos()
+
+    def listar(self, **filtros):
+        return self.client.get(
+            reverse("api:solicitudes"), filtros, HTTP_AUTHORIZATION=f"Token {self.token.clave}"
+        )
+
+    def test_filtros_no_validos(self):
+        for filtros in ({"año": "abc"}, {"estado": "Pagado"}, {"forma_de_pago": "Efectivo"}):
+            with self.subTest(**filtros):
+                self.assertEqual(self.listar(**filtros).status_code, 400)
+        respuesta = self.listar(año="2025", forma_de_pago="Cheque")
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(len(respuesta.json()["resultados"]), 1)
+
+    def test_errores_antes_del_304(self):
+        usuario = User.objects.create_user("nomina")
+        usuario.user_permissions.add(Permission.objects.get(codename="view_solicitudesdepago"))
+        token = TokenAPI.objects.create(usuario=usuario, nombre="Nómina")
+        cabecera = {"HTTP_AUTHORIZATION": f"Token {token.clave}"}
+        respuesta = self.client.get(reverse("api:solicitudes"), **cabecera)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotIn("Last-Modified", respuesta)
+
+        usuario.user_permissions.clear()
+        respuesta = self.client.get(reverse("api:solicitudes"), HTTP_IF_NONE_MATCH=respuesta["ETag"], **cabecera)
+        self.assertEqual(respuesta.status_code, 403)
+        respuesta = self.client.get(
+            reverse("api:solicitudes"), {"forma_de_pago": "zzz"}, HTTP_AUTHORIZATION=f"Token {self.token.clave}",
+            HTTP_IF_MODIFIED_SINCE="Fri, 01 Jan 2100 00:00:00 GMT",
+        )
+        self.assertEqual(respuesta.status_code, 400)
+
+    def test_inversiones_solo_booleanas(self):
+        fila = {
+            "fecha_del_modelo": "2025-02-01", "forma_de_pago": "Cheque", "cuenta_de_empresa": "CUP",
+            "identificador_del_proveedor": Proveedores.objects.get().pk,
+            "conceptos_normales": [{"concepto": "Factura", "numero": "F-2", "importe": "10"}],
+        }
+        [(solicitud, _, _)] = validar_lote([{**fila, "inversiones": "false"}])
+        self.assertFalse(solicitud.inversiones)
+        with self.assertRaises(ErroresLote) as contexto:
+            validar_lote([{**fila, "inversiones": "no"}])
+        self.assertIn("inversiones", contexto.exception.errores[0])
+
+    def test_tipos_no_validos_son_errores_de_la_fila(self):
+        fila = {
+            "fecha_del_modelo": "2025-02-01", "forma_de_pago": "Cheque", "cuenta_de_empresa": "CUP",
+            "conceptos_normales": [{"concepto": "Factura", "numero": "F-2", "importe": "10"}],
+        }
+        with self.assertRaises(ErroresLote) as contexto:
+            validar_lote([
+                {**fila, "conceptos_normales": ["x"]},
+                {**fila, "conceptos_normales": "abc"},
+                {**fila, "fecha_del_modelo": 20260105},
+                {**fila, "conceptos_normales": [{"concepto": ["Factura"], "importe": "10"}]},
+            ])
+        errores = contexto.exception.errores
+        self.assertIn("0", errores[0]["conceptos_normales"])
+        self.assertEqual(errores[1]["conceptos_normales"], ["Debe ser una lista de conceptos."])
+        self.assertEqual(errores[2]["fecha_del_modelo"], ["Tipo de dato no válido."])
+        self.assertIn("concepto", errores[3]["conceptos_normales"]["0"])
+
+        respuesta = self.client.post(
+            reverse("api:solicitudes"), {"solicitudes": [{**fila, "conceptos_normales": ["x"]}]},
+            content_type="application/json", HTTP_AUTHORIZATION=f"Token {self.token.clave}",
+        )
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertIn("conceptos_normales", respuesta.json()["errores"]["0"])
+
+
+class LoteBancoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        crear_datos()
+        solicitud = SolicitudesDePago.objects.get(forma_de_pago="Transferencia")
+        OperacionesEmitidas.objects.create(
+            solicitud=solicitud, numero_operacion="H90-2", importe_emitido="2.50",
+            numero_serie="0000002", fecha_inicial=date(2025, 1, 13),
+        )
+        OperacionesEmitidas.objects.update(estado="Tránsito")
+        cls.ids = list(OperacionesEmitidas.objects.values_list("pk", flat=True))
+
+    def test_fichero_de_ancho_fijo(self):
+        lote, cantidad = reservar_lote(self.ids)
+        # La operación de la solicitud por cheque no va en el lote
+        self.assertEqual(cantidad, 2)
+        lineas = list(lineas_lote(lote))
+        self.assertEqual([linea[0] for linea in lineas], ["C", "D", "D", "T"])
+        for linea in lineas:
+            self.assertTrue(linea.endswith("\r\n"))
+            self.assertEqual(len(linea) - 2, LARGO_REGISTRO)
+        self.assertEqual(lineas[1][7:27], "00001234567890123456")
+        self.assertEqual(lineas[1][27:42], f"{100:015d}")
+        self.assertEqual(lineas[2][27:42], f"{250:015d}")
+        control = lineas[-1][1:45]
+        self.assertEqual(control, f"{2:06d}{350:018d}{2 * 1234567890123456:020d}")
+
+        filas_csv = list(lineas_lote(lote, "csv"))
+        self.assertEqual(filas_csv[-1].rstrip().split(";"), ["TOTAL", "CUP", "2", "", "", "", "3.50", str(2 * 1234567890123456)])
+
+    def test_no_exporta_dos_veces(self):
+        lote, _ = reservar_lote(self.ids)
+        with self.assertRaises(ErrorLote):
+            reservar_lote(self.ids)
+        nueva = OperacionesEmitidas.objects.create(
+            solicitud=SolicitudesDePago.objects.get(forma_de_pago="Transferencia"), numero_operacion="H90-3",
+            importe_emitido=1, numero_serie="0000003", fecha_inicial=date(2025, 1, 14), estado="Tránsito",
+        )
+        # Mismo segundo y mismo sufijo aleatorio que el lote anterior
+        with mock.patch("apps.banco.timezone.localtime", return_value=datetime.strptime(lote[:14], "%Y%m%d%H%M%S")), \
+                mock.patch("apps.banco.secrets.token_hex", side_effect=[lote[-4:].lower(), "ef01"]):
+            otro, cantidad = reservar_lote([*self.ids, nueva.pk])
+        self.assertEqual(otro, f"{lote[:14]}-EF01")
+        self.assertEqual(cantidad, 1)
+        self.assertEqual(OperacionesEmitidas.objects.filter(lote_banco=lote).count(), 2)
+
+
+class ColaTareasTests(TestCase):
+    def setUp(self):
+        self.tarea = encolar("recalcular_importes")
+
+    def caducar_bloqueo(self):
+        Tarea.objects.filter(pk=self.tarea.pk).update(bloqueada_hasta=timezone.now() - timedelta(seconds=1))
+
+    def test_un_solo_trabajador_reclama_la_tarea(self):
+        reclamada = reclamar_tarea("a")
+        self.assertEqual((reclamada.pk, reclamada.trabajador, reclamada.intentos), (self.tarea.pk, "a", 1))
+        self.assertIsNone(reclamar_tarea("b"))
+
+        # Con el bloqueo caducado la reclama otro trabajador, como un nuevo intento
+        self.caducar_bloqueo()
+        otra = reclamar_tarea("b")
+        self.assertEqual((otra.pk, otra.trabajador, otra.intentos), (self.tarea.pk, "b", 2))
+
+    def test_trabajador_sin_bloqueo_no_pisa_al_nuevo(self):
+        antigua = reclamar_tarea("a")
+        self.caducar_bloqueo()
+        reclamar_tarea("b")
+
+        with self.assertLogs("apps.tareas", "WARNING"):
+            self.assertFalse(ejecutar_tarea(antigua))
+        tarea = Tarea.objects.get(pk=self.tarea.pk)
+        self.assertEqual((tarea.estado, tarea.trabajador), ("En curso", "b"))
+
+        with mock.patch.dict("apps.tareas._TIPOS", {"recalcular_importes": mock.Mock(side_effect=ValueError)}), \
+                self.assertLogs("apps.tareas", "ERROR"):
+            self.assertFalse(ejecutar_tarea(antigua))
+        tarea.refresh_from_db()
+        self.assertEqual((tarea.estado, tarea.trabajador, tarea.error), ("En curso", "b", None))
+
+    def test_agota_los_intentos_si_el_trabajador_no_responde(self):
+        Tarea.objects.filter(pk=self.tarea.pk).update(max_intentos=1)
+        reclamar_tarea("a")
+        self.caducar_bloqueo()
+        self.assertIsNone(reclamar_tarea("b"))
+        self.assertEqual(Tarea.objects.get(pk=self.tarea.pk).estado, "Fallida")
+
+    def test_completa_la_tarea_reclamada(self):
+        tarea = reclamar_tarea("a")
+        self.assertTrue(ejecutar_tarea(tarea))
+        self.assertEqual(Tarea.objects.get(pk=self.tarea.pk).estado, "Completada")
+
+
+class ImportacionNominaTests(TestCase):
+    def importar(self, contenido, simular=False):
+        with tempfile.TemporaryDirectory() as directorio:
+            ruta = Path(directorio) / "nomina.csv"
+            ruta.write_bytes(contenido)
+            return importar_nomina(ruta, simular=simular)
+
+    def test_una_fila_mala_no_importa_nada(self):
+        contenido = "fecha;cuenta;concepto;importe\n10/01/2025;CUP;Salario;100\n11/01/2025;CUP;Salario;cien\n"
+        with self.assertRaises(ErrorImportacion) as contexto:
+            self.importar(contenido.encode())
+        self.assertEqual(list(contexto.exception.errores), [3])
+        self.assertFalse(SolicitudesDePago.objects.exists())
+
+        creadas = self.importar(contenido.replace("cien", "200").encode())
+        self.assertEqual(len(creadas), 2)
+        self.assertEqual(SolicitudesDePago.objects.count(), 2)
+
+    def test_csv_de_excel_en_windows_1252(self):
+        contenido = "fecha;cuenta;concepto;importe;descripcion\n10/01/2025;CUP;Salario;100;Nómina de enero\n"
+        [solicitud] = self.importar(contenido.encode("cp1252"), simular=True)
+        self.assertEqual(solicitud.descripcion, "Nómina de enero")
+
+    def test_ficheros_ilegibles_son_errores_de_importacion(self):
+        for contenido in ("fecha\n10/01/2025\n".encode(), b"fecha;cuenta\n\x81\x8d\n"):
+            with self.subTest(contenido=contenido), self.assertRaises(ErrorImportacion) as contexto:
+                self.importar(contenido)
+            self.assertEqual(list(contexto.exception.errores), [1])
+
+
+@override_settings(CACHES=CACHE_PRUEBAS)
+class CierreEjercicioTests(TestCase):
+    databases = {"default", "archivo"}
+
+    def setUp(self):
+        cache.clear()
+        crear_datos()
+        SolicitudesDePago.objects.update(estado="Emitido")
+        OperacionesEmitidas.objects.update(estado="Debitado")
+        Ingreso.objects.update(fecha=date(2025, 1, 15))
+
+    def cerrar(self):
+        resumen = cerrar_ejercicio(2025)
+        # La lista de ejercicios cerrados se invalida al confirmar, que en un TestCase no llega
+        cache.clear()
+        return resumen
+
+    def test_traslada_el_año_al_archivo(self):
+        cantidades = {
+            modelo: modelo.objects.count()
+            for modelo in (SolicitudesDePago, ConceptoNormal, ConceptoSalario, OperacionesEmitidas, Ingreso)
+        }
+        self.cerrar()
+        for modelo, cantidad in cantidades.items():
+            with self.subTest(modelo=modelo.__name__):
+                self.assertEqual(modelo.objects.using("archivo").count(), cantidad)
+                self.assertFalse(modelo.objects.using("default").exists())
+        # Los proveedores se copian pero se conservan
+        self.assertTrue(Proveedores.objects.using("default").exists())
+
+        self.assertEqual(SolicitudesDePago.siguiente_numero_h90("Transferencia", "CUP", 2025), 2)
+        nueva = SolicitudesDePago(
+            fecha_del_modelo=date(2025, 6, 1), forma_de_pago="Transferencia", cuenta_de_empresa="CUP",
+        )
+        with self.assertRaises(ValidationError) as contexto:
+            nueva.clean()
+        self.assertIn("fecha_del_modelo", contexto.exception.message_dict)
+
+    def test_repetir_el_cierre_no_duplica(self):
+        # Un cierre interrumpido tras copiar al archivo y antes de borrar del principal
+        with mock.patch("apps.archivo._borrar", side_effect=RuntimeError), self.assertRaises(RuntimeError):
+            cerrar_ejercicio(2025)
+        self.assertEqual(SolicitudesDePago.objects.using("archivo").count(), 2)
+        self.assertEqual(SolicitudesDePago.objects.using("default").count(), 2)
+
+        resumen = self.cerrar()
+        self.assertEqual(resumen["solicitudesdepago"], 2)
+        self.assertEqual(SolicitudesDePago.objects.using("archivo").count(), 2)
+        self.assertFalse(SolicitudesDePago.objects.using("default").exists())
+
+        with self.assertRaisesMessage(ValueError, "ya está cerrado"):
+            cerrar_ejercicio(2025)
+        self.assertEqual(SolicitudesDePago.objects.using("archivo").count(), 2)
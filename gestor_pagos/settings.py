@@ -32,6 +32,15 @@ JAZZMIN_SETTINGS = {
         "apps.Ingreso",
         "apps.ServicioBancario",
         "apps.AjusteInversiones",
+        "apps.Tarea",
+        "apps.TokenAPI",
+        "apps.EjercicioCerrado",
+        "apps.RegistroAuditoria",
+        "apps.SolicitudArchivada",
+        "apps.OperacionArchivada",
+        "apps.IngresoArchivado",
+        "apps.ServicioBancarioArchivado",
+        "apps.AjusteInversionesArchivado",
     ],
     "navigation_expanded": True,
     "icons": {
@@ -41,6 +50,15 @@ JAZZMIN_SETTINGS = {
         "apps.Ingreso": "fas fa-hand-holding-usd",
         "apps.ServicioBancario": "fas fa-university",
         "apps.AjusteInversiones": "fas fa-chart-line",
+        "apps.Tarea": "fas fa-tasks",
+        "apps.TokenAPI": "fas fa-key",
+        "apps.EjercicioCerrado": "fas fa-archive",
+        "apps.RegistroAuditoria": "fas fa-clipboard-list",
+        "apps.SolicitudArchivada": "fas fa-file-invoice",
+        "apps.OperacionArchivada": "fas fa-exchange-alt",
+        "apps.IngresoArchivado": "fas fa-hand-holding-usd",
+        "apps.ServicioBancarioArchivado": "fas fa-university",
+        "apps.AjusteInversionesArchivado": "fas fa-chart-line",
     },
     "custom_links": {
         "apps": [
@@ -69,14 +87,21 @@ JAZZMIN_SETTINGS = {
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'apps.respuestas.MiddlewareCompresion',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'apps.empresas.MiddlewareEmpresa',
+    'apps.auditoria.MiddlewareAuditoria',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'apps.respuestas.MiddlewareRevalidacion',
 ]
 
+# Las respuestas de texto más pequeñas se envían sin comprimir
+COMPRESION_TAMAÑO_MINIMO = 1024
+
 ROOT_URLCONF = 'gestor_pagos.urls'
 
 TEMPLATES = [
@@ -90,6 +115,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'apps.sesiones.clave_permisos',
             ],
         },
     },
@@ -101,8 +127,42 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        # Espera por el bloqueo de escritura en lugar de fallar con
+        # "database is locked" cuando el trabajador de tareas está escribiendo.
+        'OPTIONS': {'timeout': 20},
+    },
+    # Ejercicios cerrados (python manage.py cerrar_ejercicio <año>)
+    'archivo': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'archivo.sqlite3',
+        'OPTIONS': {'timeout': 20},
+    },
+}
+
+# Otras empresas servidas por el mismo despliegue, cada una con sus propias
+# bases (ver apps.empresas): clave -> nombre. La clave es también el
+# subdominio con el que se entra a esa empresa. Los usuarios trabajan en las
+# empresas de cuyo grupo ("Empresa: <clave>", creado al migrar) son miembros.
+NOMBRE_EMPRESA_PRINCIPAL = 'CTE'
+EMPRESAS = {
+    # 'filial': 'Filial',
 }
+for _clave in EMPRESAS:
+    DATABASES[_clave] = {**DATABASES['default'], 'NAME': BASE_DIR / 'empresas' / f'{_clave}.sqlite3'}
+    DATABASES[f'{_clave}_archivo'] = {**DATABASES['archivo'], 'NAME': BASE_DIR / 'empresas' / f'{_clave}_archivo.sqlite3'}
+if EMPRESAS:
+    JAZZMIN_SETTINGS['usermenu_links'] = [
+        {'name': 'Cambiar de empresa', 'url': 'seleccionar_empresa', 'icon': 'fas fa-building'},
+    ]
+
+DATABASE_ROUTERS = ['apps.routers.RouterArchivo', 'apps.routers.RouterEmpresas']
+
+# El usuario de la sesión, con sus permisos, se lee de la caché (apps.sesiones).
+# ModelBackend sigue en la lista para las sesiones iniciadas antes con él.
+AUTHENTICATION_BACKENDS = [
+    'apps.sesiones.BackendCacheado',
+    'django.contrib.auth.backends.ModelBackend',
+]
 
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
@@ -127,6 +187,31 @@ STATIC_URL = 'static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 STATICFILES_DIRS = [BASE_DIR / "apps/static"]
 
+# Resultados de las tareas en segundo plano (se descargan desde el admin)
+MEDIA_URL = 'media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
+# Caché compartida por todos los procesos del servidor (en el mismo equipo).
+# Los valores derivados se invalidan al cambiar los datos: ver apps.cache_etiquetas
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+        'KEY_FUNCTION': 'apps.empresas.clave_cache',
+    }
+}
+
+# Sesiones en la caché, con copia en la base de datos por si se vacía
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+# Copias de seguridad (python manage.py copia_seguridad)
+DIRECTORIO_COPIAS = BASE_DIR / 'copias'
+
+# Los inlines de conceptos envían unos 5 campos por fila; una solicitud con
+# cientos de facturas supera el límite por defecto de 1000.
+DATA_UPLOAD_MAX_NUMBER_FIELDS = 10000
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 LOGIN_REDIRECT_URL = '/admin/'
 
@@ -0,0 +1,54 @@
+"""
+Configuración de producción.
+
+Se usa con ``DJANGO_SETTINGS_MODULE=gestor_pagos.settings_produccion``; el
+resto de la configuración es la de ``settings.py``. Requiere en el entorno
+``DJANGO_SECRET_KEY`` (no la de desarrollo) y ``DJANGO_ALLOWED_HOSTS``
+(nombres separados por comas).
+"""
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .settings import *  # noqa: F401,F403
+from .settings import TEMPLATES
+
+
+def _del_entorno(nombre):
+    valor = os.environ.get(nombre, "").strip()
+    if not valor:
+        raise ImproperlyConfigured(f"Falta la variable de entorno {nombre}.")
+    return valor
+
+
+DEBUG = False
+SECRET_KEY = _del_entorno("DJANGO_SECRET_KEY")
+if SECRET_KEY.startswith("django-insecure-"):
+    raise ImproperlyConfigured("DJANGO_SECRET_KEY no puede ser una clave de desarrollo (django-insecure-).")
+ALLOWED_HOSTS = [nombre.strip() for nombre in _del_entorno("DJANGO_ALLOWED_HOSTS").split(",") if nombre.strip()]
+if "*" in ALLOWED_HOSTS:
+    raise ImproperlyConfigured("DJANGO_ALLOWED_HOSTS debe nombrar los hosts; no se admite '*'.")
+
+# Cada plantilla se lee y compila una sola vez por proceso, sin comprobar si
+# el fichero cambió ni guardar la información de depuración.
+TEMPLATES = [{
+    **TEMPLATES[0],
+    "APP_DIRS": False,
+    "OPTIONS": {
+        **TEMPLATES[0]["OPTIONS"],
+        "debug": False,
+        "loaders": [
+            ("django.template.loaders.cached.Loader", [
+                "django.template.loaders.filesystem.Loader",
+                "django.template.loaders.app_directories.Loader",
+            ]),
+        ],
+    },
+}]
+
+# collectstatic copia los ficheros con huella y sus variantes .gz/.br, que
+# sirve apps.estaticos.servir_estatico con caché de un año.
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "apps.estaticos.ManifestComprimido"},
+}
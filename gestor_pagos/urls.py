@@ -14,11 +14,19 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
-from django.urls import path
+from django.urls import include, path, re_path
 from django.shortcuts import redirect
 
+from apps.empresas import seleccionar_empresa
+from apps.estaticos import servir_estatico
+
 urlpatterns = [
     path('', lambda request: redirect('admin/login/')),  # Redirige al login
+    path('admin/empresa/', admin.site.admin_view(seleccionar_empresa), name='seleccionar_empresa'),
     path('admin/', admin.site.urls),
+    path('api/', include('apps.urls')),
+    # En desarrollo runserver sirve los estáticos antes de llegar aquí
+    re_path(r'^%s(?P<ruta>.+)$' % settings.STATIC_URL.lstrip('/'), servir_estatico),
 ]
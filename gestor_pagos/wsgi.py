@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gestor_pagos.settings')
 
 application = get_wsgi_application()
+
+# Resuelve las URLs y compila las plantillas antes de la primera petición
+from apps.arranque import calentar  # noqa: E402
+
+calentar()